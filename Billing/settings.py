@@ -42,6 +42,7 @@ INSTALLED_APPS = [
     'django.contrib.messages',
     'django.contrib.staticfiles',
     'rest_framework',
+    'shared.apps.SharedConfig',
     'clients.apps.ClientsConfig',
     'services.apps.ServicesConfig',
     'vendors.apps.VendorsConfig',
@@ -160,12 +161,31 @@ MEDIA_ROOT = BASE_DIR / 'media'
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# Shared cache, used to invalidate the cached service filters in all processes
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.environ.get('DJANGO_CACHE_URL', 'redis://localhost:6379/1'),
+    }
+}
+
 # Celery settings
 CELERY_BROKER_URL = 'redis://localhost:6379/0'
 CELERY_RESULT_BACKEND = None
 CELERY_HIJACK_ROOT_LOGGER = False
 CELERY_TASK_IGNORE_RESULT = True
 
+# Fan out month-end processing to Celery subtasks
+PARALLEL_USAGE_CALCULATION = (os.environ.get('PARALLEL_USAGE_CALCULATION', 'false').lower() == 'true')
+PARALLEL_RATING = (os.environ.get('PARALLEL_RATING', 'false').lower() == 'true')
+PARALLEL_REPORTS = (os.environ.get('PARALLEL_REPORTS', 'false').lower() == 'true')
+
+# Number of rows read at a time from vendor input files (0 loads whole files)
+INPUT_FILES_CHUNK_SIZE = int(os.environ.get('INPUT_FILES_CHUNK_SIZE', 0)) or None
+
+# Number of processes reading vendor input files when storing unique users (0 reads them one after another)
+UNIQUE_USERS_WORKERS = int(os.environ.get('UNIQUE_USERS_WORKERS', 0)) or None
+
 # Settings for logging
 LOG_DIR = os.environ.get('DJANGO_LOGS_DIR', os.path.join(BASE_DIR, 'logs'))
 LOGGING = {
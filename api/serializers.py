@@ -262,7 +262,7 @@ class ReportFileSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = ReportFile
-        fields = ['id', 'period', 'report', 'file', 'type_id']
+        fields = ['id', 'period', 'report', 'file', 'details_file', 'type_id']
 
 
 class ReportSerializer(serializers.ModelSerializer):
@@ -15,6 +15,7 @@ from celery_tasks.models import FileProcessingTask
 from clients.models import Client, ClientCountry, Industry
 from contracts.models import Contract, Order, OrderPrice, OrderService, PaymentType, Currency
 from services.models import Service
+from services.modules.cache import bump_filters_generation
 from stats.modules.usage_calculations import recalc_vendor
 from reports.models import ReportFile, Report, ReportSkipColumnConfig, ReportLanguage
 from reports.modules import gen_report_for_client, gen_report_by_id
@@ -147,6 +148,7 @@ def vendor_services_add(request: Request, pk):
             objs = [VendorService(vendor=vendor, service_id=el) for el in ids if el not in list(existing_ids)]
             if objs:
                 VendorService.objects.bulk_create(objs)
+                transaction.on_commit(bump_filters_generation)  # bulk_create does not send post_save
             return redirect('get_vendor_services', pk=pk)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
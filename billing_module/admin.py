@@ -30,15 +30,17 @@ class PrepaidPackageAdmin(admin.ModelAdmin):
 
     def get_queryset(self, request):
         qs = super().get_queryset(request)
-        return qs.select_related('currency')
+        return qs.select_related('currency').with_balances()
 
     def available_balance(self, obj):
         return obj.available_balance
     available_balance.short_description = 'Available Balance'
+    available_balance.admin_order_field = 'annotated_available_balance'
 
     def balance(self, obj):
         return obj.balance
     balance.short_description = 'Balance'
+    balance.admin_order_field = 'annotated_balance'
 
     def value_eur(self, obj):
         return obj.value_eur
@@ -1,5 +1,6 @@
 from enum import Enum
 from django.db import models
+from django.db.models.functions import Coalesce
 from decimal import Decimal
 from month.models import MonthField
 from clients.models import Client
@@ -21,6 +22,33 @@ class PackageStatus(Enum):
     CLOSED = 3
 
 
+class PrepaidPackageQuerySet(models.QuerySet):
+    """
+    QuerySet adding helpers for PrepaidPackage.
+    """
+
+    def with_balances(self):
+        """
+        Annotates each package with its balance and available balance.
+
+        The balances of all packages are calculated with one aggregate query, instead of one query per package
+        and property access. The annotated values are used by the `balance` and `available_balance` properties.
+        """
+
+        zero = models.Value(0, output_field=models.DecimalField(max_digits=10, decimal_places=2))
+        credits = models.Q(charges__is_credit=True)
+        debits = models.Q(charges__is_credit=False)
+        posted = models.Q(charges__charge_status_id=2)
+
+        def total(charges_filter):
+            return Coalesce(models.Sum('charges__charged_units', filter=charges_filter), zero)
+
+        return self.annotate(
+            annotated_available_balance=models.F('original_balance') + total(credits) - total(debits),
+            annotated_balance=models.F('original_balance') + total(credits & posted) - total(debits & posted),
+        )
+
+
 class PrepaidPackage(models.Model):
     """
     Represents a prepaid package in the billing system.
@@ -40,6 +68,8 @@ class PrepaidPackage(models.Model):
         original_rate (DecimalField): The original conversion rate for the package.
         average_rate (DecimalField): The average conversion rate calculated for the package.
         status (IntegerField): The current status of the package, represented by the PackageStatus enum.
+
+    Use `PrepaidPackage.objects.with_balances()` when the balances of many packages are needed.
     """
 
     contract = models.ForeignKey(Contract, on_delete=models.RESTRICT, db_column='contract_id', related_name='packages')
@@ -56,6 +86,10 @@ class PrepaidPackage(models.Model):
         default=PackageStatus.PRE_ACTIVE.value,
     )
 
+    objects = PrepaidPackageQuerySet.as_manager()
+
+    _BALANCE_ANNOTATIONS = ('annotated_available_balance', 'annotated_balance')
+
     @property
     def available_balance(self):
         """
@@ -63,8 +97,12 @@ class PrepaidPackage(models.Model):
 
         This balance is computed by aggregating all charges (credits and debits)
         associated with the package and applying them to the original balance.
+        The value annotated by `with_balances` is used if present.
         """
 
+        if 'annotated_available_balance' in self.__dict__:
+            return self.annotated_available_balance
+
         aggregated_charges = self.charges.aggregate(
             total_credits=models.Sum('charged_units', filter=models.Q(is_credit=True)),
             total_debits=models.Sum('charged_units', filter=models.Q(is_credit=False))
@@ -80,8 +118,12 @@ class PrepaidPackage(models.Model):
         Calculates the current balance of the prepaid package.
 
         Similar to `available_balance`, but only considers posted transactions.
+        The value annotated by `with_balances` is used if present.
         """
 
+        if 'annotated_balance' in self.__dict__:
+            return self.annotated_balance
+
         aggregated_charges = self.charges.filter(charge_status_id=2).aggregate(
             total_credits=models.Sum('charged_units', filter=models.Q(is_credit=True)),
             total_debits=models.Sum('charged_units', filter=models.Q(is_credit=False))
@@ -115,6 +157,15 @@ class PrepaidPackage(models.Model):
         currency_rate = BGN_TO_EUR if self.currency in (1, 3) else 1
         return self.value * currency_rate
 
+    def clear_balances(self) -> None:
+        """
+        Removes the balances annotated by `with_balances`, so they are calculated again on the next access.
+        Should be called after charges of the package are added or changed.
+        """
+
+        for attr in self._BALANCE_ANNOTATIONS:
+            self.__dict__.pop(attr, None)
+
     def save(self, *args, **kwargs):
         if not self.pk:  # Checking if the object is new
             self.average_rate = self.original_rate
@@ -5,12 +5,12 @@ from collections import deque
 from datetime import datetime
 from dateutil.relativedelta import relativedelta
 from typing import List
-from django.db.models import Q
+from django.db.models import Q, Prefetch
 from django.db import transaction
 from .processors import get_transaction_processors
 from .transaction import RatedTransaction
 from .utils import get_last_date_of_period
-from ..models import OrderCharge, PackageStatus
+from ..models import OrderCharge, PackageStatus, PrepaidPackage
 
 import logging
 import re
@@ -42,6 +42,7 @@ class BaseRater:
     """
 
     _SKIP_TRANSACTIONS_CHARGED_TO_USERS = True
+    _TRANSACTIONS_CHUNK_SIZE = 10000
 
     def __init__(self, period: str) -> None:
         """
@@ -166,7 +167,10 @@ class BaseRater:
             (Q(end_date__gte=self.period_start.date()) | Q(end_date__isnull=True)) |
             Q(orderpackages__prepaid_package__status=PackageStatus.ACTIVE.value)
         ).prefetch_related(
-            'orderpackages_set__prepaid_package',
+            Prefetch(
+                'orderpackages_set__prepaid_package',
+                queryset=PrepaidPackage.objects.with_balances()
+            ),
             'orderprice_set',
             'orderservice_set__service'
         ).order_by('start_date', 'order_id').distinct()
@@ -206,7 +210,8 @@ class BaseRater:
         """
         Loads transactions for the client within the rating period.
 
-        Filters transactions by vendor client and timestamp, sorting and preparing them for processing.
+        Filters transactions by vendor client and timestamp and prepares them for processing.
+        Transactions are loaded as tuples of values, sorted by the DB, without creating model instances.
 
         Raises:
             Exception: For any exceptions that occur during the loading of transactions.
@@ -225,15 +230,21 @@ class BaseRater:
             if self._SKIP_TRANSACTIONS_CHARGED_TO_USERS:
                 usage_transactions = usage_transactions.filter(charge_user=False)
 
-            if usage_transactions.exists():
-                vs_list = list(set(os.service for order in self.orders_data for os in order.orderservice_set.all()))
-                transactions_list = list(usage_transactions)
-                transactions_list = sorted(transactions_list, key=lambda x: x.timestamp)
-                for el in transactions_list:
-                    rated_transaction = RatedTransaction(el)
-                    rated_transaction.set_vs(vs_list)
-                    self.unprocessed_transactions.append(rated_transaction)
-            else:
+            # VendorService IDs keyed by (vendor_id, service_id)
+            vs_map = dict()
+            for order in self.orders_data:
+                for order_service in order.orderservice_set.all():
+                    vendor_service = order_service.service
+                    vs_map.setdefault((vendor_service.vendor_id, vendor_service.service_id), vendor_service.id)
+
+            # Load the transactions as tuples, already sorted by the DB
+            values = usage_transactions.values_list(*RatedTransaction.VALUES_FIELDS)
+            for el in values.iterator(chunk_size=self._TRANSACTIONS_CHUNK_SIZE):
+                rated_transaction = RatedTransaction.from_values(el)
+                rated_transaction.set_vs(vs_map)
+                self.unprocessed_transactions.append(rated_transaction)
+
+            if not self.unprocessed_transactions:
                 logger.warning(f'No UsageTransactions to load for client {self.client.pk}')
 
         except Exception as e:
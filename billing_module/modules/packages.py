@@ -116,6 +116,8 @@ def transfer_balance(from_package: PrepaidPackage, to_package: PrepaidPackage, p
             PrepaidPackageCharge.objects.bulk_create(charges)
             to_package.save()
             from_package.save()
+        from_package.clear_balances()
+        to_package.clear_balances()
 
         logger.info(f'Recorded transfer of balance of {from_balance} from package {from_package.id} to {to_package.id}')
         return True
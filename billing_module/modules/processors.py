@@ -358,7 +358,7 @@ class InvoiceTransactionProcessor(ChargeableTransactionProcessor):
             logger.error('Error: Expected key word argument "charges" not found')
             return False
 
-        transaction_date = transaction.transaction.timestamp.date()
+        transaction_date = transaction.timestamp.date()
         return (
                 self.order.end_date is None or
                 self.enforce_end_date is False or
@@ -1,4 +1,4 @@
-from celery import shared_task
+from celery import shared_task, group
 from celery_tasks.models import FileProcessingTask
 from celery.utils.log import get_task_logger
 
@@ -13,7 +13,10 @@ celery_logger = get_task_logger(f'et_billing.{__name__}')
 
 
 @shared_task(bind=True)
-def rate_transactions(self, period):
+def rate_transactions(self, period, parallel=False):
+    """ Rates the transactions of all billable clients for a given period.
+        If parallel is True each client is rated in a separate subtask, which reports its result to this task.
+    """
 
     start_time = time.time()
     logger.info(f"Starting rating of transactions for ALL vendors for {period}.")
@@ -22,10 +25,18 @@ def rate_transactions(self, period):
     task_status = FileProcessingTask.objects.create(task_id=self.request.id, status='PROGRESS', progress=0)
     task_status.save()
 
-    br = BaseRater(period)
     clients = list(Client.objects.filter(is_billable=True).order_by('client_id'))
     number_of_clients = len(clients)
 
+    # Dispatch clients to subtasks; the last one to finish marks the task as complete
+    if parallel and number_of_clients > 0:
+        logger.debug(f'Dispatching {number_of_clients} clients to subtasks')
+        task_status.number_of_files = number_of_clients
+        task_status.save()
+        group(rate_client.s(self.request.id, period, client.pk) for client in clients).apply_async()
+        return
+
+    br = BaseRater(period)
     for i, client in enumerate(clients):
         br.rate_client_transactions(client.pk)
 
@@ -43,3 +54,25 @@ def rate_transactions(self, period):
     seconds = int(execution_minutes % 60)
 
     logger.info(f'Data import process completed in {minutes} minutes and {seconds} seconds')
+
+
+@shared_task(bind=True)
+def rate_client(self, parent_task_id, period, client_id):
+    """ Rates the transactions of a single client for a given period and reports the result to the parent task """
+
+    start_time = time.time()
+    celery_logger.info(f"Starting rating of transactions for client {client_id} for {period}.")
+
+    document = {'fileName': f'Client {client_id}', 'fileId': client_id, 'resultCode': 0, 'resultText': 'Complete'}
+    try:
+        BaseRater(period).rate_client_transactions(client_id)
+
+    except Exception as e:
+        celery_logger.error(f"An unexpected error occurred: {e}")
+        document.update({'resultCode': 5, 'resultText': 'Failed'})
+
+    try:
+        FileProcessingTask.add_processed_document(parent_task_id, document)
+
+    finally:
+        celery_logger.info(f'Execution time: {time.time() - start_time:.2f} seconds')
@@ -1,5 +1,4 @@
-from typing import List, Optional
-from vendors.models import VendorService
+from typing import Dict, Optional, Tuple
 import logging
 
 logger = logging.getLogger(f'et_billing.{__name__}')
@@ -11,8 +10,9 @@ class RatedTransaction:
 
     Attributes:
         TRANSACTION_STATUS_FAILED (int): Constant representing the failed transaction status.
-        date (string): The date of the transaction in format %Y-%m-%d.
-        transaction (UsageTransaction): The transaction instance.
+        VALUES_FIELDS (tuple): UsageTransaction fields, in the order expected by from_values.
+        timestamp (datetime): The timestamp of the transaction.
+        transaction_status_id (int): The status of the transaction.
         bio_pin (bool): Was there BioID service associated with the transaction.
         service_id (int): ID of the service involved in the transaction.
         thread_id (int): ID of the thread associated with the transaction.
@@ -22,10 +22,20 @@ class RatedTransaction:
     """
 
     TRANSACTION_STATUS_FAILED = 5
+    VALUES_FIELDS = ('timestamp', 'transaction_status_id', 'bio_pin', 'service_id', 'thread_id', 'vendor_id')
+
+    __slots__ = ('timestamp', 'transaction_status_id', 'bio_pin', 'service_id', 'thread_id', 'vendor_id', 'vs_id',
+                 'charge')
 
     def __init__(self, transaction) -> None:
-        self.transaction = transaction
-        self.date = transaction.date
+        """
+        Initializes a RatedTransaction from a UsageTransaction instance.
+
+        :param transaction: The UsageTransaction instance.
+        """
+
+        self.timestamp = transaction.timestamp
+        self.transaction_status_id = transaction.transaction_status_id
         self.bio_pin = transaction.bio_pin
         self.service_id = transaction.service_id
         self.thread_id = transaction.thread_id
@@ -33,17 +43,37 @@ class RatedTransaction:
         self.vs_id: Optional[int] = None
         self.charge = 0
 
-    def set_vs(self, vs_list: List[VendorService]) -> None:
+    @classmethod
+    def from_values(cls, values: tuple) -> 'RatedTransaction':
+        """
+        Creates a RatedTransaction from a tuple of UsageTransaction values without loading a model instance.
+
+        :param values: A tuple with the values of the fields in VALUES_FIELDS.
+        """
+
+        rated_transaction = cls.__new__(cls)
+        (rated_transaction.timestamp, rated_transaction.transaction_status_id, rated_transaction.bio_pin,
+         rated_transaction.service_id, rated_transaction.thread_id, rated_transaction.vendor_id) = values
+        rated_transaction.vs_id = None
+        rated_transaction.charge = 0
+        return rated_transaction
+
+    @property
+    def date(self) -> str:
+        """
+        :return: The date of the transaction in format %Y-%m-%d.
+        """
+        return self.timestamp.strftime("%Y-%m-%d")
+
+    def set_vs(self, vs_map: Dict[Tuple[int, int], int]) -> None:
         """
-        Sets the VendorService ID for the transaction based on a list of VendorServices.
-        :param vs_list: A list of VendorService objects to search through.
+        Sets the VendorService ID for the transaction.
+        :param vs_map: A dictionary with VendorService IDs keyed by (vendor_id, service_id).
         """
 
         try:
-            if self.transaction.transaction_status_id != self.TRANSACTION_STATUS_FAILED:
-                vs_id = next((vendor_service.id for vendor_service in vs_list
-                              if vendor_service.vendor_id == self.vendor_id
-                              and vendor_service.service_id == self.service_id), None)
+            if self.transaction_status_id != self.TRANSACTION_STATUS_FAILED:
+                vs_id = vs_map.get((self.vendor_id, self.service_id))
                 if vs_id:
                     self.vs_id = vs_id
                 else:
@@ -55,5 +85,4 @@ class RatedTransaction:
             raise
 
     def __str__(self):
-        timestamp = self.transaction.timestamp
-        return f'{timestamp.strftime("%Y-%m-%d")}-account {self.vendor_id}-service {self.service_id}-cost {self.charge}'
+        return f'{self.date}-account {self.vendor_id}-service {self.service_id}-cost {self.charge}'
@@ -1,4 +1,4 @@
-from django.db import models
+from django.db import models, transaction
 import json
 
 
@@ -52,5 +52,23 @@ class FileProcessingTask(models.Model):
     processed_documents = ProcessedDocumentsList()
     note = models.CharField(max_length=255, null=True, blank=True)
 
+    @classmethod
+    def add_processed_document(cls, task_id: str, document: dict) -> 'FileProcessingTask':
+        """ Appends a processed document to a task and updates its progress.
+            The task row is locked while updating, so subtasks running in parallel can report to the same task.
+            The task is marked as COMPLETE once all of its files are processed.
+        """
+
+        with transaction.atomic():
+            task_status = cls.objects.select_for_update().get(task_id=task_id)
+            task_status.processed_documents.append(document)
+            processed = len(task_status.processed_documents)
+            if task_status.number_of_files:
+                task_status.progress = min(100 * processed // task_status.number_of_files, 100)
+                if processed >= task_status.number_of_files:
+                    task_status.status = 'COMPLETE'
+            task_status.save()
+        return task_status
+
     class Meta:
         db_table = 'celery_tasks_file_processing'
@@ -4,3 +4,10 @@ from django.apps import AppConfig
 class ReportsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'reports'
+
+    def ready(self):
+        from shared.models import PeriodArchive
+        from shared.modules import register_archive_members
+        from .modules.period_archives import get_report_archive_files
+
+        register_archive_members(PeriodArchive.REPORT_FILES, get_report_archive_files)
@@ -0,0 +1,130 @@
+# Generated by Django 4.1.7 on 2026-10-17 18:10
+
+from django.db import migrations
+
+# Tables read by the report_data_summary query.
+# Changes to the period tables are logged for the periods of the changed rows, any other change for all periods.
+PERIOD_TABLES = ['stats_usage', 'vendor_input_files']
+DIMENSION_TABLES = [
+    'reports', 'report_languages', 'report_skip_columns', 'report_vendors', 'vendor_services', 'order_services',
+    'order_prices', 'client_data', 'orders', 'payment_types', 'contracts', 'services',
+]
+
+CREATE_SQL = """
+    create table report_data_summary (
+        period date not null,
+        report_id bigint not null,
+        file_name varchar(50),
+        report_type bigint,
+        language_id bigint,
+        language varchar(3),
+        skip_columns varchar(30),
+        include_details boolean,
+        show_pids boolean,
+        client_id integer,
+        legal_name varchar(100),
+        reporting_name varchar(100),
+        contract_id integer,
+        contract_date date,
+        order_id integer,
+        order_descr text,
+        ccy_type bigint,
+        payment_type varchar(30),
+        tu_price numeric(5, 3),
+        service_id integer,
+        service_group varchar(20),
+        service_type varchar(20),
+        service_descr varchar(255),
+        s_desc_rept varchar(255),
+        unit_count integer,
+        unit_price numeric(6, 3),
+        skip_service_render boolean,
+        vendor_id integer,
+        vif_id bigint,
+        service_order integer
+    );
+    create index report_data_summary_report_order_idx on report_data_summary (period, report_id, order_id);
+    create index report_data_summary_client_idx on report_data_summary (period, client_id);
+
+    -- Changes to the source tables; period is null if the change can affect all periods
+    create table report_data_changes (
+        period date,
+        txid bigint not null default txid_current()
+    );
+    create index report_data_changes_period_idx on report_data_changes (period);
+
+    -- Snapshot in which the rows of a period, or of one report in a period, were last refreshed
+    create table report_data_refreshes (
+        period date not null,
+        report_id bigint,
+        snapshot txid_snapshot not null,
+        refreshed_at timestamp with time zone not null default now()
+    );
+    create index report_data_refreshes_period_idx on report_data_refreshes (period, report_id);
+
+    create function report_data_log_change() returns trigger language plpgsql as $$
+    begin
+        insert into report_data_changes (period) values (null);
+        return null;
+    end;
+    $$;
+
+    create function report_data_log_period_changes() returns trigger language plpgsql as $$
+    begin
+        if TG_OP = 'INSERT' then
+            insert into report_data_changes (period) select distinct period from new_rows;
+        elsif TG_OP = 'UPDATE' then
+            insert into report_data_changes (period) select period from new_rows union select period from old_rows;
+        else
+            insert into report_data_changes (period) select distinct period from old_rows;
+        end if;
+        return null;
+    end;
+    $$;
+""" + "".join(f"""
+    create trigger {table}_report_data_insert after insert on {table}
+    referencing new table as new_rows
+    for each statement execute procedure report_data_log_period_changes();
+    create trigger {table}_report_data_update after update on {table}
+    referencing old table as old_rows new table as new_rows
+    for each statement execute procedure report_data_log_period_changes();
+    create trigger {table}_report_data_delete after delete on {table}
+    referencing old table as old_rows
+    for each statement execute procedure report_data_log_period_changes();
+    create trigger {table}_report_data_truncate after truncate on {table}
+    for each statement execute procedure report_data_log_change();
+""" for table in PERIOD_TABLES) + "".join(f"""
+    create trigger {table}_report_data_change after insert or update or delete or truncate on {table}
+    for each statement execute procedure report_data_log_change();
+""" for table in DIMENSION_TABLES)
+
+DROP_SQL = "".join(f"""
+    drop trigger if exists {table}_report_data_insert on {table};
+    drop trigger if exists {table}_report_data_update on {table};
+    drop trigger if exists {table}_report_data_delete on {table};
+    drop trigger if exists {table}_report_data_truncate on {table};
+""" for table in PERIOD_TABLES) + "".join(f"""
+    drop trigger if exists {table}_report_data_change on {table};
+""" for table in DIMENSION_TABLES) + """
+    drop function if exists report_data_log_period_changes();
+    drop function if exists report_data_log_change();
+    drop table if exists report_data_refreshes;
+    drop table if exists report_data_changes;
+    drop table if exists report_data_summary;
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reports', '0014_delete_transactionstatus'),
+        ('clients', '0004_alter_client_reporting_name'),
+        ('contracts', '0007_order_end_date'),
+        ('services', '0002_alter_service_options'),
+        ('stats', '0019_alter_usagestats_unique_together'),
+        ('vendors', '0014_alter_vendor_description'),
+    ]
+
+    operations = [
+        migrations.RunSQL(CREATE_SQL, DROP_SQL),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 4.1.7 on 2026-10-18 12:05
+
+from django.db import migrations, models
+import os
+import reports.models
+
+DETAILS_SUFFIX = '_details.zip'
+
+
+def record_details_files(apps, schema_editor):
+    # Record the zipped details saved next to the report files before the field was added
+    ReportFile = apps.get_model('reports', 'ReportFile')
+    for report_file in ReportFile.objects.using(schema_editor.connection.alias).exclude(file=''):
+        details_name = f'{os.path.splitext(report_file.file.name)[0]}{DETAILS_SUFFIX}'
+        if report_file.file.storage.exists(details_name):
+            report_file.details_file.name = details_name
+            report_file.save(update_fields=['details_file'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reports', '0015_report_data_summary'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='reportfile',
+            name='details_file',
+            field=models.FileField(blank=True, max_length=255, null=True, upload_to=reports.models.content_report_file_filename),
+        ),
+        migrations.RunPython(record_details_files, reverse_code=migrations.RunPython.noop),
+    ]
@@ -92,6 +92,7 @@ class ReportFile(models.Model):
 
     period = MonthField()
     file = models.FileField(max_length=255, upload_to=content_report_file_filename)
+    details_file = models.FileField(max_length=255, upload_to=content_report_file_filename, null=True, blank=True)
     report = models.ForeignKey(
         Report, on_delete=models.RESTRICT, db_column='report_id', related_name='report_files')
     type = models.ForeignKey(
@@ -101,6 +102,10 @@ class ReportFile(models.Model):
     def filename(self):
         return os.path.basename(self.file.name)
 
+    @property
+    def details_filename(self):
+        return os.path.basename(self.details_file.name) if self.details_file else None
+
     @property
     def list_name(self):
         return self.filename
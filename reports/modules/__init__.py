@@ -1 +1,2 @@
 from .gen_reports import gen_report_by_id, gen_report_for_client, gen_reports
+from .period_archives import get_report_archive_files
@@ -1,7 +1,10 @@
-from celery import shared_task
+from celery import shared_task, group
 from celery_tasks.models import FileProcessingTask
 from celery.utils.log import get_task_logger
 
+from shared.models import PeriodArchive
+from shared.modules import schedule_period_archive
+
 from .layouts import LayoutFactory
 from .renderer import ReportRenderer
 from .report import DBReport, DBReportFactory
@@ -45,6 +48,7 @@ def gen_report_by_id(self, period: str, report_id: int):
     dbf = set_up(period)
     dbf.generate_report_by_report_id(report_id)
     dbf.close()
+    schedule_period_archive(period, PeriodArchive.REPORT_FILES)
 
     execution_time = dt.now() - start
     logger.info(f'Execution time: {execution_time}')
@@ -64,30 +68,93 @@ def gen_report_for_client(self, period: str, client: int):
     dbf = set_up(period)
     dbf.generate_report_by_client(client)
     dbf.close()
+    schedule_period_archive(period, PeriodArchive.REPORT_FILES)
 
     execution_time = dt.now() - start
     logger.info(f'Execution time: {execution_time}')
 
 
 @shared_task(bind=True)
-def gen_reports(self, period: str):
-    """ Creates a DBReportFactory instance and calls it to generate reports for a given period """
+def gen_reports(self, period: str, parallel=False):
+    """ Creates a DBReportFactory instance and calls it to generate reports for a given period.
+        If parallel is True each report is dispatched to a gen_report_part subtask, which reports its result
+        to this task.
+    """
 
     start = dt.now()
     logger.info(f"Starting billing report generation for ALL clients for {period}")
 
     # Create report processing task
-    create_file_processing_task(self.request.id)
+    task_status = create_file_processing_task(self.request.id)
+
+    # Dispatch reports to subtasks; the last one to finish marks the task as complete
+    if parallel:
+        dbr = DBReport()
+        try:
+            report_ids = dbr.get_report_ids(period)
+        finally:
+            dbr.close()
+
+        if report_ids:
+            logger.debug(f'Dispatching {len(report_ids)} reports to subtasks')
+            task_status.number_of_files = len(report_ids)
+            task_status.save()
+            group(gen_report_part.s(self.request.id, period, report_id) for report_id in report_ids).apply_async()
+            return
 
     # Generate reports
     dbf = set_up(period)
     dbf.generate_reports()
     dbf.close()
+    schedule_period_archive(period, PeriodArchive.REPORT_FILES)
 
     execution_time = dt.now() - start
     logger.info(f'Execution time: {execution_time}')
 
 
+@shared_task(bind=True)
+def gen_report_part(self, parent_task_id: str, period: str, report_id: int):
+    """ Generate a single report of a parallel gen_reports run and report the result to the parent task """
+
+    start = dt.now()
+    logger.info(f'Starting report generation for period {period} and report {report_id}')
+
+    try:
+        dbf = set_up(period)
+        try:
+            report_data = dbf.dbr.get_report_data(period, report_id=report_id)
+            report_files = [dbf.generate_report(data) for data in report_data]
+        finally:
+            dbf.close()
+
+        report_file = report_files[-1]
+        document = {
+            'fileName': report_file.filename,
+            'resultCode': 0,
+            'resultText': 'Complete',
+            'fileId': report_file.id
+        }
+        logger.info(f'{report_file.filename} - Complete')
+
+    except Exception as e:
+        logger.error(f'Report {report_id} failed: {e}')
+        document = {
+            'fileName': f'Report {report_id}',
+            'resultCode': 5,
+            'resultText': 'Failed',
+        }
+
+    try:
+        # The last report of the run triggers the build of the period archive
+        task_status = FileProcessingTask.add_processed_document(parent_task_id, document)
+        if task_status.status == 'COMPLETE':
+            schedule_period_archive(period, PeriodArchive.REPORT_FILES)
+
+    finally:
+        execution_time = dt.now() - start
+        logger.info(f'Execution time: {execution_time}')
+
+
 def create_file_processing_task(task_id):
     task_status = FileProcessingTask.objects.create(
         task_id=task_id, status='PROGRESS', progress=0, number_of_files=1
@@ -0,0 +1,13 @@
+from ..models import ReportFile
+from typing import Iterator
+
+
+def get_report_archive_files(period: str) -> Iterator[str]:
+    """ Yields the paths of the report files of a period and of the zipped details of reports which did not fit
+        in the Details sheet. Registered as the files of the PeriodArchive.REPORT_FILES archives.
+    """
+
+    for obj in ReportFile.objects.filter(period=period).iterator():
+        yield obj.file.path
+        if obj.details_file:
+            yield obj.details_file.path
@@ -7,8 +7,13 @@ from reports.models import ReportFile
 from .table_mixin import TableRenderMixin
 from .formats_mixin import FormatMixin
 
+from contextlib import ExitStack
+
 import xlsxwriter
 import tempfile
+import zipfile
+import csv
+import io
 import os
 import logging
 
@@ -51,6 +56,8 @@ class ReportRenderer(TableRenderMixin, BaseReportRenderer):
     ]
     _DETAILS_FLOAT_COLS = ['Cost', 'Cost EUR']
     _DETAILS_SHEET_NAME = 'Details'
+    _DETAILS_SIDECAR_SUFFIX = '_details'
+    _EXCEL_MAX_ROWS = 1048576
     _RESOURCES_DIR = 'resources/'
     _TOTAL_SHEET_NAME = 'Summary'
 
@@ -75,9 +82,10 @@ class ReportRenderer(TableRenderMixin, BaseReportRenderer):
 
         if report.layout.wb_formats:
             logger.debug(f'Creating temp file for {report.output_file_name}')
+            details_path = None
             with tempfile.NamedTemporaryFile(delete=False, suffix='.xlsx') as temp_file:
                 try:
-                    wb = xlsxwriter.Workbook(temp_file.name)
+                    wb = xlsxwriter.Workbook(temp_file.name, {'strings_to_formulas': False, 'strings_to_urls': False})
                     self._ws = wb.add_worksheet(self._TOTAL_SHEET_NAME)
                     self._wb = wb
 
@@ -95,7 +103,7 @@ class ReportRenderer(TableRenderMixin, BaseReportRenderer):
                     self._render_header(report)
                     self._render_tables(report)
                     if with_details:
-                        self._render_details(report)
+                        details_path = self._render_details(report)
                     self.close_workbook()
                 except Exception as e:
                     logger.error(e)
@@ -113,6 +121,7 @@ class ReportRenderer(TableRenderMixin, BaseReportRenderer):
                 report_file = ReportFile.objects.get(period=period, report_id=report_id, type_id=1)
                 if report_file.file:
                     os.remove(report_file.file.path)
+                self._delete_details_file(report_file)
                 logger.debug(f'Replacing existing ReportFile object for report_id {report_id}, period {period}')
                 report_file.file.save(filename, django_file, save=True)
 
@@ -125,56 +134,121 @@ class ReportRenderer(TableRenderMixin, BaseReportRenderer):
             finally:
                 file_obj.close()
                 os.remove(temp_file.name)
+                if details_path is not None:
+                    self._save_details_file(details_path, report_file)
                 return report_file
 
         logger.warning(f'Cannot render report_id {report.report_id}. '
                        f'ReportFile object does not contain formats. {report.output_file_name}')
 
-    def _render_details(self, report) -> None:
+    def _render_details(self, report) -> str | None:
         """ Render Details sheet in an XLSX report.
+        The sheet is written row by row in constant memory mode. If the transactions do not fit in the sheet,
+        all of them are also written to a zipped CSV file.
         :param report: Report object
+        :return: path of the temporary zipped CSV file or None
         """
 
         logger.debug(f'Rendering details')
 
-        ws = self._wb.add_worksheet(self._DETAILS_SHEET_NAME)
+        ws = self._add_constant_memory_worksheet(self._DETAILS_SHEET_NAME)
         xl_format_headers = self._get_format(report.layout.format_table_titles)
         xl_format_int = self._get_format(report.layout.format_details_int)
         xl_format_float = self._get_format(report.layout.format_details_float)
 
-        float_cols = []
-        skipped = 0
-        for col, column_name in enumerate(self._DETAILS_COLUMN_HEADERS):
-            if col in report.columns_to_skip:
-                skipped += 1
-                continue
-            if column_name in self._DETAILS_FLOAT_COLS:
-                float_cols.append(col)
-            ws.write_string(0, col - skipped, column_name, xl_format_headers)
-
-        for row, data in enumerate(report.transactions):
-
-            if data.render_from_headers is False:
-                render_data = data.all_data
-            else:
-                render_data = [getattr(data, el, None) for el in data.headers]
-
-            skipped_cols = 0
-            for col, value in enumerate(render_data):
-                if col in report.columns_to_skip:
-                    skipped_cols += 1
-                    continue
-                if type(value) == int:
-                    ws.write_number(row + 1, col - skipped_cols, value, xl_format_int)
-                elif type(value) == float:
-                    float_format = xl_format_float if col in float_cols else xl_format_int
-                    ws.write_number(row + 1, col - skipped_cols, value, float_format)
+        headers = [
+            column_name for col, column_name in enumerate(self._DETAILS_COLUMN_HEADERS)
+            if col not in report.columns_to_skip]
+        ws.write_row(0, 0, headers, xl_format_headers)
+
+        # Keep the last row for a note if the transactions do not fit in the sheet
+        max_rows = self._EXCEL_MAX_ROWS - 1
+        details_path = None
+        with ExitStack() as stack:
+            sidecar = None
+            if len(report.transactions) > max_rows:
+                max_rows -= 1
+                logger.info(f'{len(report.transactions)} transactions do not fit in the Details sheet. '
+                            f'Writing them to a zipped CSV file')
+                with tempfile.NamedTemporaryFile(delete=False, suffix='.zip') as temp_file:
+                    details_path = temp_file.name
+                csv_name = f'{os.path.splitext(self._get_details_sidecar_name(report))[0]}.csv'
+                zip_file = stack.enter_context(zipfile.ZipFile(details_path, 'w', zipfile.ZIP_DEFLATED))
+                csv_file = stack.enter_context(io.TextIOWrapper(
+                    zip_file.open(csv_name, 'w', force_zip64=True), encoding='utf-8-sig', newline=''))
+                sidecar = csv.writer(csv_file)
+                sidecar.writerow(headers)
+
+            # Transactions from different input files can have a different number of columns. The columns to render
+            # are set once for each number of columns and the format of each sheet column once it is first used.
+            render_cols_by_size = dict()
+            formatted_cols = 0
+            for row, data in enumerate(report.transactions):
+
+                if data.render_from_headers is False:
+                    render_data = data.all_data
                 else:
-                    ws.write_string(row + 1, col - skipped_cols, value)
-
-                ws.write_string(row + 1, col + 1 - skipped_cols, data.service)
+                    render_data = [getattr(data, el, None) for el in data.headers]
+
+                render_cols = render_cols_by_size.get(len(render_data))
+                if render_cols is None:
+                    render_cols = [col for col in range(len(render_data)) if col not in report.columns_to_skip]
+                    render_cols_by_size[len(render_data)] = render_cols
+                    for i, col in enumerate(render_cols[formatted_cols:], formatted_cols):
+                        is_float = col < len(self._DETAILS_COLUMN_HEADERS) and \
+                            self._DETAILS_COLUMN_HEADERS[col] in self._DETAILS_FLOAT_COLS
+                        ws.set_column(i, i, None, xl_format_float if is_float else xl_format_int)
+                    formatted_cols = max(formatted_cols, len(render_cols))
+
+                values = [render_data[col] for col in render_cols]
+                values.append(data.service)
                 if data.stype:
-                    ws.write_string(row + 1, col + 2 - skipped_cols, data.stype)
+                    values.append(data.stype)
+
+                if row < max_rows:
+                    ws.write_row(row + 1, 0, values)
+                if sidecar is not None:
+                    sidecar.writerow(values)
+
+        if details_path is not None:
+            ws.write_string(max_rows + 1, 0, f'Only the first {max_rows} transactions are shown. '
+                                             f'All transactions are in {self._get_details_sidecar_name(report)}')
+        return details_path
+
+    def _add_constant_memory_worksheet(self, name):
+        """ Adds a worksheet which is written row by row in constant memory mode.
+        The other sheets of the workbook are written in the default mode, as they are not written in row order.
+        """
+
+        self._wb.constant_memory = True
+        try:
+            return self._wb.add_worksheet(name)
+        finally:
+            self._wb.constant_memory = False
+
+    def _get_details_sidecar_name(self, report) -> str:
+        """ Returns the name of the zipped CSV file with the details of a report """
+
+        stem = os.path.splitext(report.output_file_name)[0]
+        return f'{stem}{self._DETAILS_SIDECAR_SUFFIX}.zip'
+
+    def _save_details_file(self, details_path: str, report_file) -> None:
+        """ Saves the zipped CSV file with the details as the details file of the saved report file """
+
+        try:
+            if report_file is not None:
+                stem = os.path.splitext(report_file.filename)[0]
+                with open(details_path, 'rb') as file_obj:
+                    filename = f'{stem}{self._DETAILS_SIDECAR_SUFFIX}.zip'
+                    report_file.details_file.save(filename, File(file_obj, name=filename), save=True)
+        finally:
+            os.remove(details_path)
+
+    def _delete_details_file(self, report_file) -> None:
+        """ Removes the zipped CSV file with the details of a replaced report file """
+
+        if report_file.details_file:
+            report_file.details_file.delete(save=False)
 
     def _render_header(self, report) -> None:
         """ Render the header in the Summary sheet of the XLSX report.
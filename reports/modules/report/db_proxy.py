@@ -5,12 +5,43 @@ from vendors.models import VendorInputFile
 import logging
 
 logger = logging.getLogger(f'et_billing.{__name__}')
+REPORT_DATA_SQL = """
+    select distinct
+        su.period, r.id as report_id, r.file_name, r.report_type, r.language_id, rl.language
+        , rsc.skip_columns, r.include_details, r.show_pids
+        ,cd.client_id, cd.legal_name, cd.reporting_name, c.contract_id as contract_id, c.start_date contract_date
+        ,os.order_id, o.description order_descr, o.ccy_type, p.type as payment_type, o.tu_price
+        ,vs.service_id, s.service service_group
+        ,case when s.stype is null then '' else stype end service_type
+        ,case when r.language_id = 1 then s.desc_bg else s.desc_en end service_descr
+        ,s.desc_en s_desc_rept
+        ,su.unit_count, op.unit_price, s.skip_service_render
+        ,vs.vendor_id, vif.id vif_id, s.service_order
+    from reports r
+    join report_languages rl on r.language_id = rl.id
+    join report_skip_columns rsc on r.skip_columns = rsc.id
+    join report_vendors rv on r.id = rv.report_id
+    join vendor_services vs on rv.vendor_id = vs.vendor_id
+    join stats_usage su on vs.vendor_id = su.vendor_id and vs.service_id = su.service_id
+    join order_services os on vs.id = os.vendor_service_id
+    join order_prices op on os.order_id = op.order_id and op.service_id = su.service_id
+    join client_data cd on r.client_id = cd.client_id
+    join orders o on os.order_id = o.order_id
+    join payment_types p on o.payment_type = p.id
+    join contracts c on o.contract_id = c.contract_id
+    left join services s on su.service_id = s.service_id
+    left join vendor_input_files vif on vif.vendor_id = vs.vendor_id and vif.period = su.period
+    where r.is_active = True and o.is_active = True and su.period = %(period)s and vif.is_active = True
+        and (%(report_id)s is null or r.id = %(report_id)s)
+"""
 
 
 class DBProxy:
 
     """ A class used to extract data directly from the DB """
 
+    _REPORT_DATA_LOCK_ID = 4201
+
     def __init__(self):
         db_config = settings.DATABASES.get('default')
         db_name = db_config.get('NAME')
@@ -62,51 +93,103 @@ class DBProxy:
         if fetch:
             return data
 
-    def create_temp_data_table(self, period: str) -> None:
-        """ Generate a temporary table with data for all reports
+    def refresh_report_data(self, period: str, report_id=None) -> None:
+        """ Refreshes the rows of a period, or of one report in a period, in the report_data_summary table.
+        Triggers on the source tables log each change in report_data_changes with the period of the changed rows,
+        or without period if the change can affect all periods (see the reports migrations). The rows are rebuilt
+        only if a change for the period was committed after the snapshot of their last refresh.
+
+        :param period: period for which the reports are created (e.g. '2023-01')
+        :param report_id: if not None only the rows of this report are refreshed
+        """
+
+        period_date = period + '-01'
+        year, month = period.split('-')
+        data = {'period': period_date, 'report_id': report_id}
+        try:
+            # Refresh each period in one session at a time
+            self.exec("select pg_advisory_xact_lock(%s, %s)", (self._REPORT_DATA_LOCK_ID, int(year + month)))
+            if self._is_report_data_fresh(data):
+                logger.debug(f'report_data_summary for {period} and report {report_id} is up-to-date')
+                return
+
+            logger.debug(f'Refreshing report_data_summary for {period} and report {report_id}')
+
+            # Record the snapshot before reading the source tables; later changes make the rows stale again
+            if report_id is None:
+                sql = "delete from report_data_refreshes where period = %(period)s"
+            else:
+                sql = "delete from report_data_refreshes where period = %(period)s and report_id = %(report_id)s"
+            self.exec(sql, data, fetch=False)
+            sql = """
+                insert into report_data_refreshes (period, report_id, snapshot)
+                values (%(period)s, %(report_id)s, txid_current_snapshot())
+            """
+            self.exec(sql, data, fetch=False)
+
+            sql = """
+                delete from report_data_summary
+                where period = %(period)s and (%(report_id)s is null or report_id = %(report_id)s)
+            """
+            self.exec(sql, data, fetch=False)
+            self.exec(f"insert into report_data_summary {REPORT_DATA_SQL}", data, fetch=False)
+
+            # Remove the changes which are included in all refreshed rows
+            sql = """
+                delete from report_data_changes c
+                where not exists (
+                    select 1 from report_data_refreshes r
+                    where (c.period is null or r.period = c.period) and not txid_visible_in_snapshot(c.txid, r.snapshot)
+                )
+            """
+            self.exec(sql, fetch=False)
+
+        finally:
+            self.conn.commit()
+
+    def _is_report_data_fresh(self, data: dict) -> bool:
+        """ Returns True if no change to the source tables was committed after the last refresh of the rows.
+        The rows of a report are refreshed either with their period or on their own, whichever is later.
+        """
+
+        sql = """
+            select not exists (
+                select 1 from report_data_changes c
+                where (c.period = %(period)s or c.period is null) and not txid_visible_in_snapshot(c.txid, r.snapshot)
+            )
+            from report_data_refreshes r
+            where r.period = %(period)s and (r.report_id is null or r.report_id = %(report_id)s)
+            order by r.report_id is null
+            limit 1
+        """
+        result = self.exec(sql, data)
+        return bool(result) and result[0][0]
+
+    def create_temp_data_view(self, period: str, report_id=None) -> None:
+        """ Generate a temporary view with data for all reports over the rows of a period in report_data_summary.
+        The rows of the period or report are refreshed first if any of their source tables changed.
 
         :param period: period for which the reports are created (e.g. '2023-01')
+        :param report_id: if not None the view is limited to the data of this report
         :return:
         """
 
-        logger.debug(f'Generating tmp_report_data table for {period}')
+        self.refresh_report_data(period, report_id=report_id)
+
+        logger.debug(f'Generating tmp_report_data view for {period}')
         sql = """
-            create temp table if not exists tmp_report_data as
-            select distinct
-                r.id as report_id, r.file_name, r.report_type, r.language_id, rl.language
-                , rsc.skip_columns, r.include_details, r.show_pids
-                ,cd.client_id, cd.legal_name, cd.reporting_name, c.contract_id as contract_id, c.start_date contract_date
-                ,os.order_id, o.description order_descr, o.ccy_type, p.type as payment_type, o.tu_price
-                ,vs.service_id, s.service service_group
-                ,case when s.stype is null then '' else stype end service_type
-                ,case when r.language_id = 1 then s.desc_bg else s.desc_en end service_descr
-                ,s.desc_en s_desc_rept
-                ,su.unit_count, op.unit_price, s.skip_service_render
-                ,vs.vendor_id, vif.id vif_id, s.service_order
-            from reports r
-            join report_languages rl on r.language_id = rl.id
-            join report_skip_columns rsc on r.skip_columns = rsc.id
-            join report_vendors rv on r.id = rv.report_id
-            join vendor_services vs on rv.vendor_id = vs.vendor_id
-            join stats_usage su on vs.vendor_id = su.vendor_id and vs.service_id = su.service_id
-            join order_services os on vs.id = os.vendor_service_id
-            join order_prices op on os.order_id = op.order_id and op.service_id = su.service_id
-            join client_data cd on r.client_id = cd.client_id
-            join orders o on os.order_id = o.order_id
-            join payment_types p on o.payment_type = p.id
-            join contracts c on o.contract_id = c.contract_id
-            left join services s on su.service_id = s.service_id
-            left join vendor_input_files vif on vif.vendor_id = vs.vendor_id and vif.period = su.period
-            where r.is_active = True and o.is_active = True and su.period = %s and vif.is_active = True;
+            create or replace temp view tmp_report_data as
+            select * from report_data_summary
+            where period = %s and (%s is null or report_id = %s);
         """
         period += '-01'
-        self.exec(sql, (period,), fetch=False)
+        self.exec(sql, (period, report_id, report_id), fetch=False)
 
-    def drop_temp_data_table(self) -> None:
-        """ Drops the temp table """
+    def drop_temp_data_view(self) -> None:
+        """ Drops the temp view """
 
-        sql = "drop table if exists tmp_report_data"
-        self.exec(sql).close()
+        sql = "drop view if exists tmp_report_data"
+        self.exec(sql, fetch=False)
 
     def get_reports_list_by_client(self, client_id: int) -> list:
         """ Returns a list of reports data for all reports in the tmp_report_data table
@@ -191,6 +274,52 @@ class DBProxy:
         data = self.exec(sql, (report_id, order_id))
         return data
 
+    def get_reports_details(self, report_ids: list) -> list:
+        """ Gets the Order details for the given reports as listed in the tmp_report_data
+            :param report_ids: reports for which the orders need to be extracted
+            :return: list of tuples (report_id, order_id, order_descr, ccy_type, payment_type, tu_price)
+        """
+
+        sql = "select distinct"
+        sql += " report_id, order_id, order_descr, t.ccy_type, payment_type, tu_price from tmp_report_data t"
+        sql += " left join pricing_types pt on pt.id = t.ccy_type"
+        sql += " where t.report_id = any(%s)"
+        data = self.exec(sql, (list(report_ids),))
+        return data
+
+    def get_reports_order_services(self, report_ids: list) -> list:
+        """ Get the details for the services included in the given reports from the tmp_report_data table
+            :param report_ids: reports for which services have to be extracted
+            :return: list of tuples containing:
+                (report_id, order_id, service_order, service_group, service_type, service_descr,
+                unit_price, skip_service_render, unit_count)
+        """
+
+        sql = "select report_id, order_id, service_order, service_group, service_type, service_descr, unit_price,"
+        sql += " skip_service_render, sum(unit_count) unit_count"
+        sql += " from tmp_report_data where report_id = any(%s)"
+        sql += " group by report_id, order_id, service_order, service_group, service_type, service_descr,"
+        sql += " unit_price, skip_service_render"
+        data = self.exec(sql, (list(report_ids),))
+        return data
+
+    def get_vendor_files_by_report_ids(self, report_ids: list) -> dict:
+        """ Gets the VendorInputFiles objects for the given reports as listed in the tmp_report_data
+            :param report_ids: reports for which the input files need to be extracted
+            :return: dict {report_id: [VendorInputFile, ]}
+        """
+
+        sql = "select distinct report_id, vif_id"
+        sql += " from tmp_report_data where report_id = any(%s)"
+        data = self.exec(sql, (list(report_ids),))
+
+        vendor_input_files = VendorInputFile.objects.filter(pk__in={el[1] for el in data}, is_active=True).in_bulk()
+        retval = {report_id: [] for report_id in report_ids}
+        for report_id, vif_id in data:
+            if vif_id in vendor_input_files:
+                retval[report_id].append(vendor_input_files[vif_id])
+        return retval
+
     def get_vendor_files_by_report_id(self, report_id):
         """ Gets the VendorInputFiles objects for a given report as listed in the tmp_report_data
             :param report_id: report for which the input files need to be extracted
@@ -1,3 +1,4 @@
+from collections import defaultdict
 from typing import List, Tuple
 from services.modules import FiltersMixin, ServicesMixin
 from shared.utils import DictToObjectMixin
@@ -21,11 +22,14 @@ class DBReport(InputFilesMixin, FiltersMixin, ServiceUsageMixin, ServicesMixin):
 
     def __init__(self):
         self.dba = DBProxy()
+        self._orders = dict()
+        self._order_services = dict()
+        self._vendor_files = dict()
 
     def close(self):
-        """ Drops the temp data table and closes the DB session connection """
+        """ Drops the temp data view and closes the DB session connection """
 
-        self.dba.drop_temp_data_table()
+        self.dba.drop_temp_data_view()
         self.dba.close()
 
     def get_report_data(self, period: str, client_id=None, report_id=None) -> list:
@@ -37,8 +41,8 @@ class DBReport(InputFilesMixin, FiltersMixin, ServiceUsageMixin, ServicesMixin):
 
         logger.debug(f'Starting generation of ReportData list')
 
-        # Generate temp_table
-        self.dba.create_temp_data_table(period)
+        # Generate temp view
+        self.dba.create_temp_data_view(period, report_id=report_id)
 
         # Choose the correct reports extract
         if report_id:
@@ -69,14 +73,48 @@ class DBReport(InputFilesMixin, FiltersMixin, ServiceUsageMixin, ServicesMixin):
                 'contract_date': contract_date
             }))
 
+        # Load the data of all reports at once
+        self.prefetch_report_data([el.report_id for el in retval])
+
         logger.debug(f'Returning list with {len(retval)} ReportData object/s')
         return retval
 
+    def get_report_ids(self, period: str) -> list:
+        """ Returns the sorted ids of all reports to be generated for a given period """
+
+        self.dba.create_temp_data_view(period)
+        return sorted({report[0] for report in self.dba.get_reports_list() if report[2] is not None})
+
+    def prefetch_report_data(self, report_ids: list) -> None:
+        """ Loads the orders, order services and vendor files of the given reports with one query each.
+            The prefetched data is used instead of querying the temp data view for each report and order.
+        """
+
+        report_ids = set(report_ids)
+        if not report_ids:
+            return
+
+        logger.debug(f'Prefetching data for {len(report_ids)} report/s')
+        orders = defaultdict(list)
+        for report_id, *order in self.dba.get_reports_details(report_ids):
+            orders[report_id].append(tuple(order))
+
+        order_services = defaultdict(list)
+        for report_id, order_id, *service in self.dba.get_reports_order_services(report_ids):
+            order_services[(report_id, order_id)].append(tuple(service))
+
+        self._orders.update({report_id: orders[report_id] for report_id in report_ids})
+        self._order_services.update(order_services)
+        self._vendor_files.update(self.dba.get_vendor_files_by_report_ids(report_ids))
+
     def get_report_order_details(self, report_id: int, report_language: str) -> list:
         """ Returns a list of Orders (BillingSummaries) to be included in the report """
 
         retval = []
-        orders_data = self.dba.get_report_details(report_id)
+        if report_id in self._orders:
+            orders_data = self._orders[report_id]
+        else:
+            orders_data = self.dba.get_report_details(report_id)
         for i, order in enumerate(orders_data):
             order_id, order_descr, ccy_type, payment_type, tu_price = order
             currency = 'BGN' if ccy_type in [1, 3] else 'EUR'
@@ -100,13 +138,22 @@ class DBReport(InputFilesMixin, FiltersMixin, ServiceUsageMixin, ServicesMixin):
         """ Generates a list of Transactions to be rendered in the Details sheet """
 
         service_types = self.get_service_types_for_reports()
-        vendor_files = self.dba.get_vendor_files_by_report_id(report_id)
+        if report_id in self._vendor_files:
+            vendor_files = self._vendor_files[report_id]
+        else:
+            vendor_files = self.dba.get_vendor_files_by_report_id(report_id) or []
         retval = []
         fully_mapped = True
         for file in vendor_files:
             service_filters = self.load_vendor_service_filters(file.vendor_id)
             df = self.load_data_for_service_usage(file.file.path, skip_status_five)
-            mapped_transactions = self.map_transactions(df, service_filters)
+
+            # Reuse the services mapped in the usage stage if the input file and the filters are unchanged
+            fingerprint = self.get_filters_fingerprint(service_filters)
+            service_ids = self.load_mapped_services(file.file.path, fingerprint, df.index)
+            mapped_transactions = self.map_transactions(df, service_filters, service_ids=service_ids)
+            if service_ids is None and service_filters:
+                self.save_mapped_services(file.file.path, fingerprint, df.index, df.service_id.to_numpy())
             fully_mapped *= mapped_transactions.fully_mapped
 
             for transaction in mapped_transactions.transactions:
@@ -134,7 +181,10 @@ class DBReport(InputFilesMixin, FiltersMixin, ServiceUsageMixin, ServicesMixin):
     def _get_report_order_services(self, report_id: int, order_id: int) -> list | None:
         """ Returns a list of services to be included for a given order (BillingSummary) """
 
-        services_data = self.dba.get_report_order_services(report_id, order_id)
+        if report_id in self._orders:
+            services_data = self._order_services.get((report_id, order_id))
+        else:
+            services_data = self.dba.get_report_order_services(report_id, order_id)
         if services_data:
             retval = []
             for el in services_data:
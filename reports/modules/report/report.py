@@ -35,7 +35,7 @@ class DBReportFactory:
     def generate_report_by_client(self, client_id: int):
         """ Generates all reports for a given client """
 
-        report_data = self.dbr.get_reports_data(self.period, client_id=client_id)
+        report_data = self.dbr.get_report_data(self.period, client_id=client_id)
         if len(report_data) > 0:
             self.generate_reports(report_data)
         else:
@@ -77,16 +77,15 @@ class DBReportFactory:
             task_status.number_of_files = number_of_reports
             task_status.save()
 
+            # Load the clients of all reports at once
+            clients = Client.objects.in_bulk({data.client_id for data in report_data})
+
             # Cycle through records and generate reports
             for i, data in enumerate(report_data):
                 if data.report_type is not None:
 
-                    # Generate report object
-                    report = self._generate_report_obj(data)
-                    with_details = data.render_details
-
-                    # Render report and save to ReportFile
-                    report_file = self._renderer.render(report, with_details=with_details, period=self.period)
+                    # Generate report object, render it and save to ReportFile
+                    report_file = self.generate_report(data, clients.get(data.client_id))
                     retval.append(report_file)
 
                     # Update celery task
@@ -101,13 +100,20 @@ class DBReportFactory:
             task_status.status = 'COMPLETE'
             task_status.save()
 
+    def generate_report(self, data, client=None):
+        """ Generates the Report object for a ReportData object, renders it and returns the saved ReportFile """
+
+        report = self._generate_report_obj(data, client)
+        return self._renderer.render(report, with_details=data.render_details, period=self.period)
+
     # Private methods used to generate Report
-    def _generate_report_obj(self, data) -> Report:
+    def _generate_report_obj(self, data, client=None) -> Report:
         """ Generates Report object from DBReport data """
 
         logger.debug(f'Generating Report object for client_id {data.client_id}')
         client_data = ReportClient(data.legal_name, data.client_id, data.contract_date)
-        client = Client.objects.get(client_id=data.client_id)
+        if client is None:
+            client = Client.objects.get(client_id=data.client_id)
         output_file_name = self._get_output_filename(data)
         reporting_period = self._calc_period()
         layout = self._layout_factory.get_layout(language=data.language)
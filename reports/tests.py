@@ -1,3 +1,48 @@
-# from django.test import TestCase
+from django.test import SimpleTestCase
+from types import SimpleNamespace
+from .modules.renderer import ReportRenderer
 
-# Create your tests here.
+import pandas as pd
+import xlsxwriter
+import tempfile
+import os
+
+
+class RenderDetailsTests(SimpleTestCase):
+
+    def setUp(self):
+        self.renderer = ReportRenderer()
+        with tempfile.NamedTemporaryFile(delete=False, suffix='.xlsx') as temp_file:
+            self.filename = temp_file.name
+        self.renderer.workbook = xlsxwriter.Workbook(self.filename)
+        self.renderer._load_formats({'titles': {'bold': True}, 'int': {}, 'float': {'num_format': '0.00'}})
+        self.layout = SimpleNamespace(format_table_titles='titles', format_details_int='int',
+                                      format_details_float='float')
+
+    def tearDown(self):
+        os.remove(self.filename)
+
+    @staticmethod
+    def get_transaction(data, service='Service'):
+        return SimpleNamespace(render_from_headers=False, all_data=data, service=service, stype=None)
+
+    def test_transactions_with_different_columns(self):
+        # Transactions from two input files, the second one without the last column
+        transactions = [
+            self.get_transaction(['2024-01-01', 1, 'Vendor A', 'T1', 1001, 0.5]),
+            self.get_transaction(['2024-01-02', 2, 'Vendor B', 'T2', 1002]),
+            self.get_transaction(['2024-01-03', 1, 'Vendor A', 'T3', 1003, 0.25]),
+        ]
+        report = SimpleNamespace(layout=self.layout, columns_to_skip=[], transactions=transactions,
+                                 output_file_name='report.xlsx')
+
+        self.assertIsNone(self.renderer._render_details(report))
+        self.renderer.close_workbook()
+
+        details = pd.read_excel(self.filename, sheet_name='Details', header=None, skiprows=1)
+        rows = [[value for value in row if not pd.isna(value)] for row in details.values.tolist()]
+        self.assertEqual(rows, [
+            ['2024-01-01', 1, 'Vendor A', 'T1', 1001, 0.5, 'Service'],
+            ['2024-01-02', 2, 'Vendor B', 'T2', 1002, 'Service'],
+            ['2024-01-03', 1, 'Vendor A', 'T3', 1003, 0.25, 'Service'],
+        ])
@@ -13,6 +13,8 @@ urlpatterns = [
     ])),
     path('download/', include([
         path('billing/file/<int:pk>/', views.download_billing_report, name='download_billing_report'),
+        path('billing/details/<int:pk>/', views.download_billing_report_details,
+             name='download_billing_report_details'),
         path('billing/all/<str:period>/', views.download_billing_reports_all, name='download_billing_reports_all'),
     ])),
     path('reconciliation/', views.reconciliation, name='db_reconciliation'),
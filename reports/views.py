@@ -1,8 +1,10 @@
-from django.http import HttpResponse
+from django.conf import settings
+from django.http import FileResponse, HttpResponse
 from django.shortcuts import render
 from django.urls import reverse
 
-from shared.modules import create_zip_file
+from shared.models import PeriodArchive
+from shared.modules import get_period_archive_response
 from shared.views import download_excel_file
 from stats.utils import get_stats_usage_not_in_vendor_services as get_su
 from vendors.models import VendorService
@@ -38,7 +40,7 @@ def render_period(request):
         form = PeriodForm(request.POST)
         if form.is_valid():
             period = form.cleaned_data.get('period')
-            async_result = m.gen_reports.delay(period)
+            async_result = m.gen_reports.delay(period, parallel=settings.PARALLEL_REPORTS)
             context = {
                 'list_title': f'Generating report for all clients for {period}',
                 'list_subtitle': 'This could take up to 5 minutes',
@@ -121,11 +123,30 @@ def download_billing_report(request, pk: int):
         return HttpResponse('No report file with such id')
 
 
+def download_billing_report_details(request, pk: int):
+    """ Triggers download of the zipped details of a billing report file with the given pk """
+
+    try:
+        report_file = ReportFile.objects.get(pk=pk)
+        if not report_file.details_file:
+            return HttpResponse('The report file has no details file')
+
+        filepath = report_file.details_file.path
+        logger.debug(f'Requested file to download: {filepath}')
+        response = FileResponse(open(filepath, 'rb'), as_attachment=True, filename=report_file.details_filename)
+        response["Cache-Control"] = "no-store"
+        return response
+
+    except ReportFile.DoesNotExist:
+        logger.warning(f'Does Not Exist: ReportFile with id {pk}')
+        return HttpResponse('No report file with such id')
+
+
 def download_billing_reports_all(request, period: str):
     """ Triggers the download of a ZIP archive with all billing report files for a given period """
 
-    queryset = ReportFile.objects.filter(period=period)
-    response = create_zip_file(queryset, f'{period}_billing_reports')
+    # Serve the pre-built archive if it is up-to-date, otherwise stream the archive and rebuild it
+    response = get_period_archive_response(period, PeriodArchive.REPORT_FILES, f'{period}_billing_reports')
     response["Cache-Control"] = "no-store"
     return response
 
@@ -149,7 +170,8 @@ def list_report_files(request):
                 'header': f'List of billing report files for {period}',
                 'files': files,
                 'zip_url': reverse('download_billing_reports_all', args=[period]),
-                'list_url': 'download_billing_report'
+                'list_url': 'download_billing_report',
+                'details_url': 'download_billing_report_details'
             }
             return render(request, 'shared/file_download_list.html', context)
     return render(request, 'shared/base_form.html', context)
@@ -0,0 +1,81 @@
+from __future__ import annotations
+from django.core.cache import cache
+from typing import Any, Callable, Hashable
+
+import logging
+import threading
+import time
+
+logger = logging.getLogger(f'et_billing.{__name__}')
+
+FILTERS_GENERATION_KEY = 'services:filters:generation'
+
+
+def get_filters_generation() -> int | None:
+    """ Returns the current generation of the service filters configuration from the shared cache,
+        or None if the shared cache is not available.
+    """
+
+    try:
+        generation = cache.get(FILTERS_GENERATION_KEY)
+        if generation is None:
+            # Seed the counter with the current time, so a restarted cache does not repeat an old generation
+            cache.add(FILTERS_GENERATION_KEY, time.time_ns(), timeout=None)
+            generation = cache.get(FILTERS_GENERATION_KEY)
+        return generation
+
+    except Exception as e:
+        logger.warning(f'Service filters cache is not available: {e}')
+        return None
+
+
+def bump_filters_generation() -> None:
+    """ Starts a new generation of the service filters configuration, so all processes reload their filters """
+
+    try:
+        cache.incr(FILTERS_GENERATION_KEY)
+    except ValueError:
+        cache.set(FILTERS_GENERATION_KEY, time.time_ns(), timeout=None)
+    except Exception as e:
+        logger.warning(f'Service filters cache is not available: {e}')
+
+
+class FiltersCache:
+    """ A per process cache of loaded service filters.
+        The cached values are kept while the generation of the filters configuration in the shared cache is unchanged.
+        Changes to the configuration start a new generation (see services.signals) and each process reloads
+        the filters on next use. If the shared cache is not available the filters are loaded every time.
+    """
+
+    def __init__(self) -> None:
+        self._generation = None
+        self._values = dict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, loader: Callable[[], Any]) -> Any:
+        """ Returns the cached value for key. Calls loader if the value is not cached for the current generation """
+
+        generation = get_filters_generation()
+        if generation is None:
+            return loader()
+
+        with self._lock:
+            if generation != self._generation:
+                self._generation = generation
+                self._values = dict()
+            if key in self._values:
+                return self._values[key]
+
+        value = loader()
+        with self._lock:
+            if generation == self._generation:
+                self._values[key] = value
+        return value
+
+    def clear(self) -> None:
+        with self._lock:
+            self._generation = None
+            self._values = dict()
+
+
+filters_cache = FiltersCache()
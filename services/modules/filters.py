@@ -1,3 +1,6 @@
+from pandas import Series
+import numpy as np
+import operator
 import logging
 
 logger = logging.getLogger(f'et_billing.{__name__}')
@@ -16,6 +19,15 @@ class FieldFilter:
         'transaction_value'
     ]
 
+    _VECTORIZED_OPERATORS = {
+        '_match_gt': operator.gt,
+        '_match_gte': operator.ge,
+        '_match_lte': operator.le,
+        '_match_lt': operator.lt,
+        '_match_eq': operator.eq,
+        '_match_not_eq': operator.ne,
+    }
+
     def __init__(self, field_name=None, func=None, lookup_value=None) -> None:
         self.field_name = field_name
         self.match_func = func
@@ -31,6 +43,38 @@ class FieldFilter:
         except AttributeError as err:
             logger.warning(err)
 
+    def apply_vectorized(self, column: Series) -> np.ndarray:
+        """ Applies the configured _match_function to a whole DataFrame column at once.
+            Comparison functions are evaluated as array operations, while the inclusion functions are evaluated
+            once per distinct value in the column. Returns a boolean array aligned to the column positions.
+            Values which cannot be compared with the lookup value (TypeError) count as non-matching, and a single
+            warning is logged for the filter.
+        """
+
+        vectorized_op = self._VECTORIZED_OPERATORS.get(self.match_func)
+        if vectorized_op is not None:
+            try:
+                return vectorized_op(column, self.lookup_value).to_numpy(dtype=bool)
+            except TypeError:
+                # Mixed types in the column; fall back to evaluating each distinct value on its own
+                pass
+
+        func = getattr(self, self.match_func)
+        matched_values, type_errors = [], 0
+        for value in column.unique():
+            try:
+                if func(value):
+                    matched_values.append(value)
+            except TypeError as err:
+                if type_errors == 0:
+                    first_error = err
+                type_errors += 1
+
+        if type_errors:
+            logger.warning(f'Filter {self.field_name} {self.match_func} {self.lookup_value!r}: {type_errors} values '
+                           f'cannot be compared with the lookup value and do not match ({first_error})')
+        return column.isin(matched_values).to_numpy(dtype=bool)
+
     @classmethod
     def create_filter(cls, filter_name, filter_value):
         """ Spits the filter_name into field and function. Returns a FieldFilter instance if
@@ -95,6 +139,26 @@ class FilterGroup:
                 return False
         return True
 
+    def apply_all_vectorized(self, df, columns_map: dict, rows=None) -> np.ndarray:
+        """ Returns a boolean array marking the DataFrame rows that match all filters in the FilterGroup.
+            :param df: Pandas dataframe from Vendor Input File
+            :param columns_map: {field_name: column_name} dictionary to look up the column for each FieldFilter
+            :param rows: optional boolean array limiting the rows to be evaluated
+        """
+
+        mask = np.ones(len(df), dtype=bool) if rows is None else rows.copy()
+        for field_filter in self.filters:
+            column_name = columns_map.get(field_filter.field_name)
+            if column_name is None:
+                logger.warning(f'No column for field {field_filter.field_name}')
+                return np.zeros(len(df), dtype=bool)
+
+            # Evaluate only the rows that are still matching
+            if not mask.any():
+                break
+            mask[mask] = field_filter.apply_vectorized(df[column_name][mask])
+        return mask
+
     def _add_filters_from_config(self, filter_config) -> None:
         """ Adds FieldFilters to the FilterGroup given the config
         :param filter_config: a tuple of (field_name__func_name, filter_value)
@@ -5,6 +5,7 @@ from django.db.models.functions import Coalesce
 
 from vendors.models import VendorService, VendorFilterOverride
 from services.models import FilterConfig, Service
+from .cache import filters_cache
 from .filters import FilterGroup
 
 import logging
@@ -15,16 +16,16 @@ logger = logging.getLogger(f'et_billing.{__name__}')
 
 class FiltersMixin:
     """ A mixin class to add methods for loading service filters.
-        Filters are used to identify the service for each transaction in a vendor input file
+        Filters are used to identify the service for each transaction in a vendor input file.
+        The loaded filters are cached in each process until the filters configuration changes, see FiltersCache.
+        The cached dictionaries are shared and must not be modified.
     """
 
     def load_all_service_filters(self, usage_based_only=True) -> Dict[int, FilterGroup]:
         """ Returns a dictionary with FilterGroups for all services """
 
-        logger.debug("Loading service filters")
-        services = Service.objects.all().filter(usage_based=usage_based_only)
-        service_filters = self.get_filter_configs()
-        return {el.service_id: FilterGroup(service_filters[el.filter_id]) for el in services}
+        return filters_cache.get(
+            ('all_service_filters', usage_based_only), lambda: self._load_all_service_filters(usage_based_only))
 
     def load_vendor_service_filters(self, vendor_id: int) -> Dict[int, FilterGroup] | None:
         """ Returns a dictionary with FilterGroups for each service of a given vendor.
@@ -32,6 +33,27 @@ class FiltersMixin:
             :returns : {service_id: FilterGroup}
         """
 
+        return filters_cache.get(
+            ('vendor_service_filters', vendor_id), lambda: self._load_vendor_service_filters(vendor_id))
+
+    def load_all_vendor_service_filters(self) -> Dict[int, Dict[int, FilterGroup]] | None:
+        """ Returns a dictionary with FilterGroups for each service for each vendor.
+            :returns : {vendor_id: {service_id: FilterGroup}}
+        """
+
+        return filters_cache.get('all_vendor_service_filters', self._load_all_vendor_service_filters)
+
+    def _load_all_service_filters(self, usage_based_only=True) -> Dict[int, FilterGroup]:
+        """ Loads the FilterGroups for all services from the DB """
+
+        logger.debug("Loading service filters")
+        services = Service.objects.all().filter(usage_based=usage_based_only)
+        service_filters = self.get_filter_configs()
+        return {el.service_id: FilterGroup(service_filters[el.filter_id]) for el in services}
+
+    def _load_vendor_service_filters(self, vendor_id: int) -> Dict[int, FilterGroup] | None:
+        """ Loads the FilterGroups for each service of a given vendor from the DB """
+
         try:
             logger.debug(f"Loading service filters for vendor {vendor_id}")
             db_services = self.get_vendor_service_filters(vendor_id)
@@ -48,10 +70,8 @@ class FiltersMixin:
             logger.error("Error: %s", e)
             raise
 
-    def load_all_vendor_service_filters(self) -> Dict[int, Dict[int, FilterGroup]] | None:
-        """ Returns a dictionary with FilterGroups for each service for each vendor.
-            :returns : {vendor_id: {service_id: FilterGroup}}
-        """
+    def _load_all_vendor_service_filters(self) -> Dict[int, Dict[int, FilterGroup]] | None:
+        """ Loads the FilterGroups for each service for each vendor from the DB """
 
         try:
             logger.debug(f"Loading service filters for ALL vendor")
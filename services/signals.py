@@ -0,0 +1,21 @@
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from vendors.models import VendorService, VendorFilterOverride
+from .models import Filter, FilterConfig, FilterFunction, Service
+from .modules.cache import bump_filters_generation
+
+
+@receiver([post_save, post_delete], sender=Filter)
+@receiver([post_save, post_delete], sender=FilterConfig)
+@receiver([post_save, post_delete], sender=FilterFunction)
+@receiver([post_save, post_delete], sender=Service)
+@receiver([post_save, post_delete], sender=VendorService)
+@receiver([post_save, post_delete], sender=VendorFilterOverride)
+def invalidate_service_filters(sender, **kwargs):
+    """ Starts a new generation of the cached service filters once the change is committed.
+        QuerySet.delete sends post_delete for each object, but bulk_create, bulk_update and QuerySet.update
+        do not send signals and need to call bump_filters_generation directly.
+    """
+    transaction.on_commit(bump_filters_generation)
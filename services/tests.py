@@ -1,3 +1,98 @@
-# from django.test import TestCase
+from django.test import SimpleTestCase
+from pandas import DataFrame
+from shared.modules.service_usage import ServiceUsageMixin
+from shared.modules.transactions import TransactionFactory
+from .modules.filters import FieldFilter, FilterGroup
 
-# Create your tests here.
+import numpy as np
+
+
+def map_services_by_row(df, service_filters: dict) -> list:
+    """ Maps each row of the dataframe to the first service whose FilterGroup matches its transaction.
+        Values which cannot be compared with the lookup value do not match.
+    """
+
+    def matches(filter_group, transaction):
+        try:
+            return filter_group.apply_all(transaction)
+        except TypeError:
+            return False
+
+    factory = TransactionFactory(df.columns.tolist())
+    retval = []
+    for row in df.itertuples(index=False, name=None):
+        transaction = factory.gen_transaction(row)
+        service_ids = [key for key, value in service_filters.items() if matches(value, transaction)]
+        retval.append(service_ids[0] if service_ids else None)
+    return retval
+
+
+class ServiceMappingTests(SimpleTestCase):
+
+    def setUp(self):
+        # Create a dataframe like a loaded vendor input file. TransValue and PID receiver mix numbers and strings.
+        rng = np.random.default_rng(7)
+        size = 500
+        self.df = DataFrame({
+            'TransactionID': np.arange(size),
+            'Description': rng.choice(['Sign', 'Login', 'Approve', 'Sign documents'], size),
+            'Type': rng.choice([1, 2, 3], size),
+            'Status': rng.choice([1, 2, 5], size),
+            'Signing type': rng.choice(['QES', 'AES', ''], size),
+            'Cost EUR': rng.choice([0.0, 0.05, 0.1, 0.25], size),
+            'PID receiver': rng.choice(np.array(['', 'PNOBG-1', 'PNOEE-2', 7], dtype=object), size),
+            'TransValue': rng.choice(np.array([1, 2, 3, 6, ''], dtype=object), size),
+        })
+
+    def assertMappingEqual(self, service_filters):
+        expected = map_services_by_row(self.df.copy(), service_filters)
+        actual = ServiceUsageMixin.map_services(self.df.copy(), service_filters)
+        self.assertEqual(actual.tolist(), expected)
+
+    def test_match_functions(self):
+        # Each match function on a numeric column, a string column and a mixed-type column
+        lookups = {
+            'gt': [0.05, 2, 'AES'], 'gte': [0.05, 2, 'AES'], 'lte': [0.05, 2, 'AES'], 'lt': [0.05, 2, 'AES'],
+            'eq': [0.1, 2, 'QES', ''], 'not_eq': [0.1, 2, 'QES', ''],
+            'incl': [[0.05, 0.1], [1, 6], ['QES', ''], 'Sign documents'],
+            'not_incl': [[0.05, 0.1], [1, 6], ['QES', ''], 'Sign documents'],
+        }
+        fields = ['cost', 'transaction_value', 'signing_type', 'description', 'receiver_pid']
+        for func_name, values in lookups.items():
+            for field_name in fields:
+                for value in values:
+                    with self.subTest(func=func_name, field=field_name, value=value):
+                        service_filters = {1: FilterGroup([(f'{field_name}__{func_name}', value)])}
+                        self.assertMappingEqual(service_filters)
+
+    def test_first_matching_service_wins(self):
+        service_filters = {
+            10: FilterGroup([('description__eq', 'Sign'), ('transaction_type__eq', 1)]),
+            11: FilterGroup([('description__incl', ['Sign', 'Login']), ('cost__gt', 0)]),
+            12: FilterGroup([('signing_type__eq', 'QES'), ('transaction_value__lte', 3)]),
+            13: FilterGroup([('receiver_pid__not_eq', ''), ('transaction_status__not_eq', 5)]),
+            14: FilterGroup([('transaction_type__incl', [2, 3])]),
+        }
+        self.assertMappingEqual(service_filters)
+
+    def test_no_filters(self):
+        self.assertEqual(ServiceUsageMixin.map_services(self.df, {}).tolist(), [None] * len(self.df))
+
+    def test_missing_column(self):
+        # A filter on a field without a column matches no rows
+        df = self.df.drop(columns=['TransValue'])
+        service_filters = {1: FilterGroup([('transaction_value__eq', 1)])}
+        self.assertEqual(ServiceUsageMixin.map_services(df, service_filters).tolist(), [None] * len(df))
+
+    def test_apply_vectorized_mixed_types(self):
+        # Values which cannot be compared with the lookup value do not match
+        column = DataFrame({'TransValue': np.array([1, '', 3, 'x', 6], dtype=object)})['TransValue']
+        field_filter = FieldFilter('transaction_value', '_match_gte', 3)
+        self.assertEqual(field_filter.apply_vectorized(column).tolist(), [False, False, True, False, True])
+
+    def test_apply_vectorized_warns_once(self):
+        column = DataFrame({'PID receiver': np.array([f'PNOBG-{i}' for i in range(1000)], dtype=object)})
+        field_filter = FieldFilter('receiver_pid', '_match_gt', 5)
+        with self.assertLogs('et_billing.services.modules.filters', level='WARNING') as logs:
+            self.assertFalse(field_filter.apply_vectorized(column['PID receiver']).any())
+        self.assertEqual(len(logs.output), 1)
@@ -0,0 +1,33 @@
+# Generated by Django 4.1.7 on 2026-10-17 16:40
+
+from django.db import migrations, models
+import month.models
+import shared.models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PeriodArchive',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period', month.models.MonthField()),
+                ('kind', models.CharField(
+                    choices=[('vendor_files', 'Vendor files'), ('billing_reports', 'Billing reports')],
+                    max_length=20)),
+                ('file', models.FileField(max_length=255, upload_to=shared.models.content_period_archive_filename)),
+                ('fingerprint', models.CharField(max_length=64)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'db_table': 'period_archives',
+                'unique_together': {('period', 'kind')},
+            },
+        ),
+    ]
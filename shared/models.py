@@ -1,5 +1,7 @@
 from django.db import models
+from month.models import MonthField
 from shared.utils import period_validator
+import os
 
 
 class PeriodField(models.CharField):
@@ -9,3 +11,39 @@ class PeriodField(models.CharField):
         kwargs['max_length'] = 7
         kwargs['validators'] = [period_validator]
         super(PeriodField, self).__init__(*args, **kwargs)
+
+
+def content_period_archive_filename(instance, filename):
+    """ Generates filename for a PeriodArchive """
+
+    return os.path.join('output/archives/%s/%s' % (instance.period, filename))
+
+
+class PeriodArchive(models.Model):
+    """ An object to record the pre-built ZIP archives with all files of a given kind for a period.
+        The files of each kind are provided by the app which registered it, see shared.modules.period_archives.
+    """
+
+    VENDOR_FILES = 'vendor_files'
+    REPORT_FILES = 'billing_reports'
+    KIND_CHOICES = [
+        (VENDOR_FILES, 'Vendor files'),
+        (REPORT_FILES, 'Billing reports'),
+    ]
+
+    period = MonthField()
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    file = models.FileField(max_length=255, upload_to=content_period_archive_filename)
+    fingerprint = models.CharField(max_length=64)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    @property
+    def filename(self):
+        return os.path.basename(self.file.name)
+
+    def __str__(self):
+        return f'{self.period} - {self.kind}'
+
+    class Meta:
+        db_table = 'period_archives'
+        unique_together = ('period', 'kind')
@@ -1,3 +1,4 @@
 from .input_files import InputFilesMixin
 from .service_usage import ServiceUsageMixin, MappedTransactions
+from .period_archives import get_period_archive_response, register_archive_members, schedule_period_archive
 from .zip_archives import create_zip_file
@@ -1,7 +1,37 @@
 from django.conf import settings
+from functools import lru_cache
 from pandas import DataFrame
 from typing import Union, Iterator, NamedTuple, List
+import numpy as np
 import pandas as pd
+import importlib.util
+import hashlib
+import glob
+import os
+import logging
+
+logger = logging.getLogger(f'et_billing.{__name__}')
+PARQUET_SUPPORT = importlib.util.find_spec('pyarrow') is not None
+FILE_HASH_BLOCK_SIZE = 1024 * 1024
+FILE_HASH_CACHE_SIZE = 1024
+
+
+def get_file_hash(filename) -> str:
+    """ Returns the sha256 hash of a file. Hashes of the most recently used unchanged files are memoized. """
+
+    stat = os.stat(filename)
+    return _get_file_hash(str(filename), stat.st_size, stat.st_mtime_ns)
+
+
+@lru_cache(maxsize=FILE_HASH_CACHE_SIZE)
+def _get_file_hash(filename: str, size: int, mtime_ns: int) -> str:
+    """ Returns the sha256 hash of a file with the given size and modification time """
+
+    file_hash = hashlib.sha256()
+    with open(filename, 'rb') as f:
+        for block in iter(lambda: f.read(FILE_HASH_BLOCK_SIZE), b''):
+            file_hash.update(block)
+    return file_hash.hexdigest()
 
 
 class UnsupportedExtensionError(Exception):
@@ -12,6 +42,106 @@ class UnsupportedExtensionError(Exception):
         super().__init__(self.message)
 
 
+class MappedServicesWriter:
+    """ Writes the service_id mapped to each row of a vendor input file to its mapped services sidecar file
+        chunk by chunk. The rows of each chunk are appended to temporary files, so only the current chunk is kept in memory.
+        Failures are logged and ignored.
+    """
+
+    def __init__(self, mapping_path: str):
+        self.mapping_path = mapping_path
+        self._temp_paths = {name: f'{mapping_path}.{name}.tmp' for name in ('rows', 'service_ids')}
+        self._temp_files = dict()
+        self._size = 0
+        self._last_row = None
+        self._rows_sorted = True
+        self._failed = False
+        try:
+            os.makedirs(os.path.dirname(mapping_path), exist_ok=True)
+            for name, temp_path in self._temp_paths.items():
+                self._temp_files[name] = open(temp_path, 'wb')
+        except Exception as e:
+            self._fail(e)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def append(self, index, service_ids) -> None:
+        """ Appends the mapped services of a chunk of rows.
+            :param index: row index of the mapped DataFrame
+            :param service_ids: service_id for each row or None if the row was not mapped
+        """
+
+        if self._failed:
+            return
+
+        try:
+            rows = np.asarray(index, dtype=np.int64)
+            service_ids = pd.to_numeric(pd.Series(service_ids, dtype=object)).fillna(-1).to_numpy(dtype=np.int64)
+            if len(rows):
+                if (self._last_row is not None and rows[0] < self._last_row) or (np.diff(rows) < 0).any():
+                    self._rows_sorted = False
+                self._last_row = rows[-1]
+            rows.tofile(self._temp_files['rows'])
+            service_ids.tofile(self._temp_files['service_ids'])
+            self._size += len(rows)
+
+        except Exception as e:
+            self._fail(e)
+
+    def save(self) -> None:
+        """ Writes the appended rows sorted by row index to the sidecar file and removes the temporary files """
+
+        if self._failed:
+            return
+
+        temp_path = f'{self.mapping_path}.tmp.npz'
+        try:
+            self._close_temp_files()
+            rows, service_ids = self._read_temp_file('rows'), self._read_temp_file('service_ids')
+
+            # Chunks are read in order, so the rows are usually sorted already and are not loaded in memory
+            if not self._rows_sorted:
+                order = np.argsort(rows, kind='stable')
+                rows, service_ids = rows[order], service_ids[order]
+            np.savez_compressed(temp_path, rows=rows, service_ids=service_ids)
+            os.replace(temp_path, self.mapping_path)
+            logger.debug(f'Mapped services saved to {self.mapping_path}')
+
+        except Exception as e:
+            self._fail(e)
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+        finally:
+            self.close()
+
+    def close(self) -> None:
+        """ Removes the temporary files without saving the sidecar file """
+
+        self._close_temp_files()
+        for temp_path in self._temp_paths.values():
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+    def _read_temp_file(self, name: str) -> np.ndarray:
+        if self._size == 0:
+            return np.empty(0, dtype=np.int64)
+        return np.memmap(self._temp_paths[name], dtype=np.int64, mode='r', shape=(self._size,))
+
+    def _close_temp_files(self) -> None:
+        for temp_file in self._temp_files.values():
+            temp_file.close()
+
+    def _fail(self, e: Exception) -> None:
+        logger.warning(f'Cannot save mapped services to {self.mapping_path}: {e}')
+        self._failed = True
+        self.close()
+
+
 class InputFilesMixin:
     """ Mixing adding methods to load vendor input files into DataFrames.
         This class should be used for any operations that requires reading and using information from raw input files.
@@ -21,6 +151,8 @@ class InputFilesMixin:
     _INPUT_FILES_ALLOWED_EXTENSIONS = ('xlsx', 'xls', 'csv')
     _FILE_NUMERIC_COLS = ['Vendor ID', 'Status', 'Type', 'Signing type', 'Cost', 'Cost EUR', 'TransValue']
     _FILE_PID_COLS = ['PID receiver', 'PID sender']
+    _CACHE_DIR_NAME = '.cache'
+    _MAPPING_FILE_SUFFIX = 'services.npz'
 
     def load_data(self, filename: str) -> Union[DataFrame, None]:
         """ Returns a DataFrame given vendor input filename """
@@ -33,6 +165,54 @@ class InputFilesMixin:
             return pd.read_excel(filename, keep_default_na=False, dtype=str)
         return pd.read_csv(filename, keep_default_na=False, low_memory=False, dtype=str)
 
+    def load_data_cached(self, filename: str) -> Union[DataFrame, None]:
+        """ Returns a DataFrame with converted numeric columns given vendor input filename.
+            The parsed data is stored in a columnar sidecar file keyed by the content hash of the input file,
+            so each input file is parsed only once. A replaced input file has a different hash and is parsed again.
+        """
+
+        cache_path = self.get_cache_path(filename)
+        if cache_path is not None and os.path.exists(cache_path):
+            try:
+                return pd.read_parquet(cache_path)
+            except Exception as e:
+                logger.warning(f'Cannot read cached data {cache_path}: {e}')
+
+        df = self.prep_df_for_service_usage_calc(self.load_data(filename))
+        if cache_path is not None:
+            self._write_cache(df, cache_path)
+        return df
+
+    def load_data_chunks(self, filename: str, chunksize: int) -> Iterator[DataFrame]:
+        """ Yields DataFrames with up to chunksize rows given vendor input filename.
+            Reads the columnar sidecar file in batches if it exists, otherwise reads the CSV file in chunks.
+            The index of the chunks continues from one chunk to the next, as if the whole file was loaded.
+            Excel files cannot be read in chunks and are returned as a single DataFrame.
+        """
+
+        ext = filename.split('.')[-1]
+        if ext not in self._INPUT_FILES_ALLOWED_EXTENSIONS:
+            raise UnsupportedExtensionError(ext)
+
+        cache_path = self.get_cache_path(filename)
+        if cache_path is not None and os.path.exists(cache_path):
+            import pyarrow.parquet as pq
+
+            start = 0
+            for batch in pq.ParquetFile(cache_path).iter_batches(batch_size=chunksize):
+                df = batch.to_pandas()
+                df.index = pd.RangeIndex(start, start + len(df))
+                start += len(df)
+                yield df
+
+        elif ext in ('xlsx', 'xls'):
+            yield self.load_data(filename)
+
+        else:
+            with pd.read_csv(filename, keep_default_na=False, dtype=str, chunksize=chunksize) as reader:
+                for df in reader:
+                    yield df
+
     def load_data_multiple(self, filenames: Iterator) -> Union[DataFrame, None]:
         """ Load multiple Vendor report files and concatenates them in one DataFrame.
             Returns the dataframe.
@@ -40,16 +220,16 @@ class InputFilesMixin:
         if not hasattr(filenames, '__iter__'):
             raise TypeError(f"The provided input of type {type(filenames)} is not iterable.")
 
-        df = None
+        dataframes = []
         for filename in filenames:
             try:
                 input_filepath = str(settings.BASE_DIR / filename)
-                if df is None:
-                    df = self.load_data(input_filepath)
-                df = pd.concat([df, self.load_data(input_filepath)], axis=0, ignore_index=True)
+                dataframes.append(self.load_data_cached(input_filepath))
             except UnsupportedExtensionError:
                 pass
-        return df
+
+        if dataframes:
+            return pd.concat(dataframes, axis=0, ignore_index=True)
 
     def load_data_for_service_usage(self, filename: Union[str, Iterator], skip_status_five=False)\
             -> Union[DataFrame, None]:
@@ -61,17 +241,38 @@ class InputFilesMixin:
         """
 
         if type(filename) == str:
-            df = self.load_data(filename)
+            df = self.load_data_cached(filename)
         else:
             df = self.load_data_multiple(filename)
 
-        if not df.empty:
+        if df is not None and not df.empty:
             return self.prep_df_for_service_usage_calc(df, skip_status_five)
 
+    def iter_data_for_service_usage(self, filename: str, skip_status_five=False, chunksize=None) \
+            -> Iterator[DataFrame]:
+        """ Yields DataFrames with data prepared for service usage calculations given vendor input filename.
+            If chunksize is None the whole file is returned as one DataFrame, otherwise the file is streamed
+            in chunks of up to chunksize rows, so memory usage is bounded by the chunk size and not the file size.
+            :param filename: vendor input filename
+            :param skip_status_five: if True will remove rows where Status field equals 5
+            :param chunksize: number of rows per chunk
+        """
+
+        if chunksize is None:
+            df = self.load_data_for_service_usage(filename, skip_status_five)
+            if df is not None:
+                yield df
+            return
+
+        for df in self.load_data_chunks(filename, chunksize):
+            df = self.prep_df_for_service_usage_calc(df, skip_status_five)
+            if not df.empty:
+                yield df
+
     def load_data_for_uq_countries(self, filename, skip_status_five=True) -> Iterator[NamedTuple]:
-        df = self.load_data(filename)
+        df = self.load_data_cached(filename)
         if 'Status' in df.columns and skip_status_five:
-            df = df[df.Status != '5'][["Country receiver", "PID receiver"]].drop_duplicates()
+            df = df[df.Status != 5][["Country receiver", "PID receiver"]].drop_duplicates()
         else:
             df = df[["Country receiver", "PID receiver"]].drop_duplicates()
         return df.itertuples(index=False)
@@ -79,21 +280,128 @@ class InputFilesMixin:
     def load_data_for_uq_users(self, filename: str) -> List[str]:
         """ Returns the list of unique PID Receiver in an vendor file"""
 
-        df = self.load_data(filename)
+        df = self.load_data_cached(filename)
         if 'Status' in df.columns:
-            return list(df[df.Status != '5']['PID receiver'].unique())
+            return list(df[df.Status != 5]['PID receiver'].unique())
         return list(df['PID receiver'].unique())
 
     def prep_df_for_service_usage_calc(self, df: DataFrame, skip_status_five=False) -> DataFrame:
-        """ Takes a dataframe, replaces n/a with blank string, removes rows with status 5
-        and converts specific columns from string to numeric representation.
+        """ Takes a dataframe, replaces n/a with blank string, converts specific columns from string to numeric
+        representation and removes rows with status 5.
         """
 
         df.fillna('', inplace=True)
-        if skip_status_five and 'Status' in df.columns:
-            df.drop(df[df['Status'] == '5'].index, inplace=True)
-
         for c_name in df.columns:
             if c_name in self._FILE_NUMERIC_COLS:
                 df[c_name] = pd.to_numeric(df[c_name])
+
+        if skip_status_five and 'Status' in df.columns:
+            df.drop(df[df['Status'] == 5].index, inplace=True)
         return df
+
+    def get_cache_path(self, filename: str) -> Union[str, None]:
+        """ Returns the path of the columnar sidecar file for a given vendor input filename
+            or None if columnar files are not supported.
+        """
+
+        if not PARQUET_SUPPORT:
+            return None
+
+        dir_name, base_name = os.path.split(filename)
+        content_hash = self.get_content_hash(filename)
+        return os.path.join(dir_name, self._CACHE_DIR_NAME, f'{base_name}.{content_hash}.parquet')
+
+    def get_mapping_path(self, filename: str, fingerprint: str) -> str:
+        """ Returns the path of the mapped services sidecar file for a given vendor input filename
+            and service filters fingerprint.
+        """
+
+        dir_name, base_name = os.path.split(filename)
+        content_hash = self.get_content_hash(filename)
+        return os.path.join(
+            dir_name, self._CACHE_DIR_NAME, f'{base_name}.{content_hash}.{fingerprint}.{self._MAPPING_FILE_SUFFIX}')
+
+    def load_mapped_services(self, filename: str, fingerprint: str, index) -> Union[np.ndarray, None]:
+        """ Returns the service_id mapped to each row of a vendor input file from its mapped services sidecar file.
+            Returns None if there is no sidecar file for the file content and service filters,
+            or if it does not cover all the rows in the index.
+            :param filename: vendor input filename
+            :param fingerprint: fingerprint of the service filters used for the mapping
+            :param index: row index of the DataFrame loaded from the input file
+            :returns : array with the service_id for each row or None if the row was not mapped
+        """
+
+        mapping_path = self.get_mapping_path(filename, fingerprint)
+        if not os.path.exists(mapping_path):
+            return None
+
+        try:
+            with np.load(mapping_path) as data:
+                rows, service_ids = data['rows'], data['service_ids']
+        except Exception as e:
+            logger.warning(f'Cannot read mapped services {mapping_path}: {e}')
+            return None
+
+        # Find the position of each row in the sorted rows of the sidecar file
+        index = np.asarray(index, dtype=np.int64)
+        positions = np.searchsorted(rows, index)
+        if len(rows) == 0 or (positions >= len(rows)).any() or (rows[positions] != index).any():
+            logger.debug(f'Mapped services {mapping_path} do not cover all rows')
+            return None
+
+        service_ids = service_ids[positions]
+        retval = service_ids.astype(object)
+        retval[service_ids < 0] = None
+        return retval
+
+    def save_mapped_services(self, filename: str, fingerprint: str, index, service_ids) -> None:
+        """ Writes the service_id mapped to each row of a vendor input file to a sidecar file.
+            Failures are logged and ignored.
+            :param filename: vendor input filename
+            :param fingerprint: fingerprint of the service filters used for the mapping
+            :param index: row index of the mapped DataFrame
+            :param service_ids: service_id for each row or None if the row was not mapped
+        """
+
+        with self.open_mapped_services_writer(filename, fingerprint) as writer:
+            writer.append(index, service_ids)
+            writer.save()
+
+    def open_mapped_services_writer(self, filename: str, fingerprint: str) -> MappedServicesWriter:
+        """ Returns a writer of the mapped services sidecar file of a vendor input file, to which the mapped
+            services are appended chunk by chunk, see MappedServicesWriter.
+            :param filename: vendor input filename
+            :param fingerprint: fingerprint of the service filters used for the mapping
+        """
+
+        return MappedServicesWriter(self.get_mapping_path(filename, fingerprint))
+
+    def delete_cached_data(self, filename: str) -> None:
+        """ Removes all columnar and mapped services sidecar files of a given vendor input filename """
+
+        dir_name, base_name = os.path.split(filename)
+        pattern = os.path.join(glob.escape(dir_name), self._CACHE_DIR_NAME, f'{glob.escape(base_name)}.*')
+        for cache_path in glob.glob(pattern):
+            logger.debug(f'Removing {cache_path}')
+            os.remove(cache_path)
+
+    def get_content_hash(self, filename: str) -> str:
+        """ Returns the content hash of a file, see get_file_hash """
+
+        return get_file_hash(filename)[:16]
+
+    @staticmethod
+    def _write_cache(df: DataFrame, cache_path: str) -> None:
+        """ Writes a DataFrame to a columnar sidecar file. Failures are logged and ignored. """
+
+        temp_path = f'{cache_path}.tmp'
+        try:
+            os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+            df.to_parquet(temp_path, index=False)
+            os.replace(temp_path, cache_path)
+            logger.debug(f'Cached data saved to {cache_path}')
+
+        except Exception as e:
+            logger.warning(f'Cannot cache data to {cache_path}: {e}')
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
@@ -0,0 +1,181 @@
+from __future__ import annotations
+
+from celery import shared_task
+from celery.utils.log import get_task_logger
+from django.core.cache import cache
+from django.core.files import File
+from django.db import transaction
+from django.http import FileResponse, StreamingHttpResponse
+
+from .zip_archives import iter_zip_stream
+from ..models import PeriodArchive
+
+from datetime import datetime as dt
+from pathlib import PurePath
+from typing import Callable, Iterable, List, Tuple
+
+import hashlib
+import tempfile
+import os
+
+logger = get_task_logger(f'et_billing.{__name__}')
+
+# A scheduled build is not scheduled again until it starts or this many seconds pass
+SCHEDULE_TIMEOUT = 60 * 60
+
+# Functions returning the paths of the files in the archive of each kind for a period, see register_archive_members
+_ARCHIVE_MEMBERS = dict()
+
+
+def register_archive_members(kind: str, members: Callable[[str], Iterable[str]]) -> None:
+    """ Registers the function returning the paths of the files included in the archives of a given kind.
+        Apps register the kinds of archives they provide in AppConfig.ready.
+        :param kind: one of PeriodArchive.KIND_CHOICES
+        :param members: function which takes a period and returns the file paths
+    """
+
+    _ARCHIVE_MEMBERS[kind] = members
+
+
+def get_archive_members(period: str, kind: str) -> List[Tuple[str, str]]:
+    """ Returns (file_path, archive_name) of the files included in the archive of a given kind for a period """
+
+    if kind not in _ARCHIVE_MEMBERS:
+        raise ValueError(f'Unknown archive kind: {kind}')
+
+    retval = []
+    for file_path in sorted(_ARCHIVE_MEMBERS[kind](period)):
+        parent_dir = PurePath(file_path).parent.name
+        retval.append((file_path, f"{parent_dir}/{PurePath(file_path).name}"))
+    return retval
+
+
+def get_archive_fingerprint(members: List[Tuple[str, str]]) -> str:
+    """ Returns a hash of the name, size and modification time of the archive members.
+        A member file which is added, removed or replaced changes the fingerprint.
+    """
+
+    fingerprint = hashlib.sha256()
+    for file_path, archive_name in members:
+        try:
+            stat = os.stat(file_path)
+            fingerprint.update(f'{archive_name}:{stat.st_size}:{stat.st_mtime_ns};'.encode())
+        except OSError:
+            fingerprint.update(f'{archive_name}:missing;'.encode())
+    return fingerprint.hexdigest()
+
+
+def get_period_archive(period: str, kind: str) -> PeriodArchive | None:
+    """ Returns the pre-built archive of a given kind for a period if it is up-to-date, otherwise None """
+
+    archive = PeriodArchive.objects.filter(period=period, kind=kind).first()
+    if archive is None or not archive.file or not os.path.exists(archive.file.path):
+        return None
+
+    if archive.fingerprint != get_archive_fingerprint(get_archive_members(period, kind)):
+        logger.debug(f'Archive {archive} is outdated')
+        return None
+    return archive
+
+
+def get_period_archive_response(period: str, kind: str, zip_file_name: str):
+    """ Returns a response with the archive of a given kind for a period.
+        The pre-built archive is served if it is up-to-date, otherwise the archive is streamed and rebuilt.
+        :param period: period of the archive
+        :param kind: one of PeriodArchive.KIND_CHOICES
+        :param zip_file_name: name of the downloaded archive without extension
+    """
+
+    archive = get_period_archive(period, kind)
+    if archive is not None:
+        return FileResponse(open(archive.file.path, 'rb'), as_attachment=True, filename=f'{zip_file_name}.zip')
+
+    schedule_period_archive(period, kind)
+    logger.info(f'Creating zip archive {zip_file_name}')
+    response = StreamingHttpResponse(iter_zip_stream(get_archive_members(period, kind)))
+    response['Content-Type'] = 'application/zip'
+    response['Content-Disposition'] = f'attachment; filename="{zip_file_name}.zip"'
+    return response
+
+
+def schedule_period_archive(period: str, kind: str) -> None:
+    """ Schedules the build of the archive of a given kind for a period after the current transaction commits.
+        A build which is already scheduled and not started yet is not scheduled again.
+    """
+
+    period = str(period)
+
+    def delay():
+        if cache.add(_get_schedule_key(period, kind), True, timeout=SCHEDULE_TIMEOUT):
+            build_period_archive.delay(period, kind)
+
+    transaction.on_commit(delay)
+
+
+def _get_schedule_key(period: str, kind: str) -> str:
+    return f'period_archive:{period}:{kind}'
+
+
+def _remove_file(file_path: str) -> None:
+    if os.path.exists(file_path):
+        os.remove(file_path)
+
+
+@shared_task(bind=True)
+def build_period_archive(self, period: str, kind: str):
+    """ Builds the ZIP archive with all files of a given kind for a period.
+        The archive is rebuilt only if a member file changed since the last build. The ZIP is written without
+        holding any lock. The row of the archive is locked only to check that the files did not change meanwhile
+        and to swap in the new file, so concurrent builds of the same archive save it once.
+    """
+
+    # Files changed from now on need another build
+    cache.delete(_get_schedule_key(period, kind))
+
+    start = dt.now()
+    members = get_archive_members(period, kind)
+    fingerprint = get_archive_fingerprint(members)
+    archive = PeriodArchive.objects.filter(period=period, kind=kind).first()
+    if archive is not None and _is_archive_current(archive, fingerprint):
+        logger.info(f'Archive {archive} is up-to-date')
+        return
+
+    logger.info(f'Building {kind} archive for {period} with {len(members)} files')
+    filename = f'{period}_{kind}.zip'
+    with tempfile.NamedTemporaryFile(delete=False, suffix='.zip') as temp_file:
+        for data in iter_zip_stream(members):
+            temp_file.write(data)
+
+    try:
+        PeriodArchive.objects.get_or_create(period=period, kind=kind, defaults={'fingerprint': ''})
+        with transaction.atomic():
+            archive = PeriodArchive.objects.select_for_update().get(period=period, kind=kind)
+            if _is_archive_current(archive, fingerprint):
+                logger.info(f'Archive {archive} was saved by another build')
+                return
+
+            # A file changed while the ZIP was written. The change scheduled another build.
+            if get_archive_fingerprint(get_archive_members(period, kind)) != fingerprint:
+                logger.info(f'Files of archive {archive} changed during the build. The archive is not saved')
+                return
+
+            old_path = archive.file.path if archive.file else None
+            with open(temp_file.name, 'rb') as file_obj:
+                archive.fingerprint = fingerprint
+                archive.file.save(filename, File(file_obj, name=filename), save=True)
+
+            # The previous archive is removed once the new one is committed
+            if old_path is not None and old_path != archive.file.path:
+                transaction.on_commit(lambda: _remove_file(old_path))
+
+    finally:
+        os.remove(temp_file.name)
+
+    execution_time = dt.now() - start
+    logger.info(f'Archive {archive} saved. Execution time: {execution_time}')
+
+
+def _is_archive_current(archive: PeriodArchive, fingerprint: str) -> bool:
+    """ Returns True if the archive file exists and was built from files with the given fingerprint """
+
+    return archive.fingerprint == fingerprint and bool(archive.file) and os.path.exists(archive.file.path)
@@ -1,6 +1,8 @@
 from collections import namedtuple
 from .transactions import TransactionFactory
 
+import numpy as np
+import hashlib
 import logging
 
 logger = logging.getLogger(f'et_billing.{__name__}')
@@ -12,43 +14,76 @@ class ServiceUsageMixin:
     """ Mixing to add functionality to calculate service usage on a given DataFrame """
 
     @staticmethod
-    def map_transactions(df, service_filters: dict) -> MappedTransactions:
+    def map_transactions(df, service_filters: dict, gen_transactions=True, service_ids=None) -> MappedTransactions:
         """ Generates Transaction objects for each row in the dataframe.
             If service_filters are provided, tries to map each transaction to a service.
             :param df: Pandas dataframe from Vendor Input File
             :param service_filters: {service_id: FilterGroup} dictionary for mapping transaction based services
+            :param gen_transactions: if False only the service_id column of the dataframe is mapped
+            :param service_ids: service_id of each row from an earlier mapping; if provided rows are not mapped again
             :returns : named tuple ("dataframe": DataFrame, "transactions": list, "fully_mapped": bool)
         """
 
         try:
             transactions_list = []
             headers = df.columns.tolist()
-            transactions_factory = TransactionFactory(headers)
-            df['service_id'] = None
-            for row in df.itertuples():
-                i, data = row[0], row[1:-1]
-
-                if data:
-                    # Generate transaction from data
-                    transaction = transactions_factory.gen_transaction(data)
-                    transaction.service_id = None
-
-                    # Apply filters to map service, update dataframe and transaction, and add to output
-                    if service_filters:
-                        filter_result = next((k for k, v in service_filters.items() if v.apply_all(transaction)), None)
-                        transaction.service_id = filter_result
-                        df.at[i, 'service_id'] = filter_result
-
-                    transactions_list.append(transaction)
-
-            fully_mapped = True
-            for el in transactions_list:
-                if el.transaction_status != TRANSACTION_STATUS_ERROR and el.service_id is None:
-                    fully_mapped = False
-                    break
-            # fully_mapped = sum(df.service_id.value_counts()) == len(df)
+            if service_ids is None:
+                service_ids = ServiceUsageMixin.map_services(df, service_filters)
+            df['service_id'] = service_ids
+
+            if gen_transactions:
+                transactions_factory = TransactionFactory(headers)
+                for row, service_id in zip(df.itertuples(index=False, name=None), service_ids):
+                    data = row[:-1]
+
+                    if data:
+                        # Generate transaction from data and add the mapped service
+                        transaction = transactions_factory.gen_transaction(data)
+                        transaction.service_id = service_id
+                        transactions_list.append(transaction)
+
+            # Transactions with error status are not expected to be mapped
+            unmapped = df['service_id'].isna().to_numpy()
+            status_column = TransactionFactory.get_fields_map(headers).get('transaction_status')
+            if status_column is not None:
+                unmapped &= (df[status_column] != TRANSACTION_STATUS_ERROR).to_numpy()
+            fully_mapped = not unmapped.any()
             return MappedTransactions(dataframe=df, transactions=transactions_list, fully_mapped=fully_mapped)
 
         except Exception as e:
             logger.error("Error: %s", e)
             raise
+
+    @staticmethod
+    def get_filters_fingerprint(service_filters: dict) -> str:
+        """ Returns a short hash of the service filters, which identifies the mapping they produce.
+            The order of the services is included, as the first matching service wins.
+        """
+
+        config = [
+            (service_id, [(el.field_name, el.match_func, repr(el.lookup_value)) for el in filter_group.filters])
+            for service_id, filter_group in (service_filters or {}).items()]
+        return hashlib.sha256(repr(config).encode()).hexdigest()[:16]
+
+    @staticmethod
+    def map_services(df, service_filters: dict) -> np.ndarray:
+        """ Maps each row of the dataframe to a service using vectorized passes over the dataframe columns.
+            Services are tried in the order of service_filters and the first matching service wins.
+            :param df: Pandas dataframe from Vendor Input File
+            :param service_filters: {service_id: FilterGroup} dictionary for mapping transaction based services
+            :returns : array with the service_id for each row or None if the row could not be mapped
+        """
+
+        service_ids = np.full(len(df), None, dtype=object)
+        if not service_filters:
+            return service_ids
+
+        columns_map = TransactionFactory.get_fields_map(df.columns)
+        unmapped = np.ones(len(df), dtype=bool)
+        for service_id, filter_group in service_filters.items():
+            if not unmapped.any():
+                break
+            matched = filter_group.apply_all_vectorized(df, columns_map, rows=unmapped)
+            service_ids[matched] = service_id
+            unmapped &= ~matched
+        return service_ids
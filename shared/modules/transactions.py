@@ -50,6 +50,14 @@ class TransactionFactory:
     def headers(self, headers_list):
         self._headers = [self._HEADERS_MAP.get(el) for el in headers_list]
 
+    @classmethod
+    def get_fields_map(cls, headers_list) -> dict:
+        """ Returns {transaction_attribute: column_name} for the given headers.
+            If more than one column maps to the same attribute the last one is used, same as in gen_transaction.
+        """
+
+        return {cls._HEADERS_MAP[el]: el for el in headers_list if el in cls._HEADERS_MAP}
+
     def gen_transaction(self, data):
         """ Generate KwargsTransaction from the given data """
 
@@ -1,33 +1,91 @@
-from django.http import HttpResponse
+from django.http import StreamingHttpResponse
 from pathlib import PurePath
+from typing import Iterable, Iterator, Tuple
 
 import logging
 import zipfile
-import io
+import os
 
 logger = logging.getLogger(f'et_billing.{__name__}')
 
+ZIP_STREAM_BLOCK_SIZE = 64 * 1024
+ZIP_STORED_EXTENSIONS = ('xlsx', 'zip')
 
-def create_zip_file(queryset, zip_file_name) -> HttpResponse:
-    """ Create a zipfile containing the files in the provided QuerySet """
 
-    logger.info(f'Creating zip archive {zip_file_name}')
-    in_memory_file = io.BytesIO()
-    with zipfile.ZipFile(in_memory_file, 'w', zipfile.ZIP_DEFLATED) as zip_file:
-        for obj in queryset:
+class _ZipStreamBuffer:
+    """ A write-only file object which keeps the bytes written by ZipFile until they are sent.
+        It has no tell and seek methods, so ZipFile writes the archive sequentially with data descriptors.
+    """
+
+    def __init__(self):
+        self._data = bytearray()
+
+    def write(self, data) -> int:
+        self._data.extend(data)
+        return len(data)
+
+    def flush(self) -> None:
+        pass
+
+    def pop(self) -> bytes:
+        """ Returns the bytes written since the last call and clears the buffer """
+
+        data = bytes(self._data)
+        self._data.clear()
+        return data
+
+
+def iter_zip_stream(files: Iterable[Tuple[str, str]], stored_extensions=ZIP_STORED_EXTENSIONS) -> Iterator[bytes]:
+    """ Yields the bytes of a ZIP archive as it is being written, so the archive is never held in memory.
+        :param files: (file_path, archive_name) of the files to add to the archive
+        :param stored_extensions: extensions of already compressed files, which are added without compression
+    """
+
+    buffer = _ZipStreamBuffer()
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as zip_file:
+        for file_path, archive_name in files:
+            if not os.path.isfile(file_path):
+                logger.warning(f'File {file_path} does not exist and is not added to the archive')
+                continue
+
+            zip_info = zipfile.ZipInfo.from_file(file_path, archive_name)
+            extension = file_path.split('.')[-1].lower()
+            zip_info.compress_type = zipfile.ZIP_STORED if extension in stored_extensions else zipfile.ZIP_DEFLATED
+
+            with open(file_path, 'rb') as src, zip_file.open(zip_info, 'w') as dst:
+                for block in iter(lambda: src.read(ZIP_STREAM_BLOCK_SIZE), b''):
+                    dst.write(block)
+                    data = buffer.pop()
+                    if data:
+                        yield data
+
+            data = buffer.pop()
+            if data:
+                yield data
+
+    # Central directory
+    yield buffer.pop()
+
+
+def create_zip_file(queryset, zip_file_name, stored_extensions=ZIP_STORED_EXTENSIONS) -> StreamingHttpResponse:
+    """ Create a zipfile containing the files in the provided QuerySet.
+        The archive is streamed to the client while it is being written.
+        :param queryset: QuerySet of objects with a file field
+        :param zip_file_name: name of the archive without extension
+        :param stored_extensions: extensions of already compressed files, which are added without compression
+    """
+
+    def iter_files():
+        for obj in queryset.iterator():
 
             # Construct the relative path
             file_path = obj.file.path
             parent_dir = PurePath(file_path).parent.name
             filename = PurePath(file_path).name
-            rel_path = f"{parent_dir}/{filename}"
+            yield file_path, f"{parent_dir}/{filename}"
 
-            # Add the file with the relative path to the archive
-            zip_file.write(file_path, rel_path)
-
-    # Send the zip file as a response for download
-    in_memory_file.seek(0)
-    response = HttpResponse(in_memory_file.read())
+    logger.info(f'Creating zip archive {zip_file_name}')
+    response = StreamingHttpResponse(iter_zip_stream(iter_files(), stored_extensions))
     response['Content-Type'] = 'application/zip'
     response['Content-Disposition'] = f'attachment; filename="{zip_file_name}.zip"'
     return response
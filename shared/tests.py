@@ -1,3 +1,39 @@
-# from django.test import TestCase
+from django.test import SimpleTestCase
+from .modules.input_files import InputFilesMixin
 
-# Create your tests here.
+import numpy as np
+import tempfile
+import os
+
+
+class MappedServicesTests(SimpleTestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.filename = os.path.join(self.temp_dir.name, 'input.csv')
+        with open(self.filename, 'w') as f:
+            f.write('TransactionID\n1\n')
+        self.mixin = InputFilesMixin()
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_chunks_round_trip(self):
+        # Rows of the second chunk come before the rows of the first one
+        chunks = [([3, 5, 6], [1, None, 2]), ([0, 2], [None, 3]), ([], [])]
+        with self.mixin.open_mapped_services_writer(self.filename, 'abc') as writer:
+            for index, service_ids in chunks:
+                writer.append(index, np.array(service_ids, dtype=object))
+            writer.save()
+
+        service_ids = self.mixin.load_mapped_services(self.filename, 'abc', [6, 0, 3, 2])
+        self.assertEqual(service_ids.tolist(), [2, None, 1, 3])
+        self.assertIsNone(self.mixin.load_mapped_services(self.filename, 'abc', [1]))
+        self.assertEqual(os.listdir(os.path.join(self.temp_dir.name, '.cache')),
+                         [os.path.basename(self.mixin.get_mapping_path(self.filename, 'abc'))])
+
+    def test_closed_without_saving(self):
+        with self.mixin.open_mapped_services_writer(self.filename, 'abc') as writer:
+            writer.append([0, 1], np.array([1, 2], dtype=object))
+
+        self.assertEqual(os.listdir(os.path.join(self.temp_dir.name, '.cache')), [])
@@ -30,6 +30,19 @@ class VendorPeriodForm(PeriodForm):
     )
 
 
+class LoadTransactionsForm(PeriodForm):
+    """ A PeriodForm with an option to load only the changed input files """
+
+    incremental = forms.BooleanField(
+        label='Load only changed accounts',
+        initial=True,
+        required=False,
+        widget=forms.CheckboxInput(
+            attrs={'class': "form-check-input"}
+        )
+    )
+
+
 class UniqueUsersForm(forms.Form):
     """ Form to select inputs for extracting Unique Users information """
 
@@ -81,6 +94,15 @@ class UniqueUsersForm(forms.Form):
         required=False,
     )
 
+    exact = forms.BooleanField(
+        label='Exact count (slower)',
+        initial=False,
+        required=False,
+        widget=forms.CheckboxInput(
+            attrs={'class': "form-check-input"}
+        )
+    )
+
     def clean_period_start(self):
         period_select = self.data.get('period_select')
         period_start = self.data.get('period_start')
@@ -0,0 +1,40 @@
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+
+from shared.utils import period_validator
+from stats.modules.partitions import list_partitions, ensure_partition, truncate_partition, detach_partition
+
+
+class Command(BaseCommand):
+    help = 'Manage the monthly partitions of stats_usage_transactions'
+
+    def add_arguments(self, parser):
+        parser.add_argument('action', choices=['list', 'create', 'truncate', 'detach'])
+        parser.add_argument('periods', nargs='*', help='Periods in format yyyy-mm')
+        parser.add_argument('--drop', action='store_true', help='Drop the partitions after detaching them')
+
+    def handle(self, *args, **options):
+        action, periods = options['action'], options['periods']
+        if action == 'list':
+            for name in list_partitions():
+                self.stdout.write(name)
+            return
+
+        if not periods:
+            raise CommandError(f'At least one period is required for {action}')
+        for period in periods:
+            try:
+                period_validator(period)
+            except ValidationError as e:
+                raise CommandError(e.messages[0])
+
+        for period in periods:
+            if action == 'create':
+                name = ensure_partition(period)
+                self.stdout.write(self.style.SUCCESS(f'Partition {name} is ready'))
+            elif action == 'truncate':
+                truncate_partition(period)
+                self.stdout.write(self.style.SUCCESS(f'Transactions for {period} removed'))
+            else:
+                detach_partition(period, drop=options['drop'])
+                self.stdout.write(self.style.SUCCESS(f'Partition for {period} detached'))
@@ -0,0 +1,31 @@
+# Generated by Django 4.1.7 on 2026-10-17 10:12
+
+from django.db import migrations, models
+import django.db.models.deletion
+import month.models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vendors', '0014_alter_vendor_description'),
+        ('stats', '0014_transactionstatus_usagetransaction'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UsageTransactionLoad',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period', month.models.MonthField()),
+                ('content_hash', models.CharField(max_length=16)),
+                ('loaded_at', models.DateTimeField(auto_now=True)),
+                ('input_file', models.ForeignKey(db_column='input_file_id', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='usage_transaction_loads', to='vendors.vendorinputfile')),
+                ('vendor', models.ForeignKey(db_column='vendor_id', on_delete=django.db.models.deletion.RESTRICT, related_name='usage_transaction_loads', to='vendors.vendor')),
+            ],
+            options={
+                'db_table': 'stats_usage_transaction_loads',
+                'unique_together': {('period', 'vendor')},
+            },
+        ),
+    ]
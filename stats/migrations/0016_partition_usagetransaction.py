@@ -0,0 +1,127 @@
+# Generated by Django 4.1.7 on 2026-10-17 11:05
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+# Replaces stats_usage_transactions with a table partitioned by timestamp month.
+# The primary key of a partitioned table must include the partition key, so it becomes (id, timestamp).
+# A monthly partition is created for each month with data, other rows go to the default partition.
+PARTITION_SQL = """
+ALTER TABLE stats_usage_transactions RENAME TO stats_usage_transactions_old;
+
+CREATE SEQUENCE stats_usage_transactions_seq;
+
+CREATE TABLE stats_usage_transactions (
+    id bigint NOT NULL DEFAULT nextval('stats_usage_transactions_seq'),
+    timestamp timestamp with time zone NOT NULL,
+    thread_id varchar(12) NOT NULL,
+    transaction_id bigint NOT NULL,
+    charge_user boolean NOT NULL,
+    bio_pin boolean NOT NULL,
+    service_id integer NULL REFERENCES services (service_id) DEFERRABLE INITIALLY DEFERRED,
+    status_id integer NOT NULL REFERENCES stats_transaction_statuses (status_type) DEFERRABLE INITIALLY DEFERRED,
+    vendor_id integer NOT NULL REFERENCES vendors (vendor_id) DEFERRABLE INITIALLY DEFERRED,
+    PRIMARY KEY (id, timestamp)
+) PARTITION BY RANGE (timestamp);
+
+ALTER SEQUENCE stats_usage_transactions_seq OWNED BY stats_usage_transactions.id;
+
+CREATE TABLE stats_usage_transactions_default PARTITION OF stats_usage_transactions DEFAULT;
+
+DO $$
+DECLARE
+    month_start timestamp with time zone;
+BEGIN
+    FOR month_start IN
+        SELECT DISTINCT date_trunc('month', timestamp) FROM stats_usage_transactions_old
+    LOOP
+        EXECUTE format(
+            'CREATE TABLE %I PARTITION OF stats_usage_transactions FOR VALUES FROM (%L) TO (%L)',
+            'stats_usage_transactions_p' || to_char(month_start, 'YYYY_MM'),
+            month_start,
+            month_start + interval '1 month'
+        );
+    END LOOP;
+END $$;
+
+INSERT INTO stats_usage_transactions (
+    id, timestamp, thread_id, transaction_id, charge_user, bio_pin, service_id, status_id, vendor_id)
+SELECT id, timestamp, thread_id, transaction_id, charge_user, bio_pin, service_id, status_id, vendor_id
+FROM stats_usage_transactions_old;
+
+SELECT setval('stats_usage_transactions_seq', COALESCE(MAX(id), 0) + 1, false) FROM stats_usage_transactions;
+
+DROP TABLE stats_usage_transactions_old;
+
+CREATE INDEX stats_usage_service_id_idx ON stats_usage_transactions (service_id);
+CREATE INDEX stats_usage_status_id_idx ON stats_usage_transactions (status_id);
+"""
+
+UNPARTITION_SQL = """
+ALTER TABLE stats_usage_transactions RENAME TO stats_usage_transactions_old;
+
+CREATE TABLE stats_usage_transactions (
+    id bigint NOT NULL GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
+    timestamp timestamp with time zone NOT NULL,
+    thread_id varchar(12) NOT NULL,
+    transaction_id bigint NOT NULL,
+    charge_user boolean NOT NULL,
+    bio_pin boolean NOT NULL,
+    service_id integer NULL REFERENCES services (service_id) DEFERRABLE INITIALLY DEFERRED,
+    status_id integer NOT NULL REFERENCES stats_transaction_statuses (status_type) DEFERRABLE INITIALLY DEFERRED,
+    vendor_id integer NOT NULL REFERENCES vendors (vendor_id) DEFERRABLE INITIALLY DEFERRED
+);
+
+INSERT INTO stats_usage_transactions (
+    id, timestamp, thread_id, transaction_id, charge_user, bio_pin, service_id, status_id, vendor_id)
+SELECT id, timestamp, thread_id, transaction_id, charge_user, bio_pin, service_id, status_id, vendor_id
+FROM stats_usage_transactions_old;
+
+SELECT setval(pg_get_serial_sequence('stats_usage_transactions', 'id'), COALESCE(MAX(id), 0) + 1, false)
+FROM stats_usage_transactions;
+
+DROP TABLE stats_usage_transactions_old CASCADE;
+
+CREATE INDEX stats_usage_service_id_idx ON stats_usage_transactions (service_id);
+CREATE INDEX stats_usage_status_id_idx ON stats_usage_transactions (status_id);
+CREATE INDEX stats_usage_vendor_id_idx ON stats_usage_transactions (vendor_id);
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stats', '0015_usagetransactionload'),
+    ]
+
+    operations = [
+        # The state keeps id as the primary key, as Django cannot represent the (id, timestamp) key.
+        # The index on vendor_id is replaced by the (vendor_id, timestamp) index below.
+        migrations.SeparateDatabaseAndState(
+            database_operations=[
+                migrations.RunSQL(PARTITION_SQL, reverse_sql=UNPARTITION_SQL),
+            ],
+            state_operations=[
+                migrations.AlterField(
+                    model_name='usagetransaction',
+                    name='vendor',
+                    field=models.ForeignKey(db_column='vendor_id', db_index=False, on_delete=django.db.models.deletion.RESTRICT, related_name='usage_transactions', to='vendors.vendor'),
+                ),
+            ],
+        ),
+        migrations.SeparateDatabaseAndState(
+            database_operations=[
+                migrations.RunSQL(
+                    'CREATE INDEX stats_usage_vendor_ts_idx ON stats_usage_transactions (vendor_id, timestamp);',
+                    reverse_sql='DROP INDEX IF EXISTS stats_usage_vendor_ts_idx;'
+                ),
+            ],
+            state_operations=[
+                migrations.AddIndex(
+                    model_name='usagetransaction',
+                    index=models.Index(fields=['vendor', 'timestamp'], name='stats_usage_vendor_ts_idx'),
+                ),
+            ],
+        ),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 4.1.7 on 2026-10-17 12:40
+
+from django.db import migrations, models
+import django.db.models.deletion
+import month.models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vendors', '0014_alter_vendor_description'),
+        ('stats', '0016_partition_usagetransaction'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UniqueUserCountrySketch',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', month.models.MonthField()),
+                ('country', models.CharField(max_length=5)),
+                ('registers', models.BinaryField()),
+            ],
+            options={
+                'db_table': 'stats_uq_users_country_sketches',
+                'unique_together': {('month', 'country')},
+            },
+        ),
+        migrations.CreateModel(
+            name='UniqueUserSketch',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', month.models.MonthField()),
+                ('registers', models.BinaryField()),
+                ('vendor', models.ForeignKey(db_column='vendor_id', on_delete=django.db.models.deletion.RESTRICT, related_name='unique_user_sketches', to='vendors.vendor')),
+            ],
+            options={
+                'db_table': 'stats_uq_users_sketches',
+                'unique_together': {('month', 'vendor')},
+            },
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 4.1.7 on 2026-10-17 14:05
+
+from django.db import migrations, models
+import django.db.models.deletion
+import month.models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vendors', '0014_alter_vendor_description'),
+        ('stats', '0017_uniqueusersketch_uniqueusercountrysketch'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UniqueUserId',
+            fields=[
+                ('id', models.AutoField(primary_key=True, serialize=False)),
+                ('user_id', models.CharField(max_length=30, unique=True)),
+                ('country', models.CharField(blank=True, max_length=5, null=True)),
+            ],
+            options={
+                'db_table': 'stats_uq_user_ids',
+            },
+        ),
+        migrations.CreateModel(
+            name='UniqueUserBitmap',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', month.models.MonthField()),
+                ('bitmap', models.BinaryField()),
+                ('vendor', models.ForeignKey(db_column='vendor_id', on_delete=django.db.models.deletion.RESTRICT, related_name='unique_user_bitmaps', to='vendors.vendor')),
+            ],
+            options={
+                'db_table': 'stats_uq_users_bitmaps',
+                'unique_together': {('month', 'vendor')},
+            },
+        ),
+    ]
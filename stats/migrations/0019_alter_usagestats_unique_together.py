@@ -0,0 +1,28 @@
+# Generated by Django 4.1.7 on 2026-10-17 15:20
+
+from django.db import migrations
+
+# Keep the latest row of any duplicated (period, vendor, service) before adding the constraint
+DEDUPLICATE_SQL = """
+    DELETE FROM stats_usage a
+    USING stats_usage b
+    WHERE a.period = b.period
+        AND a.vendor_id = b.vendor_id
+        AND a.service_id = b.service_id
+        AND a.id < b.id;
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stats', '0018_uniqueuserid_uniqueuserbitmap'),
+    ]
+
+    operations = [
+        migrations.RunSQL(DEDUPLICATE_SQL, migrations.RunSQL.noop),
+        migrations.AlterUniqueTogether(
+            name='usagestats',
+            unique_together={('period', 'vendor', 'service')},
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.1.7 on 2026-10-18 09:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stats', '0019_alter_usagestats_unique_together'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='usagetransactionload',
+            name='filters_fingerprint',
+            field=models.CharField(default='', max_length=16),
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 4.1.7 on 2026-10-18 10:15
+
+from django.db import migrations, models
+import django.db.models.deletion
+import month.models
+
+# Record the periods and vendors with unique users stored before the model was added
+BACKFILL_SQL = """
+    INSERT INTO stats_uq_users_loads (month, vendor_id, users_count)
+    SELECT month, vendor_id, COUNT(*)
+    FROM stats_uq_users
+    GROUP BY month, vendor_id
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vendors', '0014_alter_vendor_description'),
+        ('stats', '0020_usagetransactionload_filters_fingerprint'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UniqueUserLoad',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', month.models.MonthField()),
+                ('users_count', models.IntegerField()),
+                ('vendor', models.ForeignKey(db_column='vendor_id', on_delete=django.db.models.deletion.RESTRICT, related_name='unique_user_loads', to='vendors.vendor')),
+            ],
+            options={
+                'db_table': 'stats_uq_users_loads',
+                'unique_together': {('month', 'vendor')},
+            },
+        ),
+        migrations.RunSQL(BACKFILL_SQL, migrations.RunSQL.noop),
+    ]
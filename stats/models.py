@@ -2,7 +2,7 @@ from django.db import models
 from month.models import MonthField
 from clients.models import Client
 from services.models import Service
-from vendors.models import Vendor
+from vendors.models import Vendor, VendorInputFile
 
 
 class UsageStats(models.Model):
@@ -17,6 +17,7 @@ class UsageStats(models.Model):
 
     class Meta:
         db_table = 'stats_usage'
+        unique_together = ('period', 'vendor', 'service')
 
 
 class UniqueUser(models.Model):
@@ -33,6 +34,68 @@ class UniqueUser(models.Model):
         unique_together = ('month', 'vendor', 'user_id')
 
 
+class UniqueUserLoad(models.Model):
+    """ Model to record the number of unique users stored for each period and vendor """
+
+    month = MonthField()
+    vendor = models.ForeignKey(
+        Vendor, on_delete=models.RESTRICT, db_column='vendor_id', related_name='unique_user_loads')
+    users_count = models.IntegerField()
+
+    class Meta:
+        db_table = 'stats_uq_users_loads'
+        unique_together = ('month', 'vendor')
+
+
+class UniqueUserSketch(models.Model):
+    """ Model to store HyperLogLog sketches of the unique user PIDs for each period and vendor """
+
+    month = MonthField()
+    vendor = models.ForeignKey(
+        Vendor, on_delete=models.RESTRICT, db_column='vendor_id', related_name='unique_user_sketches')
+    registers = models.BinaryField()
+
+    class Meta:
+        db_table = 'stats_uq_users_sketches'
+        unique_together = ('month', 'vendor')
+
+
+class UniqueUserCountrySketch(models.Model):
+    """ Model to store HyperLogLog sketches of the unique user PIDs for each period and country """
+
+    month = MonthField()
+    country = models.CharField(max_length=5)
+    registers = models.BinaryField()
+
+    class Meta:
+        db_table = 'stats_uq_users_country_sketches'
+        unique_together = ('month', 'country')
+
+
+class UniqueUserId(models.Model):
+    """ Model to map each unique user PID to a dense integer id, used as its position in the unique users bitmaps """
+
+    id = models.AutoField(primary_key=True)
+    user_id = models.CharField(max_length=30, unique=True)
+    country = models.CharField(max_length=5, null=True, blank=True)
+
+    class Meta:
+        db_table = 'stats_uq_user_ids'
+
+
+class UniqueUserBitmap(models.Model):
+    """ Model to store compressed bitmaps of the unique user ids for each period and vendor """
+
+    month = MonthField()
+    vendor = models.ForeignKey(
+        Vendor, on_delete=models.RESTRICT, db_column='vendor_id', related_name='unique_user_bitmaps')
+    bitmap = models.BinaryField()
+
+    class Meta:
+        db_table = 'stats_uq_users_bitmaps'
+        unique_together = ('month', 'vendor')
+
+
 class UquStatsPeriod(models.Model):
     """ Model to store aggregated stats regarding unique users per month """
 
@@ -98,9 +161,11 @@ class TransactionStatus(models.Model):
 
 
 class UsageTransaction(models.Model):
+    # The table is partitioned by timestamp month and its primary key is (id, timestamp), see migration 0016.
+    # Rows by vendor are found with the (vendor, timestamp) index.
     timestamp = models.DateTimeField()
     vendor = models.ForeignKey(
-        Vendor, on_delete=models.RESTRICT, db_column='vendor_id', related_name='usage_transactions')
+        Vendor, on_delete=models.RESTRICT, db_column='vendor_id', related_name='usage_transactions', db_index=False)
     thread_id = models.CharField(max_length=12)
     transaction_id = models.BigIntegerField()
     transaction_status = models.ForeignKey(
@@ -112,6 +177,9 @@ class UsageTransaction(models.Model):
 
     class Meta:
         db_table = 'stats_usage_transactions'
+        indexes = [
+            models.Index(fields=['vendor', 'timestamp'], name='stats_usage_vendor_ts_idx'),
+        ]
 
     @property
     def period(self):
@@ -120,3 +188,28 @@ class UsageTransaction(models.Model):
     @property
     def date(self):
         return self.timestamp.strftime("%Y-%m-%d")
+
+
+class UsageTransactionLoad(models.Model):
+    """ Model to record which vendor input file was loaded to stats_usage_transactions for each period and vendor """
+
+    period = MonthField()
+    vendor = models.ForeignKey(
+        Vendor, on_delete=models.RESTRICT, db_column='vendor_id', related_name='usage_transaction_loads')
+    input_file = models.ForeignKey(
+        VendorInputFile, on_delete=models.SET_NULL, db_column='input_file_id', related_name='usage_transaction_loads',
+        null=True)
+    content_hash = models.CharField(max_length=16)
+    filters_fingerprint = models.CharField(max_length=16, default='')
+    loaded_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'stats_usage_transaction_loads'
+        unique_together = ('period', 'vendor')
+
+    def is_loaded(self, input_file, content_hash: str, filters_fingerprint: str) -> bool:
+        """ Returns True if the given input file with the given content hash is the one that was loaded
+            and its transactions were mapped with the same service filters
+        """
+        return self.input_file_id == input_file.id and self.content_hash == content_hash \
+            and self.filters_fingerprint == filters_fingerprint
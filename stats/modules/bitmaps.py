@@ -0,0 +1,186 @@
+from typing import Dict, Iterable
+import numpy as np
+import struct
+
+
+class Bitmap:
+    """ A compressed bitmap of unsigned 32-bit integers following the Roaring bitmap layout.
+        The integers are split in chunks by their high 16 bits. Each chunk is stored in a container which is
+        either a sorted array of the low 16 bits (up to ARRAY_MAX_SIZE values) or a bitset of 65536 bits.
+    """
+
+    ARRAY_MAX_SIZE = 4096
+    _BITSET_WORDS = 1024
+    _ARRAY, _BITSET = 0, 1
+    _HEADER = struct.Struct('<I')
+    _CONTAINER_HEADER = struct.Struct('<HBI')
+    _POPCOUNT = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint16)
+
+    def __init__(self, containers: Dict[int, np.ndarray] = None) -> None:
+        self.containers = containers if containers is not None else dict()
+
+    @classmethod
+    def from_ids(cls, ids: Iterable[int]) -> 'Bitmap':
+        """ Returns a Bitmap with the given integers """
+
+        ids = np.unique(np.asarray(ids if isinstance(ids, np.ndarray) else list(ids), dtype=np.uint32))
+        high = ids >> np.uint32(16)
+        low = (ids & np.uint32(0xFFFF)).astype(np.uint16)
+
+        containers = dict()
+        keys, starts = np.unique(high, return_index=True)
+        ends = np.append(starts[1:], len(ids))
+        for key, start, end in zip(keys, starts, ends):
+            containers[int(key)] = cls._container(low[start:end])
+        return cls(containers)
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> 'Bitmap':
+        """ Returns a Bitmap serialized with to_bytes """
+
+        data = bytes(data)
+        (number_of_containers,) = cls._HEADER.unpack_from(data, 0)
+        offset = cls._HEADER.size
+        containers = dict()
+        for _ in range(number_of_containers):
+            key, container_type, size = cls._CONTAINER_HEADER.unpack_from(data, offset)
+            offset += cls._CONTAINER_HEADER.size
+            dtype = np.uint16 if container_type == cls._ARRAY else np.uint64
+            containers[key] = np.frombuffer(data, dtype=dtype, count=size, offset=offset).copy()
+            offset += size * np.dtype(dtype).itemsize
+        return cls(containers)
+
+    @classmethod
+    def union_all(cls, bitmaps: Iterable['Bitmap']) -> 'Bitmap':
+        """ Returns the union of many bitmaps. Containers are accumulated as bitsets and compressed once at the end. """
+
+        bitsets = dict()
+        for bitmap in bitmaps:
+            for key, container in bitmap.containers.items():
+                bitset = bitsets.get(key)
+                if bitset is None:
+                    bitset = bitsets[key] = np.zeros(cls._BITSET_WORDS, dtype=np.uint64)
+                if cls._is_bitset(container):
+                    bitset |= container
+                else:
+                    np.bitwise_or.at(bitset, container >> 6, np.uint64(1) << (container & 63).astype(np.uint64))
+        return cls({key: cls._compress(bitset) for key, bitset in bitsets.items()})
+
+    def to_bytes(self) -> bytes:
+        """ Returns the bitmap serialized as bytes """
+
+        parts = [self._HEADER.pack(len(self.containers))]
+        for key in sorted(self.containers):
+            container = self.containers[key]
+            container_type = self._BITSET if self._is_bitset(container) else self._ARRAY
+            parts.append(self._CONTAINER_HEADER.pack(key, container_type, len(container)))
+            parts.append(container.tobytes())
+        return b''.join(parts)
+
+    def to_ids(self) -> np.ndarray:
+        """ Returns a sorted array with the integers in the bitmap """
+
+        ids = [(np.uint32(key) << np.uint32(16)) | self._to_array(container).astype(np.uint32)
+               for key, container in sorted(self.containers.items())]
+        return np.concatenate(ids) if ids else np.zeros(0, dtype=np.uint32)
+
+    def count(self) -> int:
+        """ Returns the number of integers in the bitmap """
+        return sum(self._count(container) for container in self.containers.values())
+
+    def __len__(self) -> int:
+        return self.count()
+
+    def __or__(self, other: 'Bitmap') -> 'Bitmap':
+        containers = dict(self.containers)
+        for key, container in other.containers.items():
+            own = containers.get(key)
+            containers[key] = container if own is None else self._union(own, container)
+        return Bitmap(containers)
+
+    def __and__(self, other: 'Bitmap') -> 'Bitmap':
+        containers = dict()
+        for key, container in self.containers.items():
+            other_container = other.containers.get(key)
+            if other_container is None:
+                continue
+            container = self._intersection(container, other_container)
+            if len(container):
+                containers[key] = container
+        return Bitmap(containers)
+
+    def __sub__(self, other: 'Bitmap') -> 'Bitmap':
+        """ Returns the integers in this bitmap which are not in the other one (AND NOT) """
+
+        containers = dict()
+        for key, container in self.containers.items():
+            other_container = other.containers.get(key)
+            if other_container is not None:
+                container = self._difference(container, other_container)
+            if len(container):
+                containers[key] = container
+        return Bitmap(containers)
+
+    @classmethod
+    def _container(cls, values: np.ndarray) -> np.ndarray:
+        """ Returns a container for sorted unique low 16 bits values """
+
+        if len(values) <= cls.ARRAY_MAX_SIZE:
+            return values.astype(np.uint16)
+        return cls._to_bitset(values)
+
+    @classmethod
+    def _compress(cls, bitset: np.ndarray) -> np.ndarray:
+        """ Converts a bitset to an array container if it has few values """
+
+        if cls._count(bitset) <= cls.ARRAY_MAX_SIZE:
+            return cls._to_array(bitset)
+        return bitset
+
+    @classmethod
+    def _count(cls, container: np.ndarray) -> int:
+        if cls._is_bitset(container):
+            return int(cls._POPCOUNT[container.view(np.uint8)].sum())
+        return len(container)
+
+    @staticmethod
+    def _is_bitset(container: np.ndarray) -> bool:
+        return container.dtype == np.uint64
+
+    @classmethod
+    def _to_array(cls, container: np.ndarray) -> np.ndarray:
+        if not cls._is_bitset(container):
+            return container
+        bits = np.unpackbits(container.view(np.uint8), bitorder='little')
+        return np.flatnonzero(bits).astype(np.uint16)
+
+    @classmethod
+    def _to_bitset(cls, container: np.ndarray) -> np.ndarray:
+        if cls._is_bitset(container):
+            return container
+        bits = np.zeros(cls._BITSET_WORDS * 64, dtype=bool)
+        bits[container] = True
+        return np.packbits(bits, bitorder='little').view(np.uint64)
+
+    @classmethod
+    def _union(cls, a: np.ndarray, b: np.ndarray) -> np.ndarray:
+        if not cls._is_bitset(a) and not cls._is_bitset(b):
+            return cls._container(np.union1d(a, b))
+        return cls._to_bitset(a) | cls._to_bitset(b)
+
+    @classmethod
+    def _intersection(cls, a: np.ndarray, b: np.ndarray) -> np.ndarray:
+        if not cls._is_bitset(a) and not cls._is_bitset(b):
+            return np.intersect1d(a, b, assume_unique=True).astype(np.uint16)
+        if not cls._is_bitset(a) or not cls._is_bitset(b):
+            array, bitset = (a, b) if not cls._is_bitset(a) else (b, a)
+            return array[np.isin(array, cls._to_array(bitset), assume_unique=True)]
+        return cls._compress(a & b)
+
+    @classmethod
+    def _difference(cls, a: np.ndarray, b: np.ndarray) -> np.ndarray:
+        if not cls._is_bitset(a) and not cls._is_bitset(b):
+            return np.setdiff1d(a, b, assume_unique=True).astype(np.uint16)
+        if not cls._is_bitset(a):
+            return a[~np.isin(a, cls._to_array(b), assume_unique=True)]
+        return cls._compress(a & ~cls._to_bitset(b))
@@ -4,8 +4,8 @@ from services.modules import FiltersMixin
 
 from ..models import UsageStats, Vendor
 
-from typing import Tuple, Union
-from collections import namedtuple
+from typing import Dict, Tuple, Union, Iterator
+from collections import namedtuple, Counter
 from pandas import DataFrame
 
 import logging
@@ -21,46 +21,77 @@ class BaseServicesMapper(FiltersMixin, InputFilesMixin, ServiceUsageMixin):
         self.service_filters = self.load_all_vendor_service_filters()  # From FilterMixin
         self.vendor_statuses = self._get_vendor_statuses()
 
-    def map_service_usage(self, input_file, skip_status_five=True) -> Tuple[int, Union[None, MappedTransactions]]:
+    def map_service_usage(self, input_file, skip_status_five=True, gen_transactions=True) \
+            -> Tuple[int, Union[None, MappedTransactions]]:
         """ Reads the input file and maps used services
+            :param input_file: VendorInputFile to be mapped
+            :param skip_status_five: if True will remove rows where Status field equals 5
+            :param gen_transactions: if False only the service_id column of the dataframe is mapped
             :returns tuple: Tuple[int, Union[None, MappedTransactions]]
         """
 
         try:
-            period, vendor_id = input_file.period, input_file.vendor_id
-            logger.debug(f"Starting mapping of usage data for account {vendor_id} for {period}.")
+            mapped_data = None
+            for mapped_data in self.iter_service_usage(input_file, skip_status_five, gen_transactions):
+                pass
 
-            # Load dataframe and convert all numbers
-            logger.debug(f"Loading transactions for account {vendor_id} for {period}.")
-            df = self.load_data_for_service_usage(input_file.file.path, skip_status_five)  # FromInputMixin
-            if df is None:
-                logger.info(f'Account: {vendor_id}, period: {period}, return: No transactions')
-                return 3, None
+            if mapped_data is None:
+                return self.get_mapping_status(input_file, False), None
+            return self.get_mapping_status(input_file, True, mapped_data.fully_mapped), mapped_data
 
-            # Load service filter groups
-            logger.debug(f"Loading service filters.")
-            service_filters = self.service_filters.get(vendor_id, None)
+        except Exception as e:
+            logger.error("Error: %s", e)
+            raise
+
+    def iter_service_usage(self, input_file, skip_status_five=True, gen_transactions=True, chunksize=None) \
+            -> Iterator[MappedTransactions]:
+        """ Reads the input file in chunks and maps used services of each chunk.
+            Use get_mapping_status to get the status of the mapping after all chunks are consumed.
+            :param input_file: VendorInputFile to be mapped
+            :param skip_status_five: if True will remove rows where Status field equals 5
+            :param gen_transactions: if False only the service_id column of the dataframe is mapped
+            :param chunksize: number of rows per chunk; if None the whole file is mapped at once
+        """
 
+        period, vendor_id = input_file.period, input_file.vendor_id
+        logger.debug(f"Starting mapping of usage data for account {vendor_id} for {period}.")
+
+        # Load service filter groups
+        logger.debug(f"Loading service filters.")
+        service_filters = self.service_filters.get(vendor_id, None)
+
+        # Load dataframe and convert all numbers
+        logger.debug(f"Loading transactions for account {vendor_id} for {period}.")
+        chunks = self.iter_data_for_service_usage(input_file.file.path, skip_status_five, chunksize)  # FromInputMixin
+        for df in chunks:
             # Map vendor services to dataframe
             logger.debug("Mapping transactions")
-            mapped_data = self.map_transactions(df, service_filters)  # from ServiceUsageMixin
+            yield self.map_transactions(df, service_filters, gen_transactions)  # from ServiceUsageMixin
 
-            if service_filters is None:
-                logger.warning(f'Account: {vendor_id}, period {period}, return: No services configured')
-                return 1, mapped_data
+    def get_mapping_status(self, input_file, has_transactions: bool, fully_mapped=False) -> int:
+        """ Returns the status of the mapping of an input file and updates the vendor reconciled status.
+            :param input_file: VendorInputFile that was mapped
+            :param has_transactions: False if the input file contains no transactions
+            :param fully_mapped: True if all transactions of the input file were mapped
+        """
 
-            # Update vendor status
-            self._update_vendor_is_reconciled(vendor_id, mapped_data.fully_mapped)
-            if not mapped_data.fully_mapped:
-                logger.warning(f'Account: {vendor_id}, period {period}, return: Some transactions could not be mapped')
-                return 4, mapped_data
+        period, vendor_id = input_file.period, input_file.vendor_id
+        if not has_transactions:
+            logger.info(f'Account: {vendor_id}, period: {period}, return: No transactions')
+            return 3
 
-            logger.info(f'Account: {vendor_id}, period {period}, return: All transactions were mapped')
-            return 0, mapped_data
+        if self.service_filters.get(vendor_id, None) is None:
+            logger.warning(f'Account: {vendor_id}, period {period}, return: No services configured')
+            return 1
 
-        except Exception as e:
-            logger.error("Error: %s", e)
-            raise
+        # Update vendor status
+        self._update_vendor_is_reconciled(vendor_id, fully_mapped)
+        if not fully_mapped:
+            logger.warning(f'Account: {vendor_id}, period {period}, return: Some transactions could not be mapped')
+            return 4
+
+        logger.info(f'Account: {vendor_id}, period {period}, return: All transactions were mapped')
+        return 0
 
     def _update_vendor_is_reconciled(self, vendor_id, reconciled_status=False):
         """ Updates the reconciled status of a Vendor object """
@@ -100,55 +131,61 @@ class ServiceUsageCalculator(BaseServicesMapper):
     _LEGAL_PERSONS_SERVICE_ID = 36
     _UNIQUE_USERS_SERVICE_ID = 32
 
-    def save_service_usage_period_vendor(self, input_file, skip_status_five=True):
-        """ Calculates and saves service usage """
+    def save_service_usage_period_vendor(self, input_file, skip_status_five=True, chunksize=None):
+        """ Calculates and saves service usage.
+            If chunksize is provided the input file is processed in chunks and only the counters are kept in memory.
+            The mapped services of the rows are written to their sidecar file chunk by chunk.
+        """
 
+        mapping_writer = None
         try:
             period, vendor_id = input_file.period, input_file.vendor_id
             logger.debug(f'Starting usage calculations for account {vendor_id} for {period}')
+            count_unique_users = VendorService.objects.filter(
+                vendor_id=vendor_id, service_id=self._UNIQUE_USERS_SERVICE_ID).exists()
+
+            # Keep the mapped services of each row to be reused when the report details are generated
+            service_filters = self.service_filters.get(vendor_id, None)
+            if service_filters:
+                mapping_writer = self.open_mapped_services_writer(
+                    input_file.file.path, self.get_filters_fingerprint(service_filters))
 
+            # Load transactions, map vendor services and count the usage in each chunk
             logger.debug(f'Mapping usage data')
-            # Load transactions and map vendor services
-            status, mapped_data = self.map_service_usage(input_file, skip_status_five)
+            has_transactions, fully_mapped, has_bio = False, True, False
+            service_counts, bio_threads, unique_users = Counter(), set(), set()
+            for mapped_data in self.iter_service_usage(
+                    input_file, skip_status_five, gen_transactions=False, chunksize=chunksize):
+                has_transactions = True
+                fully_mapped = fully_mapped and mapped_data.fully_mapped
+                df = mapped_data.dataframe
+
+                # Get transaction based stats
+                service_counts.update(df.service_id.value_counts().to_dict())
+                if mapping_writer is not None:
+                    mapping_writer.append(df.index, df.service_id)
+
+                # Collect values for aggregation based stats
+                if "Bio required" in df.columns:
+                    has_bio = True
+                    bio_threads.update(df.loc[df["Bio required"] == 'yes', "ThreadID"].unique())
+                if count_unique_users:
+                    unique_users.update(df["PID receiver"].dropna().unique())
+
+            if mapping_writer is not None and has_transactions:
+                mapping_writer.save()
+
+            status = self.get_mapping_status(input_file, has_transactions, fully_mapped)
             if status != 0:
                 return status
 
-            # Get transaction based stats
-            df = mapped_data.dataframe
-            res = df.service_id.value_counts()
-            data = [(k, v) for k, v in res.items() if v is not None]
-
-            # Update calculations for Legal Person eID (type 19)
-            if data:
-                logger.debug(f'Calculating legal person eID usages')
-                for record in data:
-                    service_id, count = record
-                    if service_id == self._LEGAL_PERSONS_SERVICE_ID:
-                        data.remove(record)
-                        data.append((service_id, count // 2))
-                        break
-
-            # Get aggregation based stats
-            if data and "Bio required" in df.columns:
-                logger.debug("Calculating BioID usage")
-                df_bio = df[df["Bio required"] == 'yes'][["ThreadID"]].copy()
-                df_bio = df_bio.drop_duplicates()
-                n = len(df_bio)
-                if n > 0:
-                    data.append((self._BIO_AUTH_SERVICE_ID, n))
-
-            # Add unique users where required
-            if VendorService.objects.filter(vendor_id=vendor_id, service_id=32).exists():
-                logger.debug("Calculating unique users stats")
-                n = df["PID receiver"].dropna().nunique()
-                if n > 0:
-                    data.append((self._UNIQUE_USERS_SERVICE_ID, n))
+            bio_count = len(bio_threads) if has_bio else None
+            unique_users_count = len(unique_users) if count_unique_users else None
+            data = self._get_usage_data(service_counts, bio_count, unique_users_count)
 
             # Save usage stats
             logger.debug("Saving usage stats")
-            for el in data:
-                service_id, unit_count = el
-                self._save_service_usage(period, vendor_id, service_id, unit_count)
+            self._save_service_usage(period, vendor_id, data)
             logger.info(f'vendor_id: {vendor_id}, period_id: {period}, return : Complete')
             return 0
 
@@ -156,20 +193,56 @@ class ServiceUsageCalculator(BaseServicesMapper):
             logger.error("Error: %s", e)
             raise
 
+        finally:
+            if mapping_writer is not None:
+                mapping_writer.close()
+
+    @classmethod
+    def _get_usage_data(cls, service_counts: dict, bio_count=None, unique_users_count=None) -> Dict[int, int]:
+        """ Returns the usage of each service given the count of transactions mapped to each service.
+            The aggregation based stats replace the transaction count of their services.
+            :param service_counts: {service_id: count} of the mapped transactions
+            :param bio_count: number of threads requiring BioID or None if the input file has no such column
+            :param unique_users_count: number of unique users or None if they are not counted for the vendor
+            :returns : {service_id: unit_count} dictionary
+        """
+
+        data = dict(service_counts)
+
+        # Update calculations for Legal Person eID (type 19)
+        if cls._LEGAL_PERSONS_SERVICE_ID in data:
+            logger.debug('Calculating legal person eID usages')
+            data[cls._LEGAL_PERSONS_SERVICE_ID] //= 2
+
+        # Get aggregation based stats
+        if data and bio_count:
+            logger.debug("Calculating BioID usage")
+            data[cls._BIO_AUTH_SERVICE_ID] = bio_count
+
+        # Add unique users where required
+        if unique_users_count:
+            logger.debug("Calculating unique users stats")
+            data[cls._UNIQUE_USERS_SERVICE_ID] = unique_users_count
+        return data
+
     @staticmethod
-    def _save_service_usage(period: str, vendor_id: int, service_id: int, unit_count: int) -> None:
-        """ Saves or updates service usage statistics. """
+    def _save_service_usage(period: str, vendor_id: int, data: Dict[int, int]) -> None:
+        """ Saves or updates service usage statistics with a single insert.
+            :param period: period of the usage
+            :param vendor_id: vendor of the usage
+            :param data: {service_id: unit_count} dictionary, each service is saved once
+        """
 
         try:
-            usage = UsageStats.objects.get(period=period, vendor_id=vendor_id, service_id=service_id)
-            if usage.unit_count != unit_count:
-                usage.unit_count = unit_count
-                usage.save()
-
-        except UsageStats.DoesNotExist:
-            usage = UsageStats.objects.create(
-                period=period, vendor_id=vendor_id, service_id=service_id, unit_count=unit_count)
-            usage.save()
+            records = [
+                UsageStats(period=period, vendor_id=vendor_id, service_id=service_id, unit_count=unit_count)
+                for service_id, unit_count in data.items()]
+            UsageStats.objects.bulk_create(
+                records,
+                update_conflicts=True,
+                unique_fields=['period', 'vendor', 'service'],
+                update_fields=['unit_count']
+            )
 
         except Exception as e:
             logger.error("Error: %s", e)
@@ -185,14 +258,14 @@ class UnreconciledTransactionsMapper(BaseServicesMapper):
 
         try:
             # Load input_file/s and map services
-            _, mapped_data = self.map_service_usage(input_file, skip_status_five)
+            _, mapped_data = self.map_service_usage(input_file, skip_status_five, gen_transactions=False)
             df = mapped_data.dataframe
 
             # Drop mapped rows and guess unmapped ones
             unmapped_df = df[df['service_id'].isna()][['Type', 'Status', 'Signing type', 'Cost']]\
                 .drop_duplicates().copy()
             service_filters = self.load_all_service_filters()
-            mapped_data = self.map_transactions(unmapped_df, service_filters)
+            mapped_data = self.map_transactions(unmapped_df, service_filters, gen_transactions=False)
 
             return mapped_data.dataframe
 
@@ -209,6 +282,8 @@ def res_result(res_id):
         1: 'No services configured',
         2: 'No input file',
         3: 'No transactions',
-        4: 'Not reconciled'
+        4: 'Not reconciled',
+        5: 'Failed',
+        6: 'Not changed'
     }
     return update_vendor_legend.get(res_id, 'Not defined')
@@ -0,0 +1,134 @@
+from typing import Iterable
+from pandas.util import hash_array
+
+import numpy as np
+
+
+class HyperLogLog:
+    """ A HyperLogLog sketch to estimate the number of distinct values.
+        Sketches of disjoint or overlapping sets can be merged to estimate the number of distinct values of their union.
+        The standard error of the estimate is 1.04 / sqrt(2 ** precision), i.e. 0.81% for the default precision.
+    """
+
+    DEFAULT_PRECISION = 14
+    _HASH_BITS = 64
+    _ALPHA_INF = 1 / (2 * np.log(2))
+
+    def __init__(self, precision=DEFAULT_PRECISION, registers: np.ndarray = None) -> None:
+        self.precision = precision
+        self.m = 1 << precision
+        if registers is None:
+            registers = np.zeros(self.m, dtype=np.uint8)
+        elif len(registers) != self.m:
+            raise ValueError(f'Expected {self.m} registers, got {len(registers)}')
+        self.registers = registers
+
+    @property
+    def relative_error(self) -> float:
+        """ Returns the standard error of the estimate relative to the number of distinct values """
+        return 1.04 / np.sqrt(self.m)
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> 'HyperLogLog':
+        """ Returns a HyperLogLog from registers serialized with to_bytes """
+
+        registers = np.frombuffer(bytes(data), dtype=np.uint8).copy()
+        return cls(int(np.log2(len(registers))), registers)
+
+    @classmethod
+    def from_values(cls, values: Iterable[str], precision=DEFAULT_PRECISION) -> 'HyperLogLog':
+        """ Returns a HyperLogLog with the given values added """
+
+        sketch = cls(precision)
+        sketch.add(values)
+        return sketch
+
+    def to_bytes(self) -> bytes:
+        """ Returns the registers serialized as bytes """
+        return self.registers.tobytes()
+
+    def add(self, values: Iterable[str]) -> None:
+        """ Adds values to the sketch """
+
+        values = np.asarray(list(values) if not isinstance(values, np.ndarray) else values, dtype=object)
+        if len(values) == 0:
+            return
+
+        # The first precision bits of the hash select the register, the rest are used to count the leading zeros
+        hashes = hash_array(values, categorize=False)
+        index = (hashes >> np.uint64(self._HASH_BITS - self.precision)).astype(np.intp)
+        remainder = hashes << np.uint64(self.precision)
+        max_rank = self._HASH_BITS - self.precision + 1
+        rank = np.minimum(self._HASH_BITS - self._bit_length(remainder) + 1, max_rank).astype(np.uint8)
+        np.maximum.at(self.registers, index, rank)
+
+    def merge(self, other: 'HyperLogLog') -> 'HyperLogLog':
+        """ Merges another sketch into this one, so it represents the union of both sets """
+
+        if other.precision != self.precision:
+            raise ValueError('Cannot merge sketches with different precision')
+        np.maximum(self.registers, other.registers, out=self.registers)
+        return self
+
+    def count(self) -> int:
+        """ Returns the estimated number of distinct values added to the sketch.
+            Uses the improved estimator of O. Ertl, "New cardinality estimation algorithms for HyperLogLog sketches",
+            which corrects the bias of the raw estimate over the whole range of cardinalities, without the switch to
+            linear counting or empirical bias tables.
+        """
+
+        m = self.m
+        q = self._HASH_BITS - self.precision
+        histogram = np.bincount(self.registers, minlength=q + 2)
+
+        z = m * self._tau((m - histogram[q + 1]) / m)
+        for k in range(q, 0, -1):
+            z = (z + histogram[k]) * 0.5
+        z += m * self._sigma(histogram[0] / m)
+        return int(round(self._ALPHA_INF * m * m / z))
+
+    @staticmethod
+    def _sigma(x: float) -> float:
+        """ Returns x + sum(x ** (2 ** k) * 2 ** (k - 1)) for k >= 1, the correction for the empty registers """
+
+        if x == 1:
+            return float('inf')
+        y = 1.0
+        z = x
+        while True:
+            x *= x
+            z_prev = z
+            z += x * y
+            y += y
+            if z == z_prev:
+                return z
+
+    @staticmethod
+    def _tau(x: float) -> float:
+        """ Returns (1 - x - sum((1 - x ** (2 ** -k)) ** 2 * 2 ** -k)) / 3 for k >= 1, the correction for the
+            registers with the maximum rank
+        """
+
+        if x == 0 or x == 1:
+            return 0.0
+        y = 1.0
+        z = 1 - x
+        while True:
+            x = np.sqrt(x)
+            z_prev = z
+            y *= 0.5
+            z -= (1 - x) ** 2 * y
+            if z == z_prev:
+                return z / 3
+
+    @staticmethod
+    def _bit_length(values: np.ndarray) -> np.ndarray:
+        """ Returns the number of bits needed to represent each of the uint64 values """
+
+        def bit_length_32(x):
+            # Integers below 2 ** 32 are exact as float64, so the exponent is the bit length
+            return np.frexp(x.astype(np.float64))[1]
+
+        high = values >> np.uint64(32)
+        low = values & np.uint64(0xFFFFFFFF)
+        return np.where(high > 0, 32 + bit_length_32(high), bit_length_32(low))
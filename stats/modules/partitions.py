@@ -0,0 +1,91 @@
+from django.db import connection, transaction
+
+from datetime import datetime
+from dateutil.relativedelta import relativedelta
+from typing import List, Tuple
+import logging
+
+logger = logging.getLogger(f'et_billing.{__name__}')
+
+PARENT_TABLE = 'stats_usage_transactions'
+DEFAULT_PARTITION = f'{PARENT_TABLE}_default'
+
+
+def get_partition_name(period: str) -> str:
+    """ Returns the name of the stats_usage_transactions partition for a given period in format yyyy-mm """
+
+    year, month = period.split('-')
+    return f'{PARENT_TABLE}_p{year}_{month}'
+
+
+def get_partition_bounds(period: str) -> Tuple[str, str]:
+    """ Returns the lower (inclusive) and upper (exclusive) timestamp bounds of a given period """
+
+    period_start = datetime.strptime(period, '%Y-%m')
+    period_end = period_start + relativedelta(months=1)
+    return period_start.strftime('%Y-%m-%d'), period_end.strftime('%Y-%m-%d')
+
+
+def list_partitions() -> List[str]:
+    """ Returns the names of all partitions of stats_usage_transactions """
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+            "WHERE i.inhparent = %s::regclass ORDER BY c.relname",
+            [PARENT_TABLE]
+        )
+        return [row[0] for row in cursor.fetchall()]
+
+
+def ensure_partition(period: str) -> str:
+    """ Creates the partition for a given period if it does not exist.
+        Rows of the period that are stored in the default partition are moved to the new partition.
+        Returns the name of the partition.
+    """
+
+    name = get_partition_name(period)
+    lower, upper = get_partition_bounds(period)
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute("SELECT to_regclass(%s)", [name])
+        if cursor.fetchone()[0] is not None:
+            return name
+
+        logger.info(f'Creating partition {name}')
+        cursor.execute(f'CREATE TABLE {name} (LIKE {PARENT_TABLE} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)')
+        cursor.execute(
+            f'WITH moved AS (DELETE FROM {DEFAULT_PARTITION} WHERE timestamp >= %s AND timestamp < %s RETURNING *) '
+            f'INSERT INTO {name} SELECT * FROM moved',
+            [lower, upper]
+        )
+        cursor.execute(f'ALTER TABLE {PARENT_TABLE} ATTACH PARTITION {name} FOR VALUES FROM (%s) TO (%s)',
+                       [lower, upper])
+    return name
+
+
+def truncate_partition(period: str) -> None:
+    """ Removes all transactions of a given period by truncating its partition """
+
+    name = ensure_partition(period)
+    logger.info(f'Truncating partition {name}')
+    with connection.cursor() as cursor:
+        cursor.execute(f'TRUNCATE TABLE {name}')
+
+
+def detach_partition(period: str, drop=False) -> None:
+    """ Detaches the partition of a given period from stats_usage_transactions.
+        :param period: period in format yyyy-mm
+        :param drop: if True the detached partition is dropped together with its data
+    """
+
+    name = get_partition_name(period)
+    if name not in list_partitions():
+        logger.warning(f'Partition {name} does not exist')
+        return
+
+    logger.info(f'Detaching partition {name}')
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(f'ALTER TABLE {PARENT_TABLE} DETACH PARTITION {name}')
+        if drop:
+            logger.info(f'Dropping partition {name}')
+            cursor.execute(f'DROP TABLE {name}')
@@ -1,20 +1,48 @@
 from celery import shared_task
 from celery_tasks.models import FileProcessingTask
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, wait, FIRST_COMPLETED
 from datetime import datetime as dt
+from django.conf import settings
+from django.db import connection, connections, transaction
+from multiprocessing import current_process
 
 from shared.modules import InputFilesMixin
 from vendors.models import VendorInputFile
 
-from ..models import Client, Vendor
 from ..models import UniqueUser, UquStatsPeriodClient, UquStatsPeriodVendor, UquStatsPeriod, UquStatsPeriodCountries
+from ..models import UniqueUserLoad, UniqueUserSketch, UniqueUserCountrySketch, UniqueUserId, UniqueUserBitmap
+from .bitmaps import Bitmap
+from .hll import HyperLogLog
+
+from collections import namedtuple
+from itertools import groupby, islice
+from operator import itemgetter
+from pandas import DataFrame
+from typing import Iterator, List, Tuple, Union
 
 import logging
+import numpy as np
 
 logger = logging.getLogger(f'et_billing.{__name__}')
+UniqueUsersCount = namedtuple('UniqueUsersCount', ['count', 'is_estimate'])
+
+
+def get_uqu(client_id=None, start_period=None, end_period=None, exact=True) -> UniqueUsersCount:
+    """ Returns the number of unique users based on input options.
+        If exact is False the number is estimated from the HyperLogLog sketches, see get_uqu_estimate.
+        Exact numbers are counted from the unique users bitmaps if they are complete, see get_uqu_bitmap.
+        :returns : named tuple ("count": int, "is_estimate": bool), is_estimate is False if the number is exact
+    """
 
+    if not exact:
+        estimate = get_uqu_estimate(client_id, start_period, end_period)
+        if estimate is not None:
+            return UniqueUsersCount(count=estimate, is_estimate=True)
+        logger.debug('Unique users sketches do not cover the selection. Falling back to exact count')
 
-def get_uqu(client_id=None, start_period=None, end_period=None) -> int:
-    """ Returns a QuerySet object with data based on input options """
+    if has_uqu_bitmaps():
+        return UniqueUsersCount(count=get_uqu_bitmap(client_id, start_period, end_period).count(), is_estimate=False)
+    logger.debug('Unique users bitmaps are not complete. Counting distinct user ids')
 
     # QuerySets for specific client_id
     if client_id is None:
@@ -41,7 +69,77 @@ def get_uqu(client_id=None, start_period=None, end_period=None) -> int:
                 .filter(vendor__client__client_id=client_id, month__range=[start_period, end_period]) \
                 .values_list('user_id', flat=True).distinct()
 
-    return len(uqu_data)
+    return UniqueUsersCount(count=len(uqu_data), is_estimate=False)
+
+
+def get_uqu_estimate(client_id=None, start_period=None, end_period=None, country=None) -> Union[int, None]:
+    """ Returns the estimated number of unique users by merging the HyperLogLog sketches of the selected
+        vendors or country and periods, or None if the sketches do not cover every period and vendor with unique
+        users in the selection.
+        The standard error of the estimate is HyperLogLog.relative_error.
+    """
+
+    if country is not None and client_id is not None:
+        raise ValueError('Unique users can be estimated either by client or by country')
+
+    # Country sketches are updated together with the vendor sketches, so both cover the same periods and vendors
+    loads = UniqueUserLoad.objects.all()
+    vendor_sketches = UniqueUserSketch.objects.all()
+    if client_id is not None:
+        loads = loads.filter(vendor__client__client_id=client_id)
+        vendor_sketches = vendor_sketches.filter(vendor__client__client_id=client_id)
+    if start_period is not None:
+        loads = loads.filter(month__range=[start_period, end_period or start_period])
+        vendor_sketches = vendor_sketches.filter(month__range=[start_period, end_period or start_period])
+    if vendor_sketches.count() != loads.count():
+        return None
+
+    if country is not None:
+        sketches = UniqueUserCountrySketch.objects.filter(country=country)
+        if start_period is not None:
+            sketches = sketches.filter(month__range=[start_period, end_period or start_period])
+    else:
+        sketches = vendor_sketches
+
+    sketch = None
+    for registers in sketches.values_list('registers', flat=True).iterator():
+        if sketch is None:
+            sketch = HyperLogLog.from_bytes(registers)
+        else:
+            sketch.merge(HyperLogLog.from_bytes(registers))
+    return sketch.count() if sketch is not None else None
+
+
+def get_uqu_bitmap(client_id=None, start_period=None, end_period=None, country=None) -> Bitmap:
+    """ Returns a bitmap with the ids of the unique users of the selected vendors and periods,
+        optionally limited to the users of a country. The ids are mapped to user_id by UniqueUserId.
+    """
+
+    bitmaps = UniqueUserBitmap.objects.all()
+    if client_id is not None:
+        bitmaps = bitmaps.filter(vendor__client__client_id=client_id)
+    if start_period is not None:
+        bitmaps = bitmaps.filter(month__range=[start_period, end_period or start_period])
+
+    bitmap = Bitmap.union_all(Bitmap.from_bytes(el) for el in bitmaps.values_list('bitmap', flat=True).iterator())
+    if country is not None:
+        bitmap = bitmap & Bitmap.from_ids(UniqueUserId.objects.filter(country=country).values_list('id', flat=True))
+    return bitmap
+
+
+def get_uqu_country_masks() -> dict:
+    """ Returns a dictionary with a bitmap of the ids of the users of each country """
+
+    user_ids = DataFrame(
+        UniqueUserId.objects.exclude(country=None).values_list('country', 'id'), columns=['country', 'id'])
+    return {country: Bitmap.from_ids(group['id'].values) for country, group in user_ids.groupby('country')}
+
+
+def has_uqu_bitmaps() -> bool:
+    """ Returns True if there is a unique users bitmap for each period and vendor with unique users """
+
+    loads_count = UniqueUserLoad.objects.count()
+    return loads_count > 0 and UniqueUserBitmap.objects.count() == loads_count
 
 
 @shared_task(bind=True)
@@ -61,7 +159,7 @@ def store_uqu_celery(self):
     task_status.save()
 
     try:
-        store_unique_users()
+        store_unique_users(workers=settings.UNIQUE_USERS_WORKERS)
         task_status.processed_documents.extend([{
             'fileName': 'Saving data for unique users ',
             'resultCode': 0,
@@ -133,40 +231,45 @@ def store_uqu_celery(self):
         logger.info(f'Execution time: {execution_time}')
 
 
-def store_unique_users(purge_existing=False):
-    """ Store unique users at company level for all periods """
+def store_unique_users(purge_existing=False, workers=None, batch_size=5000):
+    """ Store unique users at company level for all periods
+        :param purge_existing: if True all existing unique users are deleted first
+        :param workers: number of processes reading the input files in parallel, None reads them one after another
+        :param batch_size: number of rows per insert statement
+    """
 
     logger.info('Starting storing of unique users')
-    mx = InputFilesMixin()
     retval = []
     dt_start = dt.now()
 
     # Clear all existing information
     if purge_existing:
+        UniqueUserLoad.objects.all().delete()
         UniqueUser.objects.all().delete()
 
-    # Get a query set with VendorInputFiles and list of already processed (period, vendor_id)
-    vendor_input_files = VendorInputFile.objects.filter(is_active=True).order_by('period', 'vendor_id')
-    uqu_data = list(UniqueUser.objects.values_list('month', 'vendor_id').distinct())
-
-    for input_file in vendor_input_files:
+    # Get the VendorInputFiles for the (period, vendor_id) pairs which are not processed yet
+    processed = set(UniqueUserLoad.objects.values_list('month', 'vendor_id'))
+    input_files = []
+    for input_file in VendorInputFile.objects.filter(is_active=True).order_by('period', 'vendor_id'):
+        key = (input_file.period, input_file.vendor_id)
+        if key not in processed:
+            processed.add(key)
+            input_files.append(input_file)
+    logger.debug(f'{len(input_files)} input files to process')
+
+    for input_file, unique_pids in _iter_unique_pids(input_files, workers):
         vendor_id, period = input_file.vendor_id, input_file.period
 
-        # If period and vendor are already processed then move to next file
-        if (period, vendor_id) in uqu_data:
+        if unique_pids is None:
+            retval.append(f'{input_file.file.path} - failed')
             continue
 
-        # Load unique users data
-        logger.debug(f'Getting unique users for vendor {vendor_id} for {period}')
-        unique_pids = mx.load_data_for_uq_countries(input_file.file.path)
-        unique_pids = [(el[0], el[1]) for el in unique_pids if el[1] != '']
-
         # Save unique users data
         if len(unique_pids) == 0:
-            logger.debug('No unique users data')
+            logger.debug(f'No unique users data for vendor {vendor_id} for {period}')
             continue
 
-        logger.debug(f'Found {len(unique_pids)} unique users')
+        logger.debug(f'Found {len(unique_pids)} unique users for vendor {vendor_id} for {period}')
         unique_users = [
             UniqueUser(
                 month=period,
@@ -174,281 +277,329 @@ def store_unique_users(purge_existing=False):
                 user_id=f'{country}{pid}',
                 country=country)
             for country, pid in unique_pids]
-        UniqueUser.objects.bulk_create(unique_users)
+        with transaction.atomic():
+            UniqueUser.objects.bulk_create(unique_users, batch_size=batch_size, ignore_conflicts=True)
+            UniqueUserLoad.objects.update_or_create(
+                month=period, vendor_id=vendor_id, defaults={'users_count': len(unique_users)})
         logger.debug('Data saved')
 
         retval.append(f'{input_file.file.path} - processed')
 
+    # Build sketches and bitmaps of the new unique users
+    store_uqu_sketches(purge_existing)
+    store_uqu_bitmaps(purge_existing)
+
     processing_time = dt.now() - dt_start
     logger.info(f'Execution time: {processing_time}')
 
 
-def store_uqu_clients(purge_existing=False):
-    """ Store unique users data per client per period """
+def _iter_unique_pids(input_files: list, workers=None) -> Iterator[Tuple[VendorInputFile, Union[list, None]]]:
+    """ Yields each input file with its unique (country, pid) pairs, or None if the file could not be read.
+        If workers is more than 1 the files are read by a pool of processes, or of threads when running inside a
+        daemon process (e.g. a Celery worker) which is not allowed to have children. At most two files per worker
+        are read ahead, so memory is bounded while the results are saved.
+    """
+
+    if workers is None or workers <= 1:
+        for input_file in input_files:
+            yield input_file, _load_unique_pids(input_file.file.path)
+        return
+
+    if current_process().daemon:
+        executor_class = ThreadPoolExecutor
+    else:
+        # Forked processes must not share the open database connections
+        connections.close_all()
+        executor_class = ProcessPoolExecutor
+
+    input_files = iter(input_files)
+    with executor_class(max_workers=workers) as executor:
+        pending = {executor.submit(_load_unique_pids, el.file.path): el for el in islice(input_files, 2 * workers)}
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield pending.pop(future), future.result()
+                input_file = next(input_files, None)
+                if input_file is not None:
+                    pending[executor.submit(_load_unique_pids, input_file.file.path)] = input_file
+
 
+def _load_unique_pids(filename: str) -> Union[List[Tuple[str, str]], None]:
+    """ Returns the unique (country, pid) pairs with a pid in an input file or None if the file could not be read """
+
+    try:
+        unique_pids = InputFilesMixin().load_data_for_uq_countries(filename)
+        return [(el[0], el[1]) for el in unique_pids if el[1] != '']
+    except Exception as err:
+        logger.warning(f'Unable to load unique users from {filename}: {err}')
+        return None
+
+
+def store_uqu_sketches(purge_existing=False) -> None:
+    """ Builds a HyperLogLog sketch for each period and vendor with unique users which has no sketch yet and merges
+        the same users into the sketches of their countries for the period.
+        :param purge_existing: if True all existing sketches are deleted and rebuilt
+    """
+
+    logger.info('Starting building of unique users sketches')
     dt_start = dt.now()
-    logger.info('Starting calculation of unique users per client per period')
 
     # Clear all existing information
     if purge_existing:
-        UquStatsPeriodClient.objects.all().delete()
-
-    # Get clients for which computation should be made
-    clients = Client.objects.filter(vendors__unique_users__isnull=False).distinct()
-
-    # Cycle through clients and compute
-    for client in clients:
-        logger.debug(f'Processing client: {client.client_id}')
-
-        # Get the vendors related to this client
-        vendors = list(Vendor.objects.filter(client=client).values_list('vendor_id', flat=True))
-
-        # Get the months for which there is already unique users data
-        uqu_data = list(UquStatsPeriodClient.objects
-                        .filter(client=client)
-                        .order_by('-period')
-                        .values_list('period', flat=True).distinct())
-
-        # Get the months for which data needs to be added
-        months = list(UniqueUser.objects
-                      .filter(vendor_id__in=vendors)
-                      .order_by('month')
-                      .values_list('month', flat=True).distinct())
-        months_to_process = [el for el in months if el not in uqu_data]
-
-        # Cycle through months and compute cumulative unique users
-        first_month = months[0]
-        prior_month = uqu_data[0] if uqu_data else first_month
-        for month in months_to_process:
-            # Try to skip calculations if there is 1 vendor per client and is already processed
-            if len(vendors) == 1 and UquStatsPeriodVendor.objects.filter(vendor_id=vendors[0], period=month).exists():
-                data = UquStatsPeriodVendor.objects.get(vendor_id=vendors[0], period=month)
-                cumulative, period_count, new_count = data.cumulative, data.uqu_month, data.uqu_new
-
-            else:
-                # Get cumulative unique users for the period from the start till current month
-                cumulative = len(UniqueUser.objects
-                                 .filter(vendor_id__in=vendors, month__range=[first_month, month])
-                                 .values_list('user_id', flat=True).distinct())
-
-                # Get the total unique users for the current month
-                period_count = len(UniqueUser.objects
-                                   .filter(vendor_id__in=vendors, month=month)
-                                   .values_list('user_id', flat=True).distinct())
-
-                # Calculate the number of unique users appeared for the first time in the current period
-                prior_count = 0
-                if month != first_month:
-                    prior_record = UquStatsPeriodClient.objects.get(period=prior_month, client=client)
-                    prior_count = prior_record.cumulative
-                new_count = cumulative - prior_count
-
-            # Save statistics
-            UquStatsPeriodClient.objects.create(
-                period=month,
-                client=client,
-                cumulative=cumulative,
-                uqu_month=period_count,
-                uqu_new=new_count
-            ).save()
-            prior_month = month
-            logger.debug(f'... {month} complete')
-
-        logger.info(f'Client {client.client_id} complete')
-
+        UniqueUserSketch.objects.all().delete()
+        UniqueUserCountrySketch.objects.all().delete()
+
+    # Get the (period, vendor_id) pairs which are not sketched yet
+    sketched = set(UniqueUserSketch.objects.values_list('month', 'vendor_id'))
+    pairs = UniqueUserLoad.objects.values_list('month', 'vendor_id').order_by('month', 'vendor_id')
+    pairs = [pair for pair in pairs if pair not in sketched]
+
+    for month, vendor_id in pairs:
+        logger.debug(f'Building unique users sketch for vendor {vendor_id} for {month}')
+        users = DataFrame(
+            UniqueUser.objects.filter(month=month, vendor_id=vendor_id).values_list('user_id', 'country'),
+            columns=['user_id', 'country'])
+
+        with transaction.atomic():
+            UniqueUserSketch.objects.create(
+                month=month,
+                vendor_id=vendor_id,
+                registers=HyperLogLog.from_values(users.user_id.values).to_bytes())
+
+            for country, country_users in users.dropna(subset=['country']).groupby('country'):
+                sketch = HyperLogLog.from_values(country_users.user_id.values)
+                country_sketch = UniqueUserCountrySketch.objects.select_for_update() \
+                    .filter(month=month, country=country).first()
+                if country_sketch is None:
+                    UniqueUserCountrySketch.objects.create(month=month, country=country, registers=sketch.to_bytes())
+                else:
+                    sketch.merge(HyperLogLog.from_bytes(country_sketch.registers))
+                    country_sketch.registers = sketch.to_bytes()
+                    country_sketch.save(update_fields=['registers'])
+
+    logger.info(f'Built {len(pairs)} sketches')
     execution_time = dt.now() - dt_start
     logger.info(f'Execution time: {execution_time}')
 
 
-def store_uqu_periods(purge_existing=False):
-    """ Store unique users data per period at company level """
-
+# New users get the next ids of the dictionary. Existing users are filtered out before the insert so
+# conflicts do not consume sequence values and the ids stay dense.
+_UQU_IDS_INSERT_SQL = """
+    INSERT INTO stats_uq_user_ids (user_id, country)
+    SELECT u.user_id, u.country
+    FROM stats_uq_users u
+    WHERE u.month = %s AND u.vendor_id = %s
+        AND NOT EXISTS (SELECT 1 FROM stats_uq_user_ids d WHERE d.user_id = u.user_id)
+    ORDER BY u.user_id
+    ON CONFLICT (user_id) DO NOTHING
+"""
+
+_UQU_IDS_SELECT_SQL = """
+    SELECT d.id
+    FROM stats_uq_users u
+    JOIN stats_uq_user_ids d ON d.user_id = u.user_id
+    WHERE u.month = %s AND u.vendor_id = %s
+"""
+
+
+def store_uqu_bitmaps(purge_existing=False) -> None:
+    """ Adds the unique users to the dense ids dictionary and builds a bitmap of their ids for each period and vendor
+        with unique users which has no bitmap yet.
+        :param purge_existing: if True the dictionary and all existing bitmaps are deleted and rebuilt
+    """
+
+    logger.info('Starting building of unique users bitmaps')
     dt_start = dt.now()
-    logger.info('Starting calculation of unique users per period')
 
-    # Clear all existing information
+    # Clear all existing information and restart the dense ids from 1
     if purge_existing:
-        UquStatsPeriod.objects.all().delete()
-
-    # Get the months for which there is already unique users data
-    uqu_data = list(UquStatsPeriod.objects
-                    .order_by('-period')
-                    .values_list('period', flat=True).distinct())
-
-    # Get the months for which data needs to be added
-    months = list(UniqueUser.objects.all()
-                  .order_by('month')
-                  .values_list('month', flat=True).distinct())
-    months_to_process = [el for el in months if el not in uqu_data]
-
-    # Cycle through months and compute cumulative unique users
-    first_month = months[0]
-    prior_month = uqu_data[0] if uqu_data else first_month
-    for month in months_to_process:
-        logger.info(f'Processing month: {month}')
-
-        # Get cumulative unique users for the period from the start till current month
-        cumulative = len(UniqueUser.objects.filter(month__range=[first_month, month])
-                         .values_list('user_id', flat=True).distinct())
-
-        # Get the total unique users for the current month
-        period_count = len(UniqueUser.objects.filter(month=month)
-                           .values_list('user_id', flat=True).distinct())
-
-        # Calculate the number of unique users appeared for the first time in the current period
-        prior_count = 0
-        if month != first_month:
-            prior_record = UquStatsPeriod.objects.get(period=prior_month)
-            prior_count = prior_record.cumulative
-        new_count = cumulative - prior_count
-
-        # Save statistics
-        UquStatsPeriod.objects.create(
-            period=month,
-            cumulative=cumulative,
-            uqu_month=period_count,
-            uqu_new=new_count
-        ).save()
-        prior_month = month
-        logger.info(f'{month} complete')
-
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'TRUNCATE {UniqueUserId._meta.db_table}, {UniqueUserBitmap._meta.db_table} RESTART IDENTITY')
+
+    # Get the (period, vendor_id) pairs which have no bitmap yet
+    indexed = set(UniqueUserBitmap.objects.values_list('month', 'vendor_id'))
+    pairs = UniqueUserLoad.objects.values_list('month', 'vendor_id').order_by('month', 'vendor_id')
+    pairs = [pair for pair in pairs if pair not in indexed]
+
+    for month, vendor_id in pairs:
+        logger.debug(f'Building unique users bitmap for vendor {vendor_id} for {month}')
+        params = [month.first_day(), vendor_id]
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(_UQU_IDS_INSERT_SQL, params)
+            cursor.execute(_UQU_IDS_SELECT_SQL, params)
+            ids = np.fromiter((row[0] for row in cursor.fetchall()), dtype=np.uint32)
+            UniqueUserBitmap.objects.create(month=month, vendor_id=vendor_id, bitmap=Bitmap.from_ids(ids).to_bytes())
+
+    logger.info(f'Built {len(pairs)} bitmaps')
     execution_time = dt.now() - dt_start
     logger.info(f'Execution time: {execution_time}')
 
 
+def store_uqu_clients(purge_existing=False):
+    """ Store unique users data per client per period """
+
+    logger.info('Starting calculation of unique users per client per period')
+    _store_uqu_stats(UquStatsPeriodClient, 'client', purge_existing)
+
+
+def store_uqu_periods(purge_existing=False):
+    """ Store unique users data per period at company level """
+
+    logger.info('Starting calculation of unique users per period')
+    _store_uqu_stats(UquStatsPeriod, None, purge_existing)
+
+
 def store_uqu_vendors(purge_existing=False):
     """ Store unique users data per vendor per period """
 
-    dt_start = dt.now()
     logger.info('Starting calculation of unique users per vendor per period')
+    _store_uqu_stats(UquStatsPeriodVendor, 'vendor', purge_existing)
 
-    # Clear all existing information
-    if purge_existing:
-        UquStatsPeriodVendor.objects.all().delete()
-
-    # Get vendors for which computation should be made
-    vendors = UniqueUser.objects.values_list('vendor_id', flat=True).distinct()
-
-    # Cycle through vendors and compute
-    for vendor_id in vendors:
-        logger.debug(f'Processing vendor: {vendor_id}')
-
-        # Get the months for which there is already unique users data
-        uqu_data = list(UquStatsPeriodVendor.objects
-                        .filter(vendor_id=vendor_id)
-                        .order_by('-period')
-                        .values_list('period', flat=True).distinct())
-
-        # Get the months for which data needs to be added
-        months = list(UniqueUser.objects
-                      .filter(vendor_id=vendor_id)
-                      .order_by('month')
-                      .values_list('month', flat=True).distinct())
-        months_to_process = [el for el in months if el not in uqu_data]
-
-        # Cycle through months and compute unique users
-        first_month = months[0]
-        prior_month = uqu_data[0] if uqu_data else first_month
-        for month in months_to_process:
-
-            # Get cumulative unique users for the period from the start till current month
-            cumulative = len(UniqueUser.objects
-                             .filter(vendor_id=vendor_id, month__range=[first_month, month])
-                             .values_list('user_id', flat=True).distinct())
-
-            # Get the total unique users for the current month
-            period_count = len(UniqueUser.objects
-                               .filter(vendor_id=vendor_id, month=month)
-                               .values_list('user_id', flat=True).distinct())
-
-            # Calculate the number of unique users appeared for the first time in the current period
-            prior_count = 0
-            if month != first_month:
-                prior_record = UquStatsPeriodVendor.objects.get(period=prior_month, vendor_id=vendor_id)
-                prior_count = prior_record.cumulative
-            new_count = cumulative - prior_count
-
-            # Save statistics
-            UquStatsPeriodVendor.objects.create(
-                period=month,
-                vendor_id=vendor_id,
-                cumulative=cumulative,
-                uqu_month=period_count,
-                uqu_new=new_count
-            ).save()
-            prior_month = month
-            logger.debug(f'... {month} complete')
 
-        logger.info(f'Vendor {vendor_id} complete')
+def store_uqu_countries(purge_existing=False):
+    """ Store unique users data per country per period """
 
-    execution_time = dt.now() - dt_start
-    logger.info(f'Execution time: {execution_time}')
+    logger.info('Starting calculation of unique users per country per period')
+    _store_uqu_stats(UquStatsPeriodCountries, 'country', purge_existing)
+
+
+# Expression and FROM clause for each dimension of the unique users statistics
+_UQU_DIMENSIONS = {
+    None: ('NULL', 'stats_uq_users u'),
+    'vendor': ('u.vendor_id', 'stats_uq_users u'),
+    'client': ('v.client_id', 'stats_uq_users u JOIN vendors v ON v.vendor_id = u.vendor_id'),
+    'country': ('u.country', 'stats_uq_users u'),
+}
+
+# Each user is new in the first month it appears in. Monthly counts are the distinct users in the month and
+# cumulative counts are the running sum of the new users, so all months are calculated in a single pass.
+_UQU_STATS_SQL = """
+    WITH users AS (
+        SELECT DISTINCT {dimension} AS dimension, u.month, u.user_id
+        FROM {from_clause}
+        WHERE {dimension} IS NOT NULL OR %s
+    ),
+    first_seen AS (
+        SELECT dimension, user_id, MIN(month) AS month
+        FROM users
+        GROUP BY dimension, user_id
+    ),
+    monthly AS (
+        SELECT dimension, month, COUNT(*) AS uqu_month
+        FROM users
+        GROUP BY dimension, month
+    ),
+    new_users AS (
+        SELECT dimension, month, COUNT(*) AS uqu_new
+        FROM first_seen
+        GROUP BY dimension, month
+    )
+    SELECT
+        m.dimension,
+        m.month,
+        SUM(COALESCE(n.uqu_new, 0)) OVER (PARTITION BY m.dimension ORDER BY m.month) AS cumulative,
+        m.uqu_month,
+        COALESCE(n.uqu_new, 0) AS uqu_new
+    FROM monthly m
+    LEFT JOIN new_users n ON n.dimension IS NOT DISTINCT FROM m.dimension AND n.month = m.month
+    ORDER BY m.dimension, m.month
+"""
+
+
+def get_uqu_stats(dimension=None) -> list:
+    """ Returns the unique users statistics for all months with a single query.
+        :param dimension: None for company level or one of 'vendor', 'client' or 'country'
+        :returns: list of (dimension value, month, cumulative, uqu_month, uqu_new) tuples
+    """
+
+    expression, from_clause = _UQU_DIMENSIONS[dimension]
+    sql = _UQU_STATS_SQL.format(dimension=expression, from_clause=from_clause)
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [dimension is None])
+        return cursor.fetchall()
+
+
+# Grouping field of the unique users bitmaps for each dimension. Country statistics are split from the company level
+# bitmaps with the country masks.
+_UQU_BITMAP_KEYS = {
+    None: None,
+    'vendor': 'vendor_id',
+    'client': 'vendor__client_id',
+    'country': None,
+}
+
+
+def get_uqu_bitmap_stats(dimension=None) -> list:
+    """ Returns the unique users statistics for all months calculated from the unique users bitmaps.
+        Monthly users are the union of the bitmaps of the month, new users are the monthly users which are not in
+        the union of the earlier months and cumulative users are the union of all months so far.
+        :param dimension: None for company level or one of 'vendor', 'client' or 'country'
+        :returns: list of (dimension value, month, cumulative, uqu_month, uqu_new) tuples, same as get_uqu_stats
+    """
+
+    key = _UQU_BITMAP_KEYS[dimension]
+    if key is None:
+        rows = ((None, month, bitmap) for month, bitmap in UniqueUserBitmap.objects.order_by('month')
+                .values_list('month', 'bitmap').iterator())
+    else:
+        rows = UniqueUserBitmap.objects.order_by(key, 'month').values_list(key, 'month', 'bitmap').iterator()
+    masks = get_uqu_country_masks() if dimension == 'country' else {None: None}
 
+    retval = []
+    for value, value_rows in groupby(rows, key=itemgetter(0)):
+        if value is None and key is not None:
+            continue
 
-def store_uqu_countries(purge_existing=False):
-    """ Store unique users data per country per period """
+        seen = {country: Bitmap() for country in masks}
+        for month, month_rows in groupby(value_rows, key=itemgetter(1)):
+            monthly = Bitmap.union_all(Bitmap.from_bytes(row[2]) for row in month_rows)
+            for country, mask in masks.items():
+                users = monthly & mask if mask is not None else monthly
+                uqu_month = users.count()
+                if uqu_month == 0:
+                    continue
+                new_users = users - seen[country]
+                seen[country] = seen[country] | new_users
+                dimension_value = country if dimension == 'country' else value
+                retval.append((dimension_value, month, seen[country].count(), uqu_month, new_users.count()))
+    return retval
+
+
+def _store_uqu_stats(model, dimension=None, purge_existing=False, batch_size=1000) -> None:
+    """ Calculates the unique users statistics for all months and saves them with a bulk upsert.
+        :param model: statistics model to be updated
+        :param dimension: None for company level or one of 'vendor', 'client' or 'country'
+        :param purge_existing: if True all existing statistics are deleted first
+        :param batch_size: number of rows per insert statement
+    """
 
     dt_start = dt.now()
-    logger.info('Starting calculation of unique users per country per period')
 
     # Clear all existing information
     if purge_existing:
-        UquStatsPeriodCountries.objects.all().delete()
-
-    # Get countries for which computation should be made
-    countries = UniqueUser.objects.values_list('country', flat=True).distinct()
-
-    # Cycle through vendors and compute
-    for country in countries:
-        logger.debug(f'Processing country: {country}')
-
-        # Get the months for which there is already unique users data
-        uqu_data = list(UquStatsPeriodCountries.objects
-                        .filter(country=country)
-                        .order_by('-period')
-                        .values_list('period', flat=True).distinct())
-
-        # Get the months for which data needs to be added
-        months = list(UniqueUser.objects
-                      .filter(country=country)
-                      .order_by('month')
-                      .values_list('month', flat=True).distinct())
-        months_to_process = [el for el in months if el not in uqu_data]
-
-        # Cycle through months and compute unique users
-        first_month = months[0]
-        prior_month = uqu_data[0] if uqu_data else first_month
-        for month in months_to_process:
-
-            # Get cumulative unique users for the period from the start till current month
-            cumulative = len(UniqueUser.objects
-                             .filter(country=country, month__range=[first_month, month])
-                             .values_list('user_id', flat=True).distinct())
-
-            # Get the total unique users for the current month
-            period_count = len(UniqueUser.objects
-                               .filter(country=country, month=month)
-                               .values_list('user_id', flat=True).distinct())
-
-            # Calculate the number of unique users appeared for the first time in the current period
-            prior_count = 0
-            if month != first_month:
-                prior_record = UquStatsPeriodCountries.objects.get(period=prior_month, country=country)
-                prior_count = prior_record.cumulative
-            new_count = cumulative - prior_count
-
-            # Save statistics
-            UquStatsPeriodCountries.objects.create(
-                period=month,
-                country=country,
-                cumulative=cumulative,
-                uqu_month=period_count,
-                uqu_new=new_count
-            ).save()
-            prior_month = month
-            logger.debug(f'... {month} complete')
-
-        logger.info(f'Country {country} complete')
+        model.objects.all().delete()
+
+    # Compute statistics for all months, from the bitmaps if they are complete
+    stats = get_uqu_bitmap_stats(dimension) if has_uqu_bitmaps() else get_uqu_stats(dimension)
+    records = []
+    for value, month, cumulative, uqu_month, uqu_new in stats:
+        kwargs = {'period': month, 'cumulative': cumulative, 'uqu_month': uqu_month, 'uqu_new': uqu_new}
+        if dimension is not None:
+            kwargs[f'{dimension}_id' if dimension != 'country' else dimension] = value
+        records.append(model(**kwargs))
+
+    # Save statistics
+    unique_fields = ['period'] if dimension is None else ['period', dimension]
+    with transaction.atomic():
+        model.objects.bulk_create(
+            records,
+            batch_size=batch_size,
+            update_conflicts=True,
+            unique_fields=unique_fields,
+            update_fields=['cumulative', 'uqu_month', 'uqu_new']
+        )
+    logger.info(f'Saved {len(records)} records')
 
     execution_time = dt.now() - dt_start
     logger.info(f'Execution time: {execution_time}')
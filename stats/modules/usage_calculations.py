@@ -1,7 +1,8 @@
-from celery import shared_task
+from celery import shared_task, group
 from celery_tasks.models import FileProcessingTask
 from celery.utils.log import get_task_logger
 
+from django.conf import settings
 from vendors.models import VendorInputFile
 from .calculator import ServiceUsageCalculator, UnreconciledTransactionsMapper, res_result
 from ..models import Service
@@ -32,18 +33,11 @@ def recalc_vendor(self, period, vendor_id):
 
         # Process file
         calc = ServiceUsageCalculator()
-        res = calc.save_service_usage_period_vendor(input_file)
+        res = calc.save_service_usage_period_vendor(input_file, chunksize=settings.INPUT_FILES_CHUNK_SIZE)
         celery_logger.debug("Service usage calculated. Saving results.")
 
         # Update the task to add the filename
-        input_file_path = PurePath(input_file.file.path)
-        dir_name = input_file_path.parts[-2]
-        task_status.processed_documents.append({
-            'fileId': input_file.id,
-            'fileName': dir_name,
-            'resultCode': res,
-            'resultText': res_result(res)
-        })
+        task_status.processed_documents.append(get_processed_document(input_file, res))
 
         task_status.progress = 100
         task_status.status = 'COMPLETE'
@@ -72,8 +66,11 @@ def recalc_vendor(self, period, vendor_id):
 
 
 @shared_task(bind=True)
-def recalc_all_vendors(self, period):
-    """ Calculate vendor usage for all vendors for a given period """
+def recalc_all_vendors(self, period, parallel=False):
+    """ Calculate vendor usage for all vendors for a given period.
+        If parallel is True the files are dispatched as a group of recalc_vendor_file subtasks,
+        which report their results to this task.
+    """
 
     start = dt.now()
 
@@ -92,31 +89,32 @@ def recalc_all_vendors(self, period):
 
         logger.debug(f'{number_of_files} input files loaded')
 
-        prior_vendors_list = list(
+        prior_vendors = set(
             VendorInputFile.objects.filter(
                 period__lt=period,
                 is_active=True
             ).values_list('vendor_id', flat=True).distinct()
         )
 
+        # Dispatch files to subtasks; the last one to finish marks the task as complete
+        if parallel and number_of_files > 0:
+            logger.debug(f'Dispatching {number_of_files} files to subtasks')
+            group(
+                recalc_vendor_file.s(self.request.id, input_file.id, input_file.vendor_id not in prior_vendors)
+                for input_file in input_files
+            ).apply_async()
+            return
+
         # Process files
         calc = ServiceUsageCalculator()
         for i, input_file in enumerate(input_files):
 
             # Calculate usage
-            res = calc.save_service_usage_period_vendor(input_file)
+            res = calc.save_service_usage_period_vendor(input_file, chunksize=settings.INPUT_FILES_CHUNK_SIZE)
 
             # Update the task to add the filename
-            input_file_path = PurePath(input_file.file.path)
-            dir_name = input_file_path.parts[-2]
-            if input_file.vendor_id not in prior_vendors_list:
-                dir_name = f'*NEW* {dir_name}'
-            task_status.processed_documents.append({
-                'fileName': dir_name,
-                'resultCode': res,
-                'resultText': res_result(res),
-                'fileId': input_file.id
-            })
+            is_new = input_file.vendor_id not in prior_vendors
+            task_status.processed_documents.append(get_processed_document(input_file, res, is_new))
             task_status.progress = min(100 * i // number_of_files, 100)
             task_status.save()
 
@@ -137,6 +135,51 @@ def recalc_all_vendors(self, period):
         celery_logger.info(f'Execution time: {execution_time}')
 
 
+@shared_task(bind=True)
+def recalc_vendor_file(self, parent_task_id, file_id, is_new=False):
+    """ Calculate vendor usage for a single VendorInputFile and report the result to the parent task """
+
+    start = dt.now()
+    celery_logger.info(f"Starting usage calcs for VendorInputFile {file_id}.")
+
+    try:
+        input_file = VendorInputFile.objects.get(pk=file_id)
+        calc = ServiceUsageCalculator()
+        res = calc.save_service_usage_period_vendor(input_file, chunksize=settings.INPUT_FILES_CHUNK_SIZE)
+        document = get_processed_document(input_file, res, is_new)
+
+    except Exception as e:
+        celery_logger.error(f"An unexpected error occurred: {e}")
+        document = {
+            'fileName': f'VendorInputFile {file_id}',
+            'resultCode': 5,
+            'resultText': res_result(5),
+            'fileId': file_id
+        }
+
+    try:
+        FileProcessingTask.add_processed_document(parent_task_id, document)
+
+    finally:
+        execution_time = dt.now() - start
+        celery_logger.info(f'Execution time: {execution_time}')
+
+
+def get_processed_document(input_file, res, is_new=False) -> dict:
+    """ Returns the processed document record for a FileProcessingTask """
+
+    input_file_path = PurePath(input_file.file.path)
+    dir_name = input_file_path.parts[-2]
+    if is_new:
+        dir_name = f'*NEW* {dir_name}'
+    return {
+        'fileName': dir_name,
+        'resultCode': res,
+        'resultText': res_result(res),
+        'fileId': input_file.id
+    }
+
+
 def get_vendor_unreconciled(file_id: int) -> dict:
     """ Returns a dict with unreconciled transactions and suggested service for them.
         Used for population of Unreconciled transactions modal.
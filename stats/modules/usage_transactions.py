@@ -2,18 +2,20 @@ from celery import shared_task
 from celery_tasks.models import FileProcessingTask
 from celery.utils.log import get_task_logger
 
-from django.db import connection
+from django.db import connection, transaction
 from django.conf import settings
 from vendors.models import VendorInputFile
+from shared.modules.transactions import TransactionFactory
 from .calculator import BaseServicesMapper, res_result
-from ..models import UsageTransaction, TransactionStatus
+from .partitions import ensure_partition, truncate_partition
+from ..models import UsageTransaction, UsageTransactionLoad, TransactionStatus
 
 from pathlib import PurePath
+from pandas import DataFrame
 from datetime import datetime
 from dateutil.relativedelta import relativedelta
 import logging
-import csv
-import os
+import tempfile
 import time
 
 
@@ -28,8 +30,22 @@ celery_logger = get_task_logger(f'et_billing.{__name__}')
 #     celery_logger.debug(f"Name is {__name__}")
 
 
+COPY_BATCH_SIZE = 100_000
+COPY_BUFFER_MAX_SIZE = 64 * 1024 * 1024
+COPY_COLUMNS = (
+    'timestamp',
+    'vendor_id',
+    'thread_id',
+    'transaction_id',
+    'status_id',
+    'service_id',
+    'charge_user',
+    'bio_pin'
+)
+
+
 @shared_task(bind=True)
-def load_transactions(self, period, vendor_ids=None):
+def load_transactions(self, period, vendor_ids=None, incremental=False):
     # print("Task started - this should appear in the Celery worker's console")
     # test_logging()
     # logger.debug("Testing et_billing logger at the start of the task")
@@ -39,7 +55,9 @@ def load_transactions(self, period, vendor_ids=None):
 
     """ Reads Iteco raw files for a given period and list of accounts and loads stats_usage_transactions for them.
         Removes exiting transactions for the given period and accounts if such exist before saving the new ones.
-        When calculating usage it stores the data in a temp CSV file in order to improve performance on DB import.
+        If incremental is True only accounts whose active input file or service filters changed since the last load
+        are reloaded.
+        The mapped transactions are streamed to the DB with COPY in batches, see copy_transactions.
     """
 
     celery_logger.info(f'Starting loading transactions for {period}')
@@ -61,84 +79,95 @@ def load_transactions(self, period, vendor_ids=None):
         return
     vendor_files = list(vendor_files)
 
-    # Remove existing transactions for the same period and vendors
+    # Set transactions queryset for the same period and vendors
     period_start = datetime.strptime(period, '%Y-%m')
     period_end = period_start + relativedelta(months=1)
     existing_data = UsageTransaction.objects.filter(
         timestamp__gte=period_start,
         timestamp__lt=period_end
     )
+    loads = UsageTransactionLoad.objects.filter(period=period)
     if vendor_ids:
         existing_data = existing_data.filter(
             vendor_id__in=vendor_ids
         )
-    if existing_data.exists():
-        logger.debug('Deleting existing transactions')
-        existing_data.delete()
+        loads = loads.filter(vendor_id__in=vendor_ids)
+
+    # Make sure new transactions are stored in the partition of the period
+    ensure_partition(period)
+
+    mapper = BaseServicesMapper()
+    if incremental:
+        # Remove transactions of vendors without active input file and skip input files which are already loaded
+        loads = {load.vendor_id: load for load in loads}
+        removed_vendors = loads.keys() - {input_file.vendor_id for input_file in vendor_files}
+        if removed_vendors:
+            logger.debug(f'Deleting transactions of vendors {removed_vendors}')
+            with transaction.atomic():
+                existing_data.filter(vendor_id__in=removed_vendors).delete()
+                UsageTransactionLoad.objects.filter(period=period, vendor_id__in=removed_vendors).delete()
+
+    elif not vendor_ids:
+        # Remove all transactions for the period by truncating its partition
+        truncate_partition(period)
+        loads.delete()
+        loads = {}
+
+    else:
+        # Remove existing transactions for the same period and vendors
+        if existing_data.exists():
+            logger.debug('Deleting existing transactions')
+            existing_data.delete()
+        loads.delete()
+        loads = {}
 
     # Process each individual file and save new transactions
     number_of_files = len(vendor_files)
     logger.debug(f'Number of selected VendorInputFiles: {number_of_files}')
-    mapper = BaseServicesMapper()
     transaction_status_cache = list(TransactionStatus.objects.all().values_list('status_type', flat=True))
 
     for i, input_file in enumerate(vendor_files):
         vendor_id = input_file.vendor_id
-        csv_filename = os.path.join(settings.MEDIA_ROOT, f'transactions_{period}_{vendor_id}.csv')
 
         try:
-            # Map transactions
-            logger.debug(f'Mapping transactions for vendor {vendor_id}')
-            status, mapped_transactions = mapper.map_service_usage(input_file, skip_status_five=False)
-            # print(status, len(mapped_transactions))
-
-            if mapped_transactions is None:
-                continue
-
-            # Store data in temp CSV file (for faster import to DB)
-            logger.debug(f'Writing {len(mapped_transactions.transactions)} transactions to temp CSV file')
-            first_transaction = mapped_transactions.transactions[0]
-            has_thread_id = hasattr(first_transaction, 'thread_id')
-            has_bio = hasattr(first_transaction, 'bio')
-
-            with open(csv_filename, 'w', newline='') as csvfile:
-                writer = csv.writer(csvfile)
-
-                for item in mapped_transactions.transactions:
-                    if item.transaction_status not in transaction_status_cache:
-                        logger.warning(f'Transaction status {item.transaction_status} is not defined')
-                        continue
-
-                    thread_id = item.thread_id if has_thread_id else ''
-                    payer_boolean = item.payer == 'Client'
-                    bio_boolean = item.bio == 'yes' if has_bio else False
-
-                    writer.writerow([
-                        item.date_created,
-                        input_file.vendor_id,
-                        thread_id,
-                        item.transaction_id,
-                        item.transaction_status,
-                        item.service_id if item.service_id is not None else '',
-                        payer_boolean,
-                        bio_boolean
-                    ])
-
-            # Import new transactions from CSV
-            logger.debug('Importing new transactions')
-            with connection.cursor() as cursor, open(csv_filename, 'r') as csv_file:
-                cursor.copy_from(
-                    csv_file, 'stats_usage_transactions', sep=',', null='',
-                    columns=(
-                        'timestamp',
-                        'vendor_id',
-                        'thread_id',
-                        'transaction_id',
-                        'status_id',
-                        'service_id',
-                        'charge_user',
-                        'bio_pin'
-                    ))
+            content_hash = mapper.get_content_hash(input_file.file.path)
+            filters_fingerprint = mapper.get_filters_fingerprint(mapper.service_filters.get(vendor_id, None))
+            load = loads.get(vendor_id)
+            if load is not None and load.is_loaded(input_file, content_hash, filters_fingerprint):
+                logger.debug(f'Transactions for vendor {vendor_id} are already loaded')
+                status = 6
+
+            else:
+                # Map transactions and stream them to the DB one chunk at a time
+                logger.debug(f'Mapping transactions for vendor {vendor_id}')
+                has_transactions, fully_mapped = False, True
+                with transaction.atomic(), connection.cursor() as cursor:
+                    if incremental:
+                        logger.debug(f'Deleting existing transactions for vendor {vendor_id}')
+                        existing_data.filter(vendor_id=vendor_id).delete()
+
+                    for mapped_transactions in mapper.iter_service_usage(
+                            input_file, skip_status_five=False, gen_transactions=False,
+                            chunksize=settings.INPUT_FILES_CHUNK_SIZE):
+                        has_transactions = True
+                        fully_mapped = fully_mapped and mapped_transactions.fully_mapped
+
+                        rows = get_copy_rows(mapped_transactions.dataframe, vendor_id, transaction_status_cache)
+                        logger.debug(f'Importing {len(rows)} transactions')
+                        copy_transactions(cursor, rows)
+
+                    UsageTransactionLoad.objects.update_or_create(
+                        period=period, vendor_id=vendor_id,
+                        defaults={
+                            'input_file': input_file,
+                            'content_hash': content_hash,
+                            'filters_fingerprint': filters_fingerprint
+                        }
+                    )
+
+                status = mapper.get_mapping_status(input_file, has_transactions, fully_mapped)
+                if not has_transactions:
+                    continue
 
             # Update the task to add the filename
             input_file_path = PurePath(input_file.file.path)
@@ -155,12 +184,6 @@ def load_transactions(self, period, vendor_ids=None):
         except Exception as e:
             logger.error(f'An error occurred during transactions import: {e}')
 
-        finally:
-            # Remove the CSV file whether the import was successful
-            if os.path.exists(csv_filename):
-                os.remove(csv_filename)
-                logger.debug('Temporary CSV file removed')
-
     # Updated at complete
     task_status.progress = 100
     task_status.status = 'COMPLETE'
@@ -172,3 +195,52 @@ def load_transactions(self, period, vendor_ids=None):
     seconds = int(execution_minutes % 60)
 
     celery_logger.info(f'Data import process completed in {minutes} minutes and {seconds} seconds')
+
+
+def get_copy_rows(df: DataFrame, vendor_id: int, transaction_statuses: list) -> DataFrame:
+    """ Returns a DataFrame with the columns of stats_usage_transactions given a mapped vendor input DataFrame.
+        Rows with a transaction status that is not defined are skipped.
+        :param df: vendor input DataFrame with mapped service_id column
+        :param vendor_id: the vendor_id of the input file
+        :param transaction_statuses: list of the defined transaction statuses
+    """
+
+    columns = TransactionFactory.get_fields_map(df.columns)
+    status = df[columns['transaction_status']]
+    is_defined = status.isin(transaction_statuses)
+    if not is_defined.all():
+        for value in status[~is_defined].unique():
+            logger.warning(f'Transaction status {value} is not defined')
+        df = df[is_defined]
+
+    def get_column(field_name, default=''):
+        column_name = columns.get(field_name)
+        return df[column_name] if column_name is not None else default
+
+    return DataFrame({
+        'timestamp': df[columns['date_created']],
+        'vendor_id': vendor_id,
+        'thread_id': get_column('thread_id'),
+        'transaction_id': df[columns['transaction_id']],
+        'status_id': df[columns['transaction_status']],
+        'service_id': df['service_id'].astype('Int64'),
+        'charge_user': get_column('payer') == 'Client',
+        'bio_pin': get_column('bio') == 'yes',
+    }, columns=COPY_COLUMNS)
+
+
+def copy_transactions(cursor, rows: DataFrame, batch_size=COPY_BATCH_SIZE) -> None:
+    """ Imports rows into stats_usage_transactions using COPY in batches of batch_size rows.
+        Each batch is written to a buffer which is kept in memory and is rolled over to a temp file
+        only if it gets larger than COPY_BUFFER_MAX_SIZE.
+        :param cursor: DB cursor
+        :param rows: DataFrame with the columns of stats_usage_transactions, see get_copy_rows
+        :param batch_size: number of rows per COPY
+    """
+
+    sql = f"COPY stats_usage_transactions ({', '.join(COPY_COLUMNS)}) FROM STDIN WITH (FORMAT csv, NULL '')"
+    for start in range(0, len(rows), batch_size):
+        with tempfile.SpooledTemporaryFile(max_size=COPY_BUFFER_MAX_SIZE, mode='w+', newline='') as buffer:
+            rows.iloc[start:start + batch_size].to_csv(buffer, header=False, index=False)
+            buffer.seek(0)
+            cursor.copy_expert(sql, buffer)
@@ -1,3 +1,93 @@
-# from django.test import TestCase
+from django.test import SimpleTestCase
+from unittest import mock
+from .modules.bitmaps import Bitmap
+from .modules.calculator import ServiceUsageCalculator
+from .modules.hll import HyperLogLog
 
-# Create your tests here.
+import numpy as np
+
+
+class BitmapTests(SimpleTestCase):
+
+    def setUp(self):
+        # Sparse ids give array containers, dense ids give bitset containers
+        rng = np.random.default_rng(42)
+        self.sparse = set(rng.integers(0, 1 << 22, 3000).tolist())
+        self.dense = set(rng.integers(0, 3 << 16, 150000).tolist())
+        self.mixed = set(rng.integers(1 << 16, 2 << 16, 40000).tolist()) | set(range(5, 1 << 22, 997))
+
+    def assertBitmapEqual(self, bitmap, ids):
+        self.assertEqual(bitmap.count(), len(ids))
+        self.assertEqual(bitmap.to_ids().tolist(), sorted(ids))
+
+    def test_from_ids(self):
+        for ids in (set(), {0}, {0xFFFFFFFF}, self.sparse, self.dense, self.mixed):
+            self.assertBitmapEqual(Bitmap.from_ids(ids), ids)
+
+    def test_bytes_round_trip(self):
+        for ids in (set(), self.sparse, self.dense, self.mixed):
+            bitmap = Bitmap.from_bytes(Bitmap.from_ids(ids).to_bytes())
+            self.assertBitmapEqual(bitmap, ids)
+
+    def test_set_operations(self):
+        sets = (set(), self.sparse, self.dense, self.mixed)
+        for a in sets:
+            for b in sets:
+                bitmap_a, bitmap_b = Bitmap.from_ids(a), Bitmap.from_ids(b)
+                self.assertBitmapEqual(bitmap_a | bitmap_b, a | b)
+                self.assertBitmapEqual(bitmap_a & bitmap_b, a & b)
+                self.assertBitmapEqual(bitmap_a - bitmap_b, a - b)
+
+    def test_union_all(self):
+        sets = (self.sparse, self.dense, self.mixed)
+        self.assertBitmapEqual(Bitmap.union_all(Bitmap.from_ids(ids) for ids in sets), set().union(*sets))
+        self.assertBitmapEqual(Bitmap.union_all([]), set())
+
+
+class HyperLogLogTests(SimpleTestCase):
+
+    def test_empty(self):
+        self.assertEqual(HyperLogLog().count(), 0)
+
+    def test_relative_error(self):
+        # Allow four standard errors, so the test fails only on a biased estimate
+        sketch = HyperLogLog()
+        for cardinality in (1, 10, 100, 1000, 10000, 40000, 100000, 500000):
+            values = np.array([f'user-{i}' for i in range(cardinality)], dtype=object)
+            estimate = HyperLogLog.from_values(values).count()
+            self.assertLessEqual(abs(estimate / cardinality - 1), 4 * sketch.relative_error, cardinality)
+
+    def test_merge(self):
+        # A merged sketch is the same as a sketch of the union
+        values_a = np.array([f'user-{i}' for i in range(0, 60000)], dtype=object)
+        values_b = np.array([f'user-{i}' for i in range(30000, 90000)], dtype=object)
+        merged = HyperLogLog.from_values(values_a).merge(HyperLogLog.from_values(values_b))
+        union = HyperLogLog.from_values(np.concatenate([values_a, values_b]))
+        self.assertEqual(merged.count(), union.count())
+
+    def test_bytes_round_trip(self):
+        sketch = HyperLogLog.from_values([f'user-{i}' for i in range(1000)])
+        restored = HyperLogLog.from_bytes(sketch.to_bytes())
+        self.assertEqual(restored.precision, sketch.precision)
+        self.assertEqual(restored.count(), sketch.count())
+
+
+class ServiceUsageDataTests(SimpleTestCase):
+
+    def test_aggregates_replace_mapped_services(self):
+        # Filters also map transactions to the BioID and unique users services
+        service_counts = {1: 10, 36: 9, 50: 4, 32: 7}
+        data = ServiceUsageCalculator._get_usage_data(service_counts, bio_count=3, unique_users_count=5)
+        self.assertEqual(data, {1: 10, 36: 4, 50: 3, 32: 5})
+
+    def test_no_aggregates(self):
+        data = ServiceUsageCalculator._get_usage_data({1: 10, 50: 4}, bio_count=0, unique_users_count=None)
+        self.assertEqual(data, {1: 10, 50: 4})
+
+    def test_each_service_saved_once(self):
+        data = ServiceUsageCalculator._get_usage_data({1: 10, 50: 4, 32: 7}, bio_count=3, unique_users_count=5)
+        with mock.patch('stats.modules.calculator.UsageStats.objects.bulk_create') as bulk_create:
+            ServiceUsageCalculator._save_service_usage('2024-01', 1, data)
+
+        records = bulk_create.call_args.args[0]
+        self.assertEqual(sorted((el.service_id, el.unit_count) for el in records), [(1, 10), (32, 5), (50, 3)])
@@ -1,8 +1,10 @@
+from django.conf import settings
 from django.http import JsonResponse
 from django.shortcuts import render
 
 from billing_module.modules.rate_transactions import rate_transactions
-from .forms import UniqueUsersForm, VendorPeriodForm, PeriodForm
+from .forms import UniqueUsersForm, VendorPeriodForm, PeriodForm, LoadTransactionsForm
+from .modules.hll import HyperLogLog
 from .modules.uq_users import get_uqu, store_uqu_celery
 from .modules.usage_calculations import recalc_vendor, recalc_all_vendors, get_vendor_unreconciled
 from .modules.usage_transactions import load_transactions
@@ -56,7 +58,7 @@ def calc_service_usage_all_vendors(request):
         form = PeriodForm(request.POST)
         if form.is_valid():
             period = form.cleaned_data.get('period')
-            async_result = recalc_all_vendors.delay(period)
+            async_result = recalc_all_vendors.delay(period, parallel=settings.PARALLEL_USAGE_CALCULATION)
             context = {
                 'list_title': 'Calculate usage for ALL accounts',
                 'list_subtitle': 'This could take up to 2 minutes',
@@ -85,14 +87,15 @@ def load_usage_transactions_all(request):
         'form_title': 'Load usage transactions for ALL accounts',
         'form_subtitle': None,
         'form_address': '/stats/usage/load-all/',
-        'form': PeriodForm()
+        'form': LoadTransactionsForm()
     }
 
     if request.method == 'POST':
-        form = PeriodForm(request.POST)
+        form = LoadTransactionsForm(request.POST)
         if form.is_valid():
             period = form.cleaned_data.get('period')
-            async_result = load_transactions.delay(period)
+            incremental = form.cleaned_data.get('incremental', False)
+            async_result = load_transactions.delay(period, incremental=incremental)
             context = {
                 'list_title': 'Load usage transactions for ALL accounts',
                 'list_subtitle': 'This could take up to 2 minutes',
@@ -120,7 +123,7 @@ def rate_usage_transactions_all_accounts(request):
         form = PeriodForm(request.POST)
         if form.is_valid():
             period = form.cleaned_data.get('period')
-            async_result = rate_transactions.delay(period)
+            async_result = rate_transactions.delay(period, parallel=settings.PARALLEL_RATING)
             context = {
                 'list_title': 'Rate usage transactions for ALL accounts',
                 'list_subtitle': 'This could take up to 2 minutes',
@@ -152,9 +155,13 @@ def view_unique_users(request):
             period_start = None if period_scope == '3' else form.cleaned_data.get('period_start')
             period_end = form.cleaned_data.get('period_end') if period_scope == "2" else None
 
+            exact = form.cleaned_data.get('exact', False)
+
             # Generate report
-            res = get_uqu(client_id, period_start, period_end)
-            context.update({'uqu_res': f'{res:,}'})
+            res = get_uqu(client_id, period_start, period_end, exact=exact)
+            context.update({'uqu_res': f'{res.count:,}'})
+            if res.is_estimate:
+                context.update({'uqu_error': f'{HyperLogLog().relative_error:.1%}'})
 
     context.update({'form': form})
     return render(request, 'stats/unique_users.html', context)
@@ -4,3 +4,10 @@ from django.apps import AppConfig
 class VendorsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'vendors'
+
+    def ready(self):
+        from shared.models import PeriodArchive
+        from shared.modules import register_archive_members
+        from .modules.zip_archives import get_vendor_archive_files
+
+        register_archive_members(PeriodArchive.VENDOR_FILES, get_vendor_archive_files)
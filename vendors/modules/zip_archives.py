@@ -3,16 +3,35 @@ from __future__ import annotations
 from django.conf import settings
 from django.core.files import File
 from django.core.files.storage import default_storage
+from django.db import transaction
 
+from shared.models import PeriodArchive
+from shared.modules import InputFilesMixin, schedule_period_archive
+from shared.modules.input_files import get_file_hash
 from ..models import VendorInputFile, Vendor
 
+from concurrent.futures import ThreadPoolExecutor
+
 import zipfile as z
+import zlib
+import hashlib
+import json
 import os
 import logging
 
 logger = logging.getLogger(f'et_billing.{__name__}')
 CLEAN_FILE_ENCODING = False  # Set to true if running in Windows environment
 TEMP_ZIP_FILENAME = settings.BASE_DIR / 'media/temp_upload.zip'
+EXTRACT_ZIP_WORKERS = 8
+ZIP_MANIFEST_SUFFIX = '.manifest.json'
+
+
+def get_vendor_archive_files(period: str) -> list:
+    """ Returns the paths of the active vendor input files of a period.
+        Registered as the files of the PeriodArchive.VENDOR_FILES archives.
+    """
+
+    return [obj.file.path for obj in VendorInputFile.objects.filter(period=period, is_active=True).iterator()]
 
 
 def delete_inactive_input_files() -> list:
@@ -21,6 +40,7 @@ def delete_inactive_input_files() -> list:
     inactive_files = VendorInputFile.objects.filter(is_active=False)
     logger.info(f'Removing {len(inactive_files)} files')
     retval = []
+    mx = InputFilesMixin()
 
     for file_obj in inactive_files:
         # Get filepath
@@ -28,9 +48,10 @@ def delete_inactive_input_files() -> list:
         filepath = file.path
         logger.debug(f'Removing {filepath}')
 
-        # Remove file
+        # Remove file and its cached data
         file_obj.delete()
         default_storage.delete(filepath)
+        mx.delete_cached_data(filepath)
         retval.append(filepath)
 
     logger.info(f'Complete removal of {len(inactive_files)} files')
@@ -40,6 +61,8 @@ def delete_inactive_input_files() -> list:
 def handle_extract_zip(period: str) -> dict:
     """ Extract files from ZIP archive and creates VendorInputFile objects.
         If an objects already exists for this vendor then it is marked as inactive.
+        Vendors and active input files are loaded in bulk, files are extracted in a thread pool
+        and all changes are saved in one transaction.
     """
 
     logger.info(f'Start extracting files from ZIP archive for {period}')
@@ -47,73 +70,90 @@ def handle_extract_zip(period: str) -> dict:
     # Set-up
     zip_archive = TEMP_ZIP_FILENAME
     z_file = validate_zip(zip_archive)
+    if z_file is None:
+        return discard_corrupt_zip(zip_archive, 'The uploaded archive is not a valid ZIP file.')
     retval = {
         (0, 'New vendors'): [],
         (1, 'Renamed vendors'): [],
         (2, 'No change'): []
     }
-    processed_ids = []
 
-    # Process zip archive one file at a time
-    logger.debug(f'ZIP file validated; starting extraction')
+    # Collect the vendor input files in the archive
+    logger.debug('ZIP file validated; listing vendor files')
+    entries = []
     for z_obj in z_file.infolist():
         # Clean filename
         clean_name = clean_filename(z_obj.filename, clean=CLEAN_FILE_ENCODING)
 
         if not clean_name.startswith('__MACOSX/') and clean_name.endswith('.csv'):
-            logger.debug(f'Processing {clean_name}')
-
             # Get vendor_id and vendor_name
             vendor_id = get_vendor_id(clean_name)
             if vendor_id is None:
                 logger.warning(f'Cannot extract vendor_id from: {clean_name}')
                 continue
-            processed_ids.append(vendor_id)
-            vendor_name = get_vendor_name(clean_name)
-            logger.debug(f'Extracted account with name {vendor_name} and id {vendor_id}')
-
-            # Check if vendor exists and update name if changed
-            try:
-                vendor = Vendor.objects.get(vendor_id=vendor_id)
-                logger.debug(f'Existing account detected: {vendor_id}; checking for name change')
-                if vendor.iteco_name != vendor_name:
-                    retval[(1, 'Renamed vendors')].append(f'{vendor}: {vendor.iteco_name} -> {vendor_name}')
-                    vendor.iteco_name = vendor_name
-                    vendor.save()
-                    logger.debug(f'... renaming account to {vendor_name}')
-                else:
-                    logger.debug('... no change')
-                    retval[(2, 'No change')].append(vendor)
-
-            # If vendor does not exist create new vendor
-            except Vendor.DoesNotExist:
-                logger.debug(f'New account number detected with id: {vendor_id}')
-                new_vendor = Vendor.objects.create(
-                    vendor_id=vendor_id, client_id=0,
-                    description=vendor_name, iteco_name=vendor_name, is_reconciled=False)
-                new_vendor.save()
-                logger.debug(f'New account created')
-                retval[(0, 'New vendors')].append(new_vendor)
-
-            # Check for existing VendorInputFile and mark it inactive
-            try:
-                existing_file = VendorInputFile.objects.get(period=period, vendor_id=vendor_id, is_active=True)
-                logger.debug('Deactivating existing input file')
-                existing_file.is_active = False
-                existing_file.save()
-                logger.debug('... deactivated')
-            except VendorInputFile.DoesNotExist:
-                pass
-
-            # Create new VendorInputFile and save it
-            finally:
-                logger.debug('Creating new input file')
-                input_file = z_file.open(z_obj.filename)
-                vendor_file = File(input_file)
-                vendor_file.name = clean_name
-                new_file = VendorInputFile.objects.create(period=period, vendor_id=vendor_id, file=vendor_file)
-                new_file.save()
-                logger.debug('... created')
+            entries.append((z_obj, clean_name, vendor_id, get_vendor_name(clean_name)))
+    processed_ids = [el[2] for el in entries]
+
+    # Load existing vendors and active input files
+    vendors = Vendor.objects.in_bulk(set(processed_ids))
+    active_file_ids = list(VendorInputFile.objects.filter(
+        period=period, vendor_id__in=set(processed_ids), is_active=True).values_list('id', flat=True))
+
+    # Create new vendors and rename existing vendors if their name changed
+    new_vendors, renamed_vendors = [], {}
+    for _, clean_name, vendor_id, vendor_name in entries:
+        vendor = vendors.get(vendor_id)
+        if vendor is None:
+            logger.debug(f'New account number detected with id: {vendor_id}')
+            vendor = Vendor(
+                vendor_id=vendor_id, client_id=0,
+                description=vendor_name, iteco_name=vendor_name, is_reconciled=False)
+            vendors[vendor_id] = vendor
+            new_vendors.append(vendor)
+            retval[(0, 'New vendors')].append(vendor)
+        elif vendor.iteco_name != vendor_name:
+            logger.debug(f'... renaming account {vendor_id} to {vendor_name}')
+            retval[(1, 'Renamed vendors')].append(f'{vendor}: {vendor.iteco_name} -> {vendor_name}')
+            vendor.iteco_name = vendor_name
+            renamed_vendors[vendor_id] = vendor
+        else:
+            retval[(2, 'No change')].append(vendor)
+
+    # Only the last file of a vendor in the archive is active
+    last_entries = {vendor_id: i for i, (_, _, vendor_id, _) in enumerate(entries)}
+    input_files = [
+        VendorInputFile(period=period, vendor_id=vendor_id, is_active=last_entries[vendor_id] == i)
+        for i, (_, _, vendor_id, _) in enumerate(entries)]
+
+    # Write the vendor input files
+    logger.debug(f'Extracting {len(entries)} files')
+    try:
+        with ThreadPoolExecutor(max_workers=EXTRACT_ZIP_WORKERS) as executor:
+            futures = [
+                executor.submit(_extract_input_file, z_file, z_obj, clean_name, input_file)
+                for (z_obj, clean_name, _, _), input_file in zip(entries, input_files)]
+            for future in futures:
+                future.result()
+
+        # Save all changes
+        with transaction.atomic():
+            Vendor.objects.bulk_create(new_vendors)
+            Vendor.objects.bulk_update(renamed_vendors.values(), ['iteco_name'])
+            VendorInputFile.objects.filter(id__in=active_file_ids).update(is_active=False)
+            VendorInputFile.objects.bulk_create(input_files)
+        logger.debug(f'{len(new_vendors)} accounts created, {len(renamed_vendors)} renamed, '
+                     f'{len(active_file_ids)} input files deactivated')
+
+    except (z.BadZipFile, zlib.error) as e:
+        # A member with a bad CRC or compressed data fails the whole extraction
+        _delete_extracted_files(input_files)
+        z_file.close()
+        return discard_corrupt_zip(zip_archive, f'The uploaded archive is corrupt and was removed: {e}')
+
+    except Exception as e:
+        logger.error(f'Extraction of ZIP archive for {period} failed: {e}')
+        _delete_extracted_files(input_files)
+        raise
 
     # Add Vendors that were not in the archive in the return value
     unprocessed = Vendor.objects.exclude(vendor_id__in=processed_ids)
@@ -122,25 +162,57 @@ def handle_extract_zip(period: str) -> dict:
     retval[(3, 'Vendors not in archive')] = [el for el in unprocessed]
 
     logger.info(f'{len(processed_ids)} files extracted')
+    schedule_period_archive(period, PeriodArchive.VENDOR_FILES)
 
     return retval
 
 
+def _extract_input_file(z_file: z.ZipFile, z_obj: z.ZipInfo, clean_name: str, input_file: VendorInputFile) -> None:
+    """ Writes a file from the ZIP archive to the storage of a VendorInputFile without saving the object """
+
+    with z_file.open(z_obj.filename) as f:
+        input_file.file.save(clean_name, File(f), save=False)
+    logger.debug(f'... extracted {clean_name}')
+
+
+def _delete_extracted_files(input_files: list) -> None:
+    """ Removes the files written for a failed extraction """
+
+    for input_file in input_files:
+        if input_file.file:
+            default_storage.delete(input_file.file.name)
+
+
+def discard_corrupt_zip(filepath, message: str) -> dict:
+    """ Removes a corrupt uploaded ZIP archive and its manifest, so it is not extracted again.
+        Returns the result to show to the user.
+    """
+
+    logger.error(message)
+    delete_zip_manifest(filepath)
+    if os.path.exists(filepath):
+        os.remove(filepath)
+    return {(0, 'Corrupt archive'): [message]}
+
+
 def handle_uploaded_file(f) -> z.ZipFile | None:
     """ Saves uploaded file and checks if it is a valid ZIP. If valid returns ZipFile object. """
 
-    # Save file
+    # Save file and hash its content while it is written
     filepath = TEMP_ZIP_FILENAME
+    file_hash = hashlib.sha256()
     with open(filepath, 'wb+') as temp_file:
         for chunk in f.chunks():
             temp_file.write(chunk)
+            file_hash.update(chunk)
     temp_file.close()
 
     # Validate file and remove if invalid
-    z_file = validate_zip(filepath)
+    z_file = validate_zip(filepath, file_hash.hexdigest())
     if z_file:
         return z_file
     os.remove(filepath)
+    delete_zip_manifest(filepath)
 
 
 def list_archive() -> list | None:
@@ -148,8 +220,12 @@ def list_archive() -> list | None:
 
     f = validate_zip(TEMP_ZIP_FILENAME)
     if f:
+        manifest = load_zip_manifest(TEMP_ZIP_FILENAME)
+        members = manifest['members'] if manifest is not None else get_zip_members(f)
+        f.close()
+
         retval = []
-        for name in f.namelist():
+        for name, _, _ in members:
             clean_name = clean_filename(name, clean=CLEAN_FILE_ENCODING)
             if not clean_name.startswith('__MACOSX/') and clean_name.endswith('.csv'):
                 retval.append(clean_name)
@@ -187,10 +263,80 @@ def safe_open_wb(path):
     return open(path, 'wb')
 
 
-def validate_zip(filepath) -> z.ZipFile | None:
-    """ Tests that the file is a ZipFile, and it is valid """
+def validate_zip(filepath, file_hash=None) -> z.ZipFile | None:
+    """ Tests that the file is a ZipFile, and it is valid.
+        If file_hash is provided the archive was just uploaded: only its structure is checked and a manifest is saved.
+        The CRC of each member is checked when it is extracted.
+        Archives whose hash and members match their manifest are not checked again.
+        Archives without manifest are fully tested once.
+        :param filepath: path of the ZIP archive
+        :param file_hash: sha256 hash of the uploaded archive
+    """
 
-    if z.is_zipfile(filepath):
+    if not z.is_zipfile(filepath):
+        return None
+
+    try:
         z_file = z.ZipFile(filepath)
-        if z_file.testzip() is None:
+    except z.BadZipFile as e:
+        logger.warning(f'Invalid ZIP file {filepath}: {e}')
+        return None
+
+    if file_hash is None:
+        manifest = load_zip_manifest(filepath)
+        if manifest is not None and manifest['members'] == get_zip_members(z_file):
             return z_file
+
+        # Full CRC check of an archive without manifest
+        if z_file.testzip() is not None:
+            return None
+        file_hash = get_file_hash(filepath)
+
+    save_zip_manifest(filepath, file_hash, z_file)
+    return z_file
+
+
+def get_zip_manifest_path(filepath) -> str:
+    """ Returns the path of the manifest of a ZIP archive """
+
+    return f'{filepath}{ZIP_MANIFEST_SUFFIX}'
+
+
+def load_zip_manifest(filepath) -> dict | None:
+    """ Returns the manifest of a ZIP archive or None if there is no manifest or the hash of the archive changed """
+
+    try:
+        with open(get_zip_manifest_path(filepath), 'r') as f:
+            manifest = json.load(f)
+        file_hash = get_file_hash(filepath)
+    except (OSError, ValueError):
+        return None
+
+    if manifest.get('sha256') != file_hash:
+        return None
+    return manifest
+
+
+def save_zip_manifest(filepath, file_hash: str, z_file: z.ZipFile) -> None:
+    """ Saves the hash and the names, sizes and CRCs of the members of a ZIP archive next to it """
+
+    manifest = {
+        'sha256': file_hash,
+        'members': get_zip_members(z_file),
+    }
+    with open(get_zip_manifest_path(filepath), 'w') as f:
+        json.dump(manifest, f)
+
+
+def delete_zip_manifest(filepath) -> None:
+    """ Removes the manifest of a ZIP archive """
+
+    manifest_path = get_zip_manifest_path(filepath)
+    if os.path.exists(manifest_path):
+        os.remove(manifest_path)
+
+
+def get_zip_members(z_file: z.ZipFile) -> list:
+    """ Returns the name, size and CRC of the members of a ZIP archive as listed in its central directory """
+
+    return [[el.filename, el.file_size, el.CRC] for el in z_file.infolist()]
@@ -3,7 +3,8 @@ from django.shortcuts import render, redirect
 from django.urls import reverse
 
 from shared.views import download_excel_file
-from shared.modules import create_zip_file
+from shared.models import PeriodArchive
+from shared.modules import get_period_archive_response, schedule_period_archive
 from .forms import FileUploadForm, PeriodForm, VendorFileUploadForm
 from .models import VendorInputFile
 from .modules.zip_archives import list_archive, handle_extract_zip, handle_uploaded_file, delete_inactive_input_files
@@ -42,8 +43,8 @@ def download_vendor_file(request, pk: int):
 def download_vendor_files_all(request, period: str):
     """ Triggers the download of a ZIP archive with all vendor input files for a given period """
 
-    queryset = VendorInputFile.objects.filter(period=period, is_active=True)
-    return create_zip_file(queryset, f'{period}_vendor_files')
+    # Serve the pre-built archive if it is up-to-date, otherwise stream the archive and rebuild it
+    return get_period_archive_response(period, PeriodArchive.VENDOR_FILES, f'{period}_vendor_files')
 
 
 def extract_zip_view(request):
@@ -165,6 +166,7 @@ def upload_single_file(request):
                 new_file = VendorInputFile.objects.create(period=period, vendor=vendor, file=file)
                 new_file.save()
                 logger.debug('... created')
+                schedule_period_archive(period, PeriodArchive.VENDOR_FILES)
 
                 return redirect('reports_index')
     return render(request, 'shared/base_form.html', context)